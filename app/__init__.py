@@ -68,12 +68,16 @@ def create_app(config_name='development'):
     from app.api.videos import videos_bp
     from app.api.clips import clips_bp
     from app.api.analytics import analytics_bp
+    from app.api.webhooks import webhooks_bp
+    from app.api.uploads import uploads_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(videos_bp, url_prefix='/api/videos')
     app.register_blueprint(clips_bp, url_prefix='/api/clips')
     app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
-
+    app.register_blueprint(webhooks_bp, url_prefix='/api/webhooks')
+    app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
+    
     # Register preferences routes (without /api prefix)
     from app.api.preferences import preferences_bp
     app.register_blueprint(preferences_bp)
@@ -6,6 +6,8 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app.services.analytics_service import AnalyticsService
+from app.services.eta_service import EtaService
+from app.services.cache_service import InputCache
 from app.utils.decorators import admin_required
 
 analytics_bp = Blueprint('analytics', __name__)
@@ -87,4 +89,20 @@ def get_global_analytics():
     """Get platform-wide analytics (admin only)"""
     stats = AnalyticsService.get_global_stats()
     
-    return jsonify(stats), 200
\ No newline at end of file
+    return jsonify(stats), 200
+
+
+@analytics_bp.route('/capacity', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_capacity():
+    """Estimated time to drain the processing backlog (admin only)"""
+    return jsonify(EtaService.capacity()), 200
+
+
+@analytics_bp.route('/input-cache', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_input_cache_stats():
+    """Hit rate and traffic of the workers' input caches (admin only)"""
+    return jsonify(InputCache.stats()), 200
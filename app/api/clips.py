@@ -2,7 +2,7 @@
 """
 Clips API Endpoints
 """
-from flask import Blueprint, jsonify, send_file
+from flask import Blueprint, jsonify, request, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from pathlib import Path
 import zipfile
@@ -10,6 +10,8 @@ import io
 
 from app import db
 from app.models import Clip, Video
+from app.utils.file_handler import send_local_file
+from app.services.hls_service import HLSService, HLS_MIMETYPES
 
 clips_bp = Blueprint('clips', __name__)
 
@@ -48,24 +50,58 @@ def download_clip(clip_id):
     if clip.video.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    # Track download
-    clip.increment_downloads()
+    # Track download (range requests resuming/seeking an earlier download don't count)
+    if not request.range or request.range.ranges[0][0] == 0:
+        clip.increment_downloads()
     
     if clip.s3_key:
         # Return S3 presigned URL
         url = clip.get_download_url()
         return jsonify({"download_url": url}), 200
     elif clip.file_path and Path(clip.file_path).exists():
-        # Serve local file
-        return send_file(
+        # Serve local file (byte ranges, ETag / Last-Modified or nginx offload)
+        return send_local_file(
             clip.file_path,
-            as_attachment=True,
             download_name=clip.filename
         )
     else:
         return jsonify({"error": "File not found"}), 404
 
 
+@clips_bp.route('/<int:clip_id>/preview/<path:filename>', methods=['GET'])
+@jwt_required()
+def get_clip_preview(clip_id, filename):
+    """Serve HLS playlist and segments for in-browser preview"""
+    user_id = get_jwt_identity()
+    clip = Clip.query.get(clip_id)
+    
+    if not clip:
+        return jsonify({"error": "Clip not found"}), 404
+    
+    if clip.video.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    hls_metadata = (clip.clip_metadata or {}).get('hls')
+    if not hls_metadata:
+        return jsonify({"error": "Preview not available"}), 404
+    
+    file_path = HLSService.resolve_file(hls_metadata, filename)
+    if not file_path:
+        return jsonify({"error": "File not found"}), 404
+    
+    # Segments never change once packaged; the playlist is re-validated.
+    # Only the browser may cache them: they need the owner's token
+    max_age = 60 if file_path.suffix == '.m3u8' else 86400
+    
+    return send_local_file(
+        file_path,
+        as_attachment=False,
+        mimetype=HLS_MIMETYPES.get(file_path.suffix, 'application/octet-stream'),
+        max_age=max_age,
+        private=True
+    )
+
+
 @clips_bp.route('/<int:clip_id>/caption', methods=['GET'])
 @jwt_required()
 def get_clip_caption(clip_id):
@@ -124,6 +160,7 @@ def delete_clip(clip_id):
     from app.utils.file_handler import delete_file
     if clip.file_path or clip.s3_key:
         delete_file(clip.file_path, clip.s3_key)
+    HLSService.remove_package((clip.clip_metadata or {}).get('hls'))
     
     # Delete from database
     db.session.delete(clip)
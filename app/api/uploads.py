@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Upload Sessions API Endpoints
+Large videos go from the client straight to S3 (multipart, presigned part
+URLs), or with local storage through a resumable tus-style upload
+(create / HEAD offset / PATCH chunks); the completion call checks the
+file and creates the Video, which is then ingested asynchronously.
+"""
+from flask import Blueprint, request, jsonify, current_app, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app import limiter
+from app.models import User, UploadSession
+from app.utils.decorators import check_usage_limit
+from app.services.upload_service import UploadService, UploadError, UploadOffsetMismatch, UploadLocked
+
+uploads_bp = Blueprint('uploads', __name__)
+
+TUS_VERSION = '1.0.0'
+
+
+def _chunk_rate_limit():
+    """
+    Limit of the per-chunk calls (HEAD/PATCH): a resumable upload makes
+    one per chunk, far more than the app-wide default limits allow
+    """
+    return current_app.config.get('UPLOAD_CHUNK_RATE_LIMIT', '5000 per hour')
+
+
+def _get_session(session_id, user_id):
+    """(session, error response)"""
+    session = UploadSession.query.get(session_id)
+    
+    if not session:
+        return None, (jsonify({"error": "Upload session not found"}), 404)
+    
+    if session.user_id != user_id:
+        return None, (jsonify({"error": "Unauthorized"}), 403)
+    
+    return session, None
+
+
+@uploads_bp.route('/', methods=['POST'])
+@jwt_required()
+@limiter.limit("10 per hour")
+@check_usage_limit('video')
+def create_upload():
+    """
+    Start a direct upload
+    Body: {"filename": "talk.mp4", "size": <bytes>, "content_type": "video/mp4"}
+    Returns the session and one presigned URL per part: PUT each part's bytes
+    (part_size each, the last one shorter) and keep the ETag response header.
+    """
+    if not current_app.config.get('USE_S3'):
+        return jsonify({"error": "Direct uploads need S3 storage"}), 400
+    
+    user = User.query.get(get_jwt_identity())
+    data = request.get_json() or {}
+    
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be a number of bytes"}), 400
+    
+    try:
+        session = UploadService.create_session(user, data.get('filename') or '', size, data.get('content_type'))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "upload": session.to_dict(),
+        "part_urls": UploadService.part_urls(session)
+    }), 201
+
+
+@uploads_bp.route('/resumable', methods=['POST'])
+@jwt_required()
+@limiter.limit("10 per hour")
+@check_usage_limit('video')
+def create_resumable_upload():
+    """
+    Start a resumable upload to local storage
+    Body: {"filename": "talk.mp4", "size": <bytes>} (or an Upload-Length header)
+    Then PATCH chunks to the Location URL and POST .../complete.
+    """
+    if current_app.config.get('USE_S3'):
+        return jsonify({"error": "Use direct uploads (POST /api/uploads/) with S3 storage"}), 400
+    
+    user = User.query.get(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        size = int(data.get('size') or request.headers.get('Upload-Length') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be a number of bytes"}), 400
+    
+    try:
+        session = UploadService.create_resumable(user, data.get('filename') or '', size)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = jsonify({"upload": session.to_dict()})
+    response.status_code = 201
+    response.headers['Location'] = url_for('uploads.upload_offset', session_id=session.id)
+    response.headers['Upload-Offset'] = '0'
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    return response
+
+
+@uploads_bp.route('/<int:session_id>', methods=['HEAD'])
+@jwt_required()
+@limiter.limit(_chunk_rate_limit)
+def upload_offset(session_id):
+    """Bytes received so far (Upload-Offset) of a resumable upload"""
+    session, error = _get_session(session_id, get_jwt_identity())
+    if error:
+        return error
+    
+    response = current_app.response_class(status=200)
+    response.headers['Upload-Offset'] = str(session.offset)
+    response.headers['Upload-Length'] = str(session.size)
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@uploads_bp.route('/<int:session_id>', methods=['PATCH'])
+@jwt_required()
+@limiter.limit(_chunk_rate_limit)
+def append_chunk(session_id):
+    """
+    Append a chunk to a resumable upload
+    Headers: Upload-Offset (must equal the current offset),
+    Content-Type: application/offset+octet-stream; body: the chunk bytes
+    """
+    session, error = _get_session(session_id, get_jwt_identity())
+    if error:
+        return error
+    
+    if session.kind != 'resumable' or session.status != 'pending' or session.is_expired:
+        return jsonify({"error": f"Upload session is {session.status}"}), 400
+    
+    if request.mimetype != 'application/offset+octet-stream':
+        return jsonify({"error": "Content-Type must be application/offset+octet-stream"}), 415
+    
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "Upload-Offset header required"}), 400
+    
+    try:
+        offset = UploadService.append(session, offset, request.stream)
+    except UploadOffsetMismatch as e:
+        response = jsonify({"error": str(e), "offset": e.offset})
+        response.status_code = 409
+        response.headers['Upload-Offset'] = str(e.offset)
+        return response
+    except UploadLocked as e:
+        return jsonify({"error": str(e)}), 423
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = current_app.response_class(status=204)
+    response.headers['Upload-Offset'] = str(offset)
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    return response
+
+
+@uploads_bp.route('/<int:session_id>/parts', methods=['POST'])
+@jwt_required()
+def sign_parts(session_id):
+    """
+    Presigned URLs again for some parts (e.g. after the first ones expired)
+    Body: {"part_numbers": [3, 4]}
+    """
+    session, error = _get_session(session_id, get_jwt_identity())
+    if error:
+        return error
+    
+    if session.kind != 's3_multipart' or session.status != 'pending' or session.is_expired:
+        return jsonify({"error": f"Upload session is {session.status}"}), 400
+    
+    part_numbers = (request.get_json() or {}).get('part_numbers') or []
+    if not all(isinstance(number, int) for number in part_numbers):
+        return jsonify({"error": "part_numbers must be integers"}), 400
+    
+    return jsonify({"part_urls": UploadService.part_urls(session, part_numbers)}), 200
+
+
+@uploads_bp.route('/<int:session_id>/complete', methods=['POST'])
+@jwt_required()
+@check_usage_limit('video')
+def complete_upload(session_id):
+    """
+    Finish an upload and create its Video (202: probed and hashed by the
+    ingest task; poll /api/videos/<id>/status until it is 'uploaded')
+    Body (direct uploads): {"parts": [{"part_number": 1, "etag": "..."}, ...]}
+    Resumable uploads need no body once every byte has been received.
+    """
+    user = User.query.get(get_jwt_identity())
+    session, error = _get_session(session_id, user.id)
+    if error:
+        return error
+    
+    if session.status != 'pending':
+        return jsonify({"error": f"Upload session is {session.status}"}), 400
+    
+    if session.is_expired:
+        UploadService.abort(session, error_message='Upload session expired')
+        return jsonify({"error": "Upload session expired"}), 400
+    
+    try:
+        if session.kind == 'resumable':
+            video = UploadService.complete_resumable(session, user)
+        else:
+            video = UploadService.complete(session, user, (request.get_json(silent=True) or {}).get('parts'))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "message": "Video received, ingesting",
+        "content_hash": session.content_hash,
+        "video": video.to_dict()
+    }), 202
+
+
+@uploads_bp.route('/<int:session_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(session_id):
+    """Abort an upload (S3 discards the parts; received local bytes are deleted)"""
+    session, error = _get_session(session_id, get_jwt_identity())
+    if error:
+        return error
+    
+    if session.status != 'pending':
+        return jsonify({"error": f"Upload session is {session.status}"}), 400
+    
+    UploadService.abort(session)
+    
+    return jsonify({"message": "Upload aborted"}), 200
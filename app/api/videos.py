@@ -2,18 +2,23 @@
 """
 Videos API Endpoints
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from moviepy.editor import VideoFileClip
 from pathlib import Path
+from datetime import datetime
 
-from app import db, limiter
-from app.models import Video, User
-from app.utils.validators import validate_video_file, validate_video_properties, validate_clip_parameters
-from app.utils.file_handler import save_uploaded_file
+from app import db, limiter, celery
+from app.models import Video, User, Clip
+from app.utils.validators import validate_video_file, validate_clip_parameters
+from app.utils.file_handler import save_uploaded_file, send_local_file, delete_file
 from app.utils.decorators import check_usage_limit
-from app.tasks.video_tasks import process_video_task
+from app.services.dispatch_service import FairDispatcher
+from app.services.progress_service import ProgressService
+from app.services.cancellation_service import CancellationService
+from app.services.eta_service import EtaService
+from app.services.upload_service import UploadService
+from app.services.dedup_service import DedupService
 
 videos_bp = Blueprint('videos', __name__)
 
@@ -57,55 +62,17 @@ def upload_video():
         file_path, s3_key = save_uploaded_file(file, user_id, folder='videos')
         print(f"💾 Arquivo salvo: {file_path or s3_key}")
         
-        # Get video metadata
-        from moviepy.editor import VideoFileClip
+        # Probing, plan limits and hashing run in the ingest task; poll
+        # /status until the video is 'uploaded' (or 'rejected')
+        video = UploadService.create_video(user, file_info, file_path=file_path, s3_key=s3_key)
         
-        with VideoFileClip(file_path) as clip:
-            video_metadata = {
-                'duration': clip.duration,
-                'width': clip.w,
-                'height': clip.h,
-                'fps': clip.fps,
-                'codec': 'h264'
-            }
-        
-        print(f"📊 Metadata: {video_metadata}")
-        
-        # Validate against plan limits
-        plan_limits = current_app.config['PLANS'][user.plan]
-        max_duration = plan_limits.get('max_video_duration', -1)
-        
-        if max_duration != -1 and video_metadata['duration'] > max_duration:
-            return jsonify({
-                "error": f"Video too long ({video_metadata['duration']:.0f}s). Max: {max_duration}s for {user.plan} plan"
-            }), 400
-        
-        # Create video record
-        video = Video(
-            user_id=user_id,
-            filename=file_info['secure_filename'],
-            original_filename=file_info['original_filename'],
-            file_size_mb=file_info['file_size_mb'],
-            file_path=file_path,
-            s3_key=s3_key,
-            duration=video_metadata['duration'],
-            width=video_metadata['width'],
-            height=video_metadata['height'],
-            fps=video_metadata['fps'],
-            codec=video_metadata['codec'],
-            status='uploaded'
-        )
-        
-        db.session.add(video)
-        db.session.commit()
-        
-        print(f"✅ Vídeo #{video.id} criado com sucesso!")
+        print(f"✅ Vídeo #{video.id} criado, aguardando ingestão")
         
         return jsonify({
-            "message": "Video uploaded successfully",
+            "message": "Video received, ingesting",
             "video": video.to_dict()
-        }), 201
-        
+        }), 202
+    
     except Exception as e:
         print(f"❌ ERRO NO UPLOAD: {str(e)}")
         import traceback
@@ -127,7 +94,7 @@ def process_video(video_id):
     if video.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    if video.status not in ['uploaded', 'failed']:
+    if video.status not in ['uploaded', 'failed', 'cancelled']:
         return jsonify({"error": f"Video already {video.status}"}), 400
     
     # Get processing settings
@@ -148,16 +115,19 @@ def process_video(video_id):
     video.status = 'queued'
     db.session.commit()
     
-    # Queue processing task
-    task = process_video_task.delay(video.id, default_settings)
+    # A previous cancel request must not stop the new run
+    CancellationService.clear(video.id)
     
-    video.task_id = task.id
-    db.session.commit()
+    video.publish_status()
+    
+    # Hand to the fair dispatcher (starts right away if the user has a free slot)
+    FairDispatcher.submit(video, default_settings)
     
     return jsonify({
-        "message": "Processing started",
+        "message": "Processing queued",
         "video_id": video.id,
-        "task_id": task.id
+        "task_id": video.task_id,
+        "queue": FairDispatcher.queue_info(video.id)
     }), 202
 
 
@@ -166,6 +136,22 @@ def process_video(video_id):
 def get_video_status(video_id):
     """Get processing status of a video"""
     user_id = get_jwt_identity()
+    
+    # Jobs in flight are answered from the progress cache (one Redis read)
+    state = ProgressService.get(video_id)
+    if state and state['status'] in ('ingesting', 'processing', 'cancelling', 'failed', 'rejected'):
+        if state['user_id'] != user_id:
+            return jsonify({"error": "Unauthorized"}), 403
+        
+        return jsonify({
+            "video_id": video_id,
+            "status": state['status'],
+            "error_message": state.get('error_message'),
+            "progress": state['progress'],
+            "stage": state['stage'],
+            "eta": state.get('eta') if state['status'] == 'processing' else None
+        }), 200
+    
     video = Video.query.get(video_id)
     
     if not video:
@@ -180,24 +166,225 @@ def get_video_status(video_id):
         "error_message": video.error_message
     }
     
-    # If processing, get task status
-    if video.task_id and video.status == 'processing':
-        from celery.result import AsyncResult
-        task = AsyncResult(video.task_id)
-        
-        response['task_status'] = task.state
-        
-        if task.state == 'PROGRESS':
-            response['progress'] = task.info.get('progress', 0)
-            response['stage'] = task.info.get('stage', 'Processing')
+    # If waiting for a slot, report queue position, estimated start and completion
+    if video.status == 'queued':
+        queue = FairDispatcher.queue_info(video.id)
+        response['queue'] = queue
+        start = datetime.fromisoformat(queue['estimated_start']) if queue else None
+        response['eta'] = EtaService.predict(video, start=start)
     
-    # If completed, include clips
+    if state and state['status'] == video.status:
+        response['progress'] = state['progress']
+        response['stage'] = state['stage']
+        if video.status == 'processing':
+            response['eta'] = state.get('eta')
+    
+    # If completed, include clips (?urls=false: download endpoints instead of presigned URLs)
     if video.status == 'completed':
-        response['clips'] = [clip.to_dict() for clip in video.clips.all()]
+        include_urls = request.args.get('urls', 'true').lower() != 'false'
+        response['clips'] = Clip.serialize_many(video.clips.all(), include_urls=include_urls)
     
     return jsonify(response), 200
 
 
+@videos_bp.route('/<int:video_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_video(video_id):
+    """
+    Cancel a queued or running job
+    Pending jobs are cancelled right away; running ones stop at their next
+    stage, transcription window or render (202 until then)
+    """
+    user_id = get_jwt_identity()
+    video = Video.query.get(video_id)
+    
+    if not video:
+        return jsonify({"error": "Video not found"}), 404
+    
+    if video.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    if video.status not in ['queued', 'processing']:
+        return jsonify({"error": f"Video is {video.status}, nothing to cancel"}), 400
+    
+    # Set the flag first so a job released in the meantime still sees it
+    CancellationService.request(video.id)
+    
+    if video.status == 'queued' and FairDispatcher.withdraw(video.id):
+        video.mark_as_cancelled()
+        return jsonify({"message": "Processing cancelled", "video_id": video.id, "status": video.status}), 200
+    
+    # Drop the root task if no worker picked it up yet
+    if video.task_id:
+        celery.control.revoke(video.task_id)
+    
+    video.mark_as_cancelling()
+    
+    return jsonify({"message": "Cancellation requested", "video_id": video.id, "status": video.status}), 202
+
+
+@videos_bp.route('/<int:video_id>/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_video_events(video_id):
+    """
+    Stream progress as Server-Sent Events
+    EventSource can't send headers, so the token may go in ?jwt=
+    """
+    user_id = get_jwt_identity()
+    video = Video.query.get(video_id)
+    
+    if not video:
+        return jsonify({"error": "Video not found"}), 404
+    
+    if video.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    # Don't hold a DB connection for the life of the stream
+    db.session.close()
+    
+    return Response(
+        stream_with_context(ProgressService.stream(video_id)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+def _parse_video_ids(data, max_count):
+    """Read a unique list of integer ids from data['video_ids']"""
+    video_ids = data.get('video_ids')
+    
+    if not isinstance(video_ids, list) or not video_ids:
+        return None, "video_ids must be a non-empty list"
+    
+    try:
+        video_ids = list(dict.fromkeys(int(video_id) for video_id in video_ids))
+    except (ValueError, TypeError):
+        return None, "video_ids must be integers"
+    
+    if len(video_ids) > max_count:
+        return None, f"At most {max_count} videos per request"
+    
+    return video_ids, None
+
+
+@videos_bp.route('/batch/process', methods=['POST'])
+@jwt_required()
+@limiter.limit("5 per minute")
+def batch_process_videos():
+    """Start processing many videos with shared settings"""
+    from flask import current_app
+    
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    
+    video_ids, error = _parse_video_ids(data, current_app.config['BATCH_PROCESS_MAX_VIDEOS'])
+    if error:
+        return jsonify({"error": error}), 400
+    
+    settings = data.get('settings') or {}
+    user = User.query.get(user_id)
+    
+    # Monthly quota left for this batch
+    monthly_limit = current_app.config['PLANS'][user.plan]['videos_per_month']
+    remaining = None if monthly_limit == -1 else max(0, monthly_limit - user.videos_processed_this_month)
+    
+    # One query for every requested video
+    videos = {
+        video.id: video
+        for video in Video.query.filter(Video.id.in_(video_ids), Video.user_id == user_id).all()
+    }
+    
+    default_settings = user.preferences.copy()
+    default_settings.update(settings)
+    
+    accepted, rejected = [], []
+    for video_id in video_ids:
+        video = videos.get(video_id)
+        
+        if not video:
+            rejected.append({"video_id": video_id, "error": "Video not found"})
+            continue
+        
+        if video.status not in ['uploaded', 'failed', 'cancelled']:
+            rejected.append({"video_id": video_id, "error": f"Video already {video.status}"})
+            continue
+        
+        is_valid, error = validate_clip_parameters(settings, video.duration)
+        if not is_valid:
+            rejected.append({"video_id": video_id, "error": error})
+            continue
+        
+        if remaining is not None and len(accepted) >= remaining:
+            rejected.append({"video_id": video_id, "error": f"Monthly limit reached ({monthly_limit} videos)"})
+            continue
+        
+        video.settings = default_settings
+        video.status = 'queued'
+        CancellationService.clear(video.id)
+        accepted.append(video)
+    
+    db.session.commit()
+    
+    if accepted:
+        for video in accepted:
+            video.publish_status()
+        FairDispatcher.submit_many(accepted, default_settings)
+    
+    return jsonify({
+        "message": f"{len(accepted)} videos queued",
+        "accepted": [{"video_id": video.id, "status": video.status} for video in accepted],
+        "rejected": rejected
+    }), 202 if accepted else 400
+
+
+@videos_bp.route('/batch/status', methods=['POST'])
+@jwt_required()
+def batch_video_status():
+    """Status of many videos: one DB query plus one pipelined Redis read"""
+    from flask import current_app
+    
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    
+    video_ids, error = _parse_video_ids(data, current_app.config['BATCH_STATUS_MAX_VIDEOS'])
+    if error:
+        return jsonify({"error": error}), 400
+    
+    rows = Video.query.with_entities(
+        Video.id, Video.status, Video.error_message
+    ).filter(
+        Video.id.in_(video_ids),
+        Video.user_id == user_id
+    ).all()
+    
+    states = ProgressService.get_many([row.id for row in rows])
+    
+    videos = []
+    for row in rows:
+        entry = {
+            "video_id": row.id,
+            "status": row.status,
+            "error_message": row.error_message
+        }
+        
+        state = states.get(row.id)
+        if state and state['status'] == row.status:
+            entry['progress'] = state['progress']
+            entry['stage'] = state['stage']
+        
+        videos.append(entry)
+    
+    found = {row.id for row in rows}
+    
+    return jsonify({
+        "videos": videos,
+        "not_found": [video_id for video_id in video_ids if video_id not in found]
+    }), 200
+
+
 @videos_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_user_videos():
@@ -244,8 +431,11 @@ def get_video(video_id):
     if video.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
+    # ?urls=false: clips carry their download endpoint instead of a presigned URL
+    include_urls = request.args.get('urls', 'true').lower() != 'false'
+    
     return jsonify({
-        "video": video.to_dict(include_clips=True)
+        "video": video.to_dict(include_clips=True, include_urls=include_urls)
     }), 200
 
 
@@ -262,16 +452,16 @@ def delete_video(video_id):
     if video.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    # Delete files
-    from app.utils.file_handler import delete_file
-    
-    if video.file_path or video.s3_key:
-        delete_file(video.file_path, video.s3_key)
+    # Delete the upload (shared with identical uploads until the last one goes)
+    DedupService.release(video)
     
     # Delete clip files
+    from app.services.hls_service import HLSService
+    
     for clip in video.clips:
         if clip.file_path or clip.s3_key:
             delete_file(clip.file_path, clip.s3_key)
+        HLSService.remove_package((clip.clip_metadata or {}).get('hls'))
     
     # Delete from database (cascade will handle clips)
     db.session.delete(video)
@@ -300,10 +490,9 @@ def download_video(video_id):
         url = video.get_download_url()
         return jsonify({"download_url": url}), 200
     elif video.file_path and Path(video.file_path).exists():
-        # Serve local file
-        return send_file(
+        # Serve local file (byte ranges, ETag / Last-Modified or nginx offload)
+        return send_local_file(
             video.file_path,
-            as_attachment=True,
             download_name=video.original_filename
         )
     else:
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Webhooks API Endpoints
+"""
+import secrets
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from app import db
+from app.models import WebhookEndpoint, WebhookDelivery
+from app.services.webhook_service import WebhookService, UnsafeWebhookURL, WEBHOOK_EVENTS
+from app.utils.decorators import feature_required
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+
+@webhooks_bp.route('/', methods=['GET'])
+@jwt_required()
+@feature_required('api_access')
+def get_webhooks():
+    """List webhook endpoints of current user"""
+    user_id = get_jwt_identity()
+    endpoints = WebhookEndpoint.query.filter_by(user_id=user_id).all()
+    
+    return jsonify({
+        "webhooks": [endpoint.to_dict() for endpoint in endpoints]
+    }), 200
+
+
+@webhooks_bp.route('/', methods=['POST'])
+@jwt_required()
+@feature_required('api_access')
+def create_webhook():
+    """Register a webhook endpoint (the signing secret is only returned here)"""
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    
+    url = (data.get('url') or '').strip()
+    try:
+        WebhookService.check_url(url)
+    except UnsafeWebhookURL as e:
+        return jsonify({"error": str(e)}), 400
+    except OSError:
+        return jsonify({"error": "url host can't be resolved"}), 400
+    
+    events = data.get('events') or list(WEBHOOK_EVENTS)
+    invalid = [event for event in events if event not in WEBHOOK_EVENTS]
+    if invalid:
+        return jsonify({"error": f"Invalid events: {', '.join(invalid)}. Allowed: {', '.join(WEBHOOK_EVENTS)}"}), 400
+    
+    endpoint = WebhookEndpoint(
+        user_id=user_id,
+        url=url,
+        secret=secrets.token_hex(32),
+        events=events
+    )
+    
+    db.session.add(endpoint)
+    db.session.commit()
+    
+    return jsonify({
+        "message": "Webhook created",
+        "webhook": endpoint.to_dict(include_secret=True)
+    }), 201
+
+
+@webhooks_bp.route('/<int:webhook_id>', methods=['DELETE'])
+@jwt_required()
+@feature_required('api_access')
+def delete_webhook(webhook_id):
+    """Delete a webhook endpoint and its pending deliveries"""
+    user_id = get_jwt_identity()
+    endpoint = WebhookEndpoint.query.get(webhook_id)
+    
+    if not endpoint:
+        return jsonify({"error": "Webhook not found"}), 404
+    
+    if endpoint.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    db.session.delete(endpoint)
+    db.session.commit()
+    
+    return jsonify({
+        "message": "Webhook deleted successfully"
+    }), 200
+
+
+@webhooks_bp.route('/<int:webhook_id>/deliveries', methods=['GET'])
+@jwt_required()
+@feature_required('api_access')
+def get_webhook_deliveries(webhook_id):
+    """Recent deliveries of a webhook endpoint"""
+    user_id = get_jwt_identity()
+    endpoint = WebhookEndpoint.query.get(webhook_id)
+    
+    if not endpoint:
+        return jsonify({"error": "Webhook not found"}), 404
+    
+    if endpoint.user_id != user_id:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    deliveries = endpoint.deliveries.order_by(WebhookDelivery.created_at.desc()).limit(50).all()
+    
+    return jsonify({
+        "deliveries": [delivery.to_dict() for delivery in deliveries]
+    }), 200
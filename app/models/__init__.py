@@ -5,5 +5,10 @@ Models Package
 from app.models.user import User
 from app.models.video import Video
 from app.models.clip import Clip
+from app.models.checkpoint import StageCheckpoint
+from app.models.stage_timing import StageTimingSample
+from app.models.webhook import WebhookEndpoint, WebhookDelivery
+from app.models.upload_session import UploadSession
+from app.models.stored_blob import StoredBlob
 
-__all__ = ['User', 'Video', 'Clip']
\ No newline at end of file
+__all__ = ['User', 'Video', 'Clip', 'StageCheckpoint', 'StageTimingSample', 'WebhookEndpoint', 'WebhookDelivery', 'UploadSession', 'StoredBlob']
\ No newline at end of file
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Stage Checkpoint Model
+"""
+from datetime import datetime
+from app import db
+
+
+class StageCheckpoint(db.Model):
+    """Completed pipeline stage of a video, keyed by an input fingerprint"""
+    __tablename__ = 'stage_checkpoints'
+    __table_args__ = (
+        db.UniqueConstraint('video_id', 'stage', name='uq_stage_checkpoints_video_stage'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False, index=True)
+    
+    # Stage name: extract_audio, analyze_sentiment, transcribe, select_clips, render_clip_<n>
+    stage = db.Column(db.String(50), nullable=False)
+    
+    # Hash of upstream fingerprints and the settings the stage depends on
+    fingerprint = db.Column(db.String(64), nullable=False)
+    
+    # Where the output lives (file path, clip id or Video column)
+    artifact = db.Column(db.String(500))
+    
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<StageCheckpoint {self.stage} of Video {self.video_id}>'
+    
+    def to_dict(self):
+        """Serialize checkpoint to dictionary"""
+        return {
+            'stage': self.stage,
+            'fingerprint': self.fingerprint,
+            'artifact': self.artifact,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
@@ -47,8 +47,12 @@ class Clip(db.Model):
     def __repr__(self):
         return f'<Clip {self.id} from Video {self.video_id}>'
     
-    def to_dict(self):
-        """Serialize clip to dictionary"""
+    def to_dict(self, include_url=True):
+        """
+        Serialize clip to dictionary
+        include_url=False gives the download endpoint instead of a presigned
+        URL (signed when the client follows it)
+        """
         return {
             'id': self.id,
             'video_id': self.video_id,
@@ -64,17 +68,35 @@ class Clip(db.Model):
             'downloads': self.downloads,
             'views': self.views,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'download_url': self.get_download_url()
+            'download_url': self.get_download_url() if include_url else f'/api/clips/{self.id}/download',
+            'preview_url': self.get_preview_url()
         }
     
+    @staticmethod
+    def serialize_many(clips, include_urls=True):
+        """to_dict of several clips, signing their S3 URLs in one batch"""
+        s3_keys = [clip.s3_key for clip in clips if clip.s3_key]
+        if include_urls and s3_keys:
+            from app.utils.file_handler import get_presigned_urls
+            get_presigned_urls(s3_keys)
+        return [clip.to_dict(include_url=include_urls) for clip in clips]
+    
     def get_download_url(self):
         """Get URL to download clip"""
         if self.s3_key:
-            from app.utils.file_handler import generate_s3_presigned_url
-            return generate_s3_presigned_url(self.s3_key)
+            from app.utils.file_handler import get_presigned_url
+            return get_presigned_url(self.s3_key)
         else:
             return f'/api/clips/{self.id}/download'
     
+    def get_preview_url(self):
+        """Get HLS playlist URL (None until the clip is packaged)"""
+        hls = (self.clip_metadata or {}).get('hls')
+        if hls:
+            # Segment URIs in the playlist resolve relative to this path
+            return f"/api/clips/{self.id}/preview/{hls['playlist']}"
+        return None
+    
     def increment_downloads(self):
         """Track download count"""
         self.downloads += 1
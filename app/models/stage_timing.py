@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Stage Timing Sample Model
+"""
+from datetime import datetime
+from app import db
+
+
+class StageTimingSample(db.Model):
+    """Duration of one pipeline stage of a finished job, with the job's cost drivers"""
+    __tablename__ = 'stage_timing_samples'
+    __table_args__ = (
+        db.Index('ix_stage_timing_samples_stage_created', 'stage', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id', ondelete='SET NULL'), index=True)
+    
+    # extract_audio, analyze_sentiment, transcribe, select_clips, render_clip, finalize
+    stage = db.Column(db.String(50), nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+    
+    # Cost drivers
+    video_duration = db.Column(db.Float)  # seconds of source video
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    whisper_model = db.Column(db.String(20))
+    render_preset = db.Column(db.String(20))
+    clip_count = db.Column(db.Integer)
+    clip_duration = db.Column(db.Float)  # render_clip samples only
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<StageTimingSample {self.stage}: {self.seconds}s>'
+    
+    def to_dict(self):
+        """Serialize sample to dictionary"""
+        return {
+            'stage': self.stage,
+            'seconds': self.seconds,
+            'video_duration': self.video_duration,
+            'width': self.width,
+            'height': self.height,
+            'whisper_model': self.whisper_model,
+            'render_preset': self.render_preset,
+            'clip_count': self.clip_count,
+            'clip_duration': self.clip_duration,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Stored Blob Model
+"""
+from datetime import datetime
+from app import db
+
+
+class StoredBlob(db.Model):
+    """
+    One stored copy of an uploaded file, shared by every Video with the same
+    content (SHA-256); the file is deleted when its last Video is
+    """
+    __tablename__ = 'stored_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    
+    # Where the single copy lives
+    file_path = db.Column(db.String(500))
+    s3_key = db.Column(db.String(500))
+    
+    # Videos pointing at this blob
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<StoredBlob {self.content_hash[:12]} ({self.ref_count} refs)>'
+    
+    def to_dict(self):
+        """Serialize blob to dictionary"""
+        return {
+            'id': self.id,
+            'content_hash': self.content_hash,
+            'size_bytes': self.size_bytes,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
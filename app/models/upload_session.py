@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Upload Session Model
+"""
+from datetime import datetime
+from app import db
+
+
+class UploadSession(db.Model):
+    """
+    An upload sent in parts: an S3 multipart upload straight to object
+    storage, or a resumable (tus-style) upload appended to local disk
+    """
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    original_filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # secure_filename
+    content_type = db.Column(db.String(100))
+    size = db.Column(db.BigInteger, nullable=False)  # bytes declared by the client
+    
+    # Kind values: s3_multipart, resumable
+    kind = db.Column(db.String(20), default='s3_multipart', nullable=False)
+    
+    # S3 multipart upload
+    s3_key = db.Column(db.String(500))
+    upload_id = db.Column(db.String(255))
+    part_size = db.Column(db.BigInteger)
+    part_count = db.Column(db.Integer)
+    
+    # Resumable upload: bytes received so far and the SHA-256 of the whole
+    # file once complete (hashed as the chunks arrive)
+    file_path = db.Column(db.String(500))
+    offset = db.Column(db.BigInteger, default=0, nullable=False)
+    content_hash = db.Column(db.String(64))
+    
+    # Status values: pending, completed, aborted, rejected
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)
+    error_message = db.Column(db.Text)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id', ondelete='SET NULL'))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    completed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id}: {self.original_filename} ({self.status})>'
+    
+    def to_dict(self):
+        """Serialize session to dictionary"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'original_filename': self.original_filename,
+            'size': self.size,
+            'part_size': self.part_size,
+            'part_count': self.part_count,
+            'offset': self.offset,
+            'content_hash': self.content_hash,
+            'status': self.status,
+            'error_message': self.error_message,
+            'video_id': self.video_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+    
+    @property
+    def is_expired(self):
+        return datetime.utcnow() >= self.expires_at
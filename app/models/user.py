@@ -49,6 +49,7 @@ class User(db.Model):
     
     # Relationships
     videos = db.relationship('Video', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    webhook_endpoints = db.relationship('WebhookEndpoint', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<User {self.username}>'
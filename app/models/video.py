@@ -21,6 +21,10 @@ class Video(db.Model):
     file_path = db.Column(db.String(500))
     s3_key = db.Column(db.String(500))  # If using S3
     
+    # SHA-256 of the file; identical uploads share one StoredBlob
+    content_hash = db.Column(db.String(64), index=True)
+    blob_id = db.Column(db.Integer, db.ForeignKey('stored_blobs.id', ondelete='SET NULL'), index=True)
+    
     # Video metadata
     duration = db.Column(db.Float)  # seconds
     width = db.Column(db.Integer)
@@ -28,9 +32,12 @@ class Video(db.Model):
     fps = db.Column(db.Float)
     codec = db.Column(db.String(50))
     
+    # ffprobe header probe of the upload (streams, rotation, bit rate, keyframe interval...)
+    media_info = db.Column(JSON)
+    
     # Processing info
     status = db.Column(db.String(20), default='uploaded', nullable=False, index=True)
-    # Status values: uploaded, queued, processing, completed, failed
+    # Status values: ingesting, rejected, uploaded, queued, processing, completed, failed, cancelling, cancelled
     
     processing_mode = db.Column(db.String(20))  # auto, manual
     error_message = db.Column(db.Text)
@@ -50,6 +57,15 @@ class Video(db.Model):
         'num_clips': 3
     })
     
+    # Per-stage timings of the last run: {stage: {'seconds': ..., 'peak_rss_mb': ..., 'input_wait_seconds': ...}}
+    stage_timings = db.Column(JSON, default=lambda: {})
+    
+    # Settings lowered by admission control under load ({level, changes: {key: {requested, applied}}})
+    degradation = db.Column(JSON(none_as_null=True))
+    
+    # Background re-run of a degraded video (queued/processing); status and clips stay untouched meanwhile
+    upgrade_status = db.Column(db.String(20))
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     processing_started_at = db.Column(db.DateTime)
@@ -57,31 +73,42 @@ class Video(db.Model):
     
     # Relationships
     clips = db.relationship('Clip', backref='video', lazy='dynamic', cascade='all, delete-orphan')
+    checkpoints = db.relationship('StageCheckpoint', backref='video', lazy='dynamic', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Video {self.id}: {self.original_filename}>'
     
-    def to_dict(self, include_clips=False):
-        """Serialize video to dictionary"""
+    def to_dict(self, include_clips=False, include_urls=True):
+        """
+        Serialize video to dictionary
+        include_urls=False gives clips their download endpoint instead of a
+        presigned URL (signed when the client follows it)
+        """
         data = {
             'id': self.id,
             'filename': self.filename,
             'original_filename': self.original_filename,
             'file_size_mb': self.file_size_mb,
+            'content_hash': self.content_hash,
             'duration': self.duration,
             'width': self.width,
             'height': self.height,
             'fps': self.fps,
+            'media_info': self.media_info,
             'status': self.status,
             'processing_mode': self.processing_mode,
             'error_message': self.error_message,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'processing_time': self.get_processing_time(),
+            'stage_timings': self.stage_timings or {},
+            'degradation': self.degradation,
+            'upgrade_status': self.upgrade_status,
             'clips_count': self.clips.count()
         }
         
         if include_clips:
-            data['clips'] = [clip.to_dict() for clip in self.clips.all()]
+            from app.models.clip import Clip
+            data['clips'] = Clip.serialize_many(self.clips.all(), include_urls=include_urls)
         
         return data
     
@@ -97,27 +124,81 @@ class Video(db.Model):
         self.status = 'processing'
         self.task_id = task_id
         self.processing_started_at = datetime.utcnow()
+        self.stage_timings = {}
+        db.session.commit()
+        self.publish_status()
+    
+    def record_stage_timings(self, timings):
+        """Merge per-stage timings into stage_timings"""
+        merged = dict(self.stage_timings or {})
+        merged.update(timings)
+        self.stage_timings = merged
         db.session.commit()
     
     def mark_as_completed(self):
         """Update status when processing completes"""
         self.status = 'completed'
         self.processing_completed_at = datetime.utcnow()
+        self._notify_webhooks('video.completed')
         db.session.commit()
+        self.publish_status()
     
     def mark_as_failed(self, error_message):
         """Update status when processing fails"""
+        already_failed = self.status == 'failed'
         self.status = 'failed'
         self.error_message = error_message
         self.processing_completed_at = datetime.utcnow()
+        if not already_failed:
+            # Parallel stages may each report the same failure
+            self._notify_webhooks('video.failed')
+        db.session.commit()
+        self.publish_status()
+    
+    def mark_as_cancelling(self):
+        """Cancellation requested; the running stage stops at its next check"""
+        self.status = 'cancelling'
+        db.session.commit()
+        self.publish_status()
+    
+    def mark_as_rejected(self, error_message):
+        """Upload failed validation during ingest (its file is deleted)"""
+        self.status = 'rejected'
+        self.error_message = error_message
+        db.session.commit()
+        self.publish_status()
+    
+    def mark_as_cancelled(self):
+        """Update status when processing was cancelled (doesn't count as usage)"""
+        self.status = 'cancelled'
+        self.error_message = None
+        self.processing_completed_at = datetime.utcnow()
         db.session.commit()
+        self.publish_status()
+    
+    def _notify_webhooks(self, event):
+        """Write webhook outbox rows (committed together with the status change)"""
+        from app.services.webhook_service import WebhookService
+        if WebhookService.enqueue(self, event):
+            self._webhooks_pending = True
+    
+    def publish_status(self):
+        """Push the current status to progress subscribers"""
+        from app.services.progress_service import ProgressService
+        ProgressService.publish_status(self)
+        
+        # Kick the sender now instead of waiting for the next scheduled drain
+        if getattr(self, '_webhooks_pending', False):
+            self._webhooks_pending = False
+            from app.tasks.video_tasks import deliver_webhooks_task
+            deliver_webhooks_task.delay()
     
     def get_download_url(self):
         """Get URL to download video"""
         if self.s3_key:
             # Return S3 presigned URL
-            from app.utils.file_handler import generate_s3_presigned_url
-            return generate_s3_presigned_url(self.s3_key)
+            from app.utils.file_handler import get_presigned_url
+            return get_presigned_url(self.s3_key)
         else:
             # Return local file URL
             return f'/api/videos/{self.id}/download'
\ No newline at end of file
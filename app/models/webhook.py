@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook Models
+"""
+from datetime import datetime
+from app import db
+from sqlalchemy.dialects.postgresql import JSON
+
+
+class WebhookEndpoint(db.Model):
+    """URL notified about a user's video events"""
+    __tablename__ = 'webhook_endpoints'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    url = db.Column(db.String(500), nullable=False)
+    secret = db.Column(db.String(64), nullable=False)  # HMAC-SHA256 signing key
+    events = db.Column(JSON, default=lambda: ['video.completed', 'video.failed'])
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    deliveries = db.relationship('WebhookDelivery', backref='endpoint', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<WebhookEndpoint {self.id}: {self.url}>'
+    
+    def to_dict(self, include_secret=False):
+        """Serialize endpoint to dictionary"""
+        data = {
+            'id': self.id,
+            'url': self.url,
+            'events': self.events,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        
+        if include_secret:
+            data['secret'] = self.secret
+        
+        return data
+
+
+class WebhookDelivery(db.Model):
+    """Outbox row: one event to deliver to one endpoint"""
+    __tablename__ = 'webhook_deliveries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint_id = db.Column(db.Integer, db.ForeignKey('webhook_endpoints.id'), nullable=False, index=True)
+    
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(JSON, nullable=False)
+    
+    # Status values: pending, delivered, failed
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    last_error = db.Column(db.Text)
+    response_status = db.Column(db.Integer)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    delivered_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<WebhookDelivery {self.id}: {self.event} ({self.status})>'
+    
+    def to_dict(self):
+        """Serialize delivery to dictionary"""
+        return {
+            'id': self.id,
+            'event': self.event,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'response_status': self.response_status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'delivered_at': self.delivered_at.isoformat() if self.delivered_at else None
+        }
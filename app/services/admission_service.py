@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Admission Control Service
+When the processing backlog grows, jobs released by the dispatcher get
+cheaper settings (smaller Whisper model, faster x264 preset, lower render
+resolution) according to their plan's degradation policy
+"""
+from datetime import datetime
+from flask import current_app
+from app.services.checkpoint_service import CheckpointService
+
+
+# Cheapest first
+WHISPER_MODELS = ['tiny', 'base', 'small', 'medium', 'large']
+X264_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow']
+
+
+def _cap(value, ceiling, order):
+    """The cheaper of two values of an ordered list (unknown values are kept)"""
+    if value not in order or ceiling not in order:
+        return value
+    return order[min(order.index(value), order.index(ceiling))]
+
+
+class AdmissionController:
+    """Queue pressure and per-plan quality degradation"""
+    
+    @staticmethod
+    def pressure():
+        """
+        Current load: jobs waiting and running, and the time the workers need
+        to drain them at the recent per-job throughput
+        """
+        from app.services.dispatch_service import FairDispatcher
+        
+        pending, in_flight = FairDispatcher.load()
+        max_in_flight = current_app.config.get('DISPATCH_MAX_IN_FLIGHT', 4)
+        backlog_seconds = (pending + in_flight) * FairDispatcher.average_job_seconds() / max_in_flight
+        
+        if backlog_seconds >= current_app.config.get('ADMISSION_CRITICAL_BACKLOG', 1800):
+            level = 'critical'
+        elif backlog_seconds >= current_app.config.get('ADMISSION_ELEVATED_BACKLOG', 600):
+            level = 'elevated'
+        else:
+            level = 'normal'
+        
+        return {
+            'level': level,
+            'pending': pending,
+            'in_flight': in_flight,
+            'backlog_seconds': round(backlog_seconds, 1)
+        }
+    
+    @staticmethod
+    def requested(settings):
+        """The degradable settings of a job as requested"""
+        return {
+            'whisper_model': settings.get('whisper_model') or current_app.config.get('WHISPER_MODEL', 'base'),
+            'render_preset': settings.get('render_preset') or 'medium',
+            'render_height': settings.get('render_height')
+        }
+    
+    @staticmethod
+    def upgradable(video):
+        """
+        True if the video's degradation still describes its settings, i.e.
+        a rerun with them would be better than the degraded run
+        """
+        changes = (video.degradation or {}).get('changes') or {}
+        requested = AdmissionController.requested(video.settings or {})
+        return bool(changes) and all(
+            requested.get(key) == change.get('requested') for key, change in changes.items()
+        )
+    
+    @staticmethod
+    def admit(video, settings):
+        """
+        Settings a job actually runs with
+        Returns: (settings, degradation) where degradation is None when
+        nothing was changed, else a record of the requested/applied values
+        """
+        if settings.get('upgrade_pass'):
+            return settings, None
+        
+        pressure = AdmissionController.pressure()
+        if pressure['level'] == 'normal':
+            return settings, None
+        
+        plan_limits = current_app.config['PLANS'].get(video.user.plan, {})
+        policy = plan_limits.get('degradation', {}).get(pressure['level'], {})
+        
+        requested = AdmissionController.requested(settings)
+        applied = dict(requested)
+        
+        if 'whisper_model' in policy and not AdmissionController._transcribed(video, settings):
+            applied['whisper_model'] = _cap(requested['whisper_model'], policy['whisper_model'], WHISPER_MODELS)
+        if 'render_preset' in policy:
+            applied['render_preset'] = _cap(requested['render_preset'], policy['render_preset'], X264_PRESETS)
+        if 'render_height' in policy:
+            applied['render_height'] = min(requested['render_height'] or policy['render_height'], policy['render_height'])
+        
+        changes = {
+            key: {'requested': requested[key], 'applied': applied[key]}
+            for key in applied
+            if applied[key] != requested[key]
+        }
+        if not changes:
+            return settings, None
+        
+        degraded = dict(settings)
+        degraded.update({key: change['applied'] for key, change in changes.items()})
+        
+        return degraded, {
+            'level': pressure['level'],
+            'backlog_seconds': pressure['backlog_seconds'],
+            'changes': changes,
+            'degraded_at': datetime.utcnow().isoformat()
+        }
+    
+    @staticmethod
+    def _transcribed(video, settings):
+        """A transcription with the requested model is already checkpointed"""
+        from app.services.video_processor import VideoProcessor
+        
+        fingerprint = VideoProcessor(video, settings, video.user).analysis_fingerprints()['transcribe']
+        return video.transcription is not None and CheckpointService.is_valid(video.id, 'transcribe', fingerprint)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Input Cache Service
+Node-local cache of S3 source media shared by all workers on the host.
+Entries are keyed by the object's content (bucket, key and ETag), evicted
+least recently used past INPUT_CACHE_MAX_BYTES, and downloaded under an
+flock so workers asking for the same object wait for one download. Jobs get
+a hard link of the entry in their temp folder: cleanup and eviction then
+never pull a file from under each other.
+"""
+import fcntl
+import hashlib
+import os
+import socket
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from flask import current_app
+from app.utils.redis_client import get_redis
+from app.utils.file_handler import head_s3_object, download_from_s3
+
+
+STATS_KEY = 'input_cache:stats:{node}'
+NODES_KEY = 'input_cache:nodes'
+
+
+@contextmanager
+def _locked(path):
+    """Exclusive flock on <path> (held across processes on this host)"""
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class InputCache:
+    """Content-keyed LRU cache of S3 inputs on this node"""
+    
+    @staticmethod
+    def is_enabled():
+        return bool(current_app.config.get('INPUT_CACHE_ENABLED', True))
+    
+    @staticmethod
+    def folder():
+        folder = Path(current_app.config.get('INPUT_CACHE_FOLDER') or Path(current_app.config['TEMP_FOLDER']) / 'cache')
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder
+    
+    @staticmethod
+    def entry_path(s3_key, etag):
+        """Cache file of one version of an S3 object"""
+        content_key = f"{current_app.config['AWS_BUCKET_NAME']}/{s3_key}:{etag}"
+        digest = hashlib.sha256(content_key.encode('utf-8')).hexdigest()
+        return InputCache.folder() / f"{digest}{Path(s3_key).suffix}"
+    
+    @staticmethod
+    def _record(**counters):
+        try:
+            node = socket.gethostname()
+            pipe = get_redis().pipeline()
+            pipe.sadd(NODES_KEY, node)
+            for name, value in counters.items():
+                pipe.hincrby(STATS_KEY.format(node=node), name, int(value))
+            pipe.execute()
+        except Exception as e:
+            # Metrics must never fail a download
+            print(f"Input cache stats update failed: {e}")
+    
+    @staticmethod
+    def _entries():
+        """Cached files, least recently used first"""
+        entries = []
+        for path in InputCache.folder().iterdir():
+            if path.suffix in ('.lock', '.part') or not path.is_file():
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+    
+    @staticmethod
+    def evict(reserve=0):
+        """Delete least recently used entries until <reserve> more bytes fit the budget"""
+        budget = current_app.config.get('INPUT_CACHE_MAX_BYTES', 50 * 1024 ** 3)
+        
+        with _locked(InputCache.folder() / '.evict.lock'):
+            entries = InputCache._entries()
+            used = sum(size for _, size, _ in entries)
+            
+            evicted = 0
+            for _, size, path in entries:
+                if used + reserve <= budget:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_name(path.name + '.lock').unlink(missing_ok=True)
+                used -= size
+                evicted += 1
+        
+        if evicted:
+            InputCache._record(evictions=evicted)
+        return evicted
+    
+    @staticmethod
+    def fetch(s3_key):
+        """
+        Path of the cached copy of an S3 object, downloading it on a miss
+        Returns None if the object is larger than the whole cache budget.
+        """
+        head = head_s3_object(s3_key)
+        path = InputCache.entry_path(s3_key, head['etag'])
+        
+        if head['size'] > current_app.config.get('INPUT_CACHE_MAX_BYTES', 50 * 1024 ** 3):
+            return None
+        
+        if path.exists():
+            os.utime(path)
+            InputCache._record(hits=1, bytes_served=head['size'])
+            return path
+        
+        with _locked(path.with_name(path.name + '.lock')):
+            # Another worker may have downloaded it while this one waited
+            if path.exists():
+                os.utime(path)
+                InputCache._record(hits=1, bytes_served=head['size'])
+                return path
+            
+            InputCache.evict(reserve=head['size'])
+            
+            partial_path = path.with_name(f"{path.name}.{os.getpid()}.part")
+            started = time.monotonic()
+            try:
+                download_from_s3(s3_key, partial_path)
+                os.replace(partial_path, path)
+            except Exception:
+                partial_path.unlink(missing_ok=True)
+                raise
+            
+            InputCache._record(
+                misses=1,
+                bytes_downloaded=head['size'],
+                download_ms=(time.monotonic() - started) * 1000
+            )
+        
+        return path
+    
+    @staticmethod
+    def materialize(s3_key, target_path):
+        """
+        Put the S3 object at <target_path> as a hard link of its cache entry
+        Returns False when the caller has to download it itself (object too
+        large for the cache, or cache and target on different filesystems).
+        """
+        target_path = Path(target_path)
+        partial_path = target_path.with_name(f"{target_path.name}.{os.getpid()}.part")
+        
+        # A second attempt covers an entry evicted between fetch and link
+        for _ in range(2):
+            path = InputCache.fetch(s3_key)
+            if path is None:
+                return False
+            
+            try:
+                partial_path.unlink(missing_ok=True)
+                os.link(path, partial_path)
+                os.replace(partial_path, target_path)
+                return True
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"Input cache link failed ({e}); downloading {s3_key}")
+                return False
+        
+        return False
+    
+    @staticmethod
+    def stats():
+        """Hit rate and traffic of every node's cache"""
+        r = get_redis()
+        nodes = {}
+        
+        for node in sorted(r.smembers(NODES_KEY)):
+            counters = {name: int(value) for name, value in r.hgetall(STATS_KEY.format(node=node)).items()}
+            lookups = counters.get('hits', 0) + counters.get('misses', 0)
+            counters['hit_rate'] = round(counters.get('hits', 0) / lookups, 3) if lookups else None
+            nodes[node] = counters
+        
+        return {'nodes': nodes}
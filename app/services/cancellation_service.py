@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Cancellation Service
+Cooperative job cancellation: the API sets a flag in Redis, stage tasks
+check it between stages, transcription windows and clip renders, and a
+watcher thread kills ffmpeg children of a running render
+"""
+import threading
+import time
+from contextlib import contextmanager
+import psutil
+from flask import current_app
+from app.utils.redis_client import get_redis
+
+
+CANCEL_KEY = 'cancel:{video_id}'
+
+
+class JobCancelled(Exception):
+    """Raised inside a stage when its video was cancelled"""
+
+
+class CancellationService:
+    """Cancellation flags and in-task enforcement"""
+    
+    @staticmethod
+    def request(video_id):
+        """Flag a video as cancelled (the value is the request time)"""
+        get_redis().set(
+            CANCEL_KEY.format(video_id=video_id),
+            time.time(),
+            ex=current_app.config.get('CANCEL_FLAG_TTL', 86400)
+        )
+    
+    @staticmethod
+    def clear(video_id):
+        """Drop the flag before the video is processed again"""
+        get_redis().delete(CANCEL_KEY.format(video_id=video_id))
+    
+    @staticmethod
+    def requested_at(video_id):
+        """Unix time of the cancel request (None if not cancelled)"""
+        value = get_redis().get(CANCEL_KEY.format(video_id=video_id))
+        return float(value) if value is not None else None
+    
+    @staticmethod
+    def is_requested(video_id):
+        return CancellationService.requested_at(video_id) is not None
+    
+    @staticmethod
+    def check(video_id):
+        """Raise JobCancelled if the video was cancelled"""
+        if CancellationService.is_requested(video_id):
+            raise JobCancelled(f"Video {video_id} was cancelled")
+    
+    @staticmethod
+    def kill_child_processes(timeout=3):
+        """Terminate (then kill) every child process, e.g. ffmpeg"""
+        children = psutil.Process().children(recursive=True)
+        for child in children:
+            try:
+                child.terminate()
+            except psutil.NoSuchProcess:
+                pass
+        
+        _, alive = psutil.wait_procs(children, timeout=timeout)
+        for child in alive:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                pass
+        
+        return len(children)
+    
+    @staticmethod
+    @contextmanager
+    def watch(video_id):
+        """
+        Run a block while a background thread polls the flag
+        On cancellation the thread kills child processes so the block fails
+        fast; the block's error is then turned into JobCancelled.
+        """
+        r = get_redis()  # Resolved here: the thread has no app context
+        key = CANCEL_KEY.format(video_id=video_id)
+        interval = current_app.config.get('CANCEL_POLL_SECONDS', 2)
+        stop = threading.Event()
+        cancelled = threading.Event()
+        
+        def poll():
+            while not stop.wait(interval):
+                if r.exists(key):
+                    cancelled.set()
+                    CancellationService.kill_child_processes()
+                    return
+        
+        watcher = threading.Thread(target=poll, name=f'cancel-watch-{video_id}', daemon=True)
+        watcher.start()
+        
+        try:
+            yield
+        except Exception as e:
+            if cancelled.is_set() or r.exists(key):
+                raise JobCancelled(f"Video {video_id} was cancelled") from e
+            raise
+        finally:
+            stop.set()
+            watcher.join()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoint Service
+Lets pipeline stages skip work whose inputs and settings are unchanged
+"""
+import hashlib
+import json
+from datetime import datetime
+from app import db
+from app.models import StageCheckpoint
+
+
+class CheckpointService:
+    """Record and validate per-stage checkpoints"""
+    
+    @staticmethod
+    def fingerprint(*parts):
+        """Stable hash of upstream fingerprints and stage settings"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def get(video_id, stage):
+        return StageCheckpoint.query.filter_by(video_id=video_id, stage=stage).first()
+    
+    @staticmethod
+    def is_valid(video_id, stage, fingerprint):
+        """True if the stage completed with the same fingerprint"""
+        checkpoint = CheckpointService.get(video_id, stage)
+        return checkpoint is not None and checkpoint.fingerprint == fingerprint
+    
+    @staticmethod
+    def record(video_id, stage, fingerprint, artifact=None):
+        """Create or replace the checkpoint of a completed stage"""
+        checkpoint = CheckpointService.get(video_id, stage)
+        
+        if checkpoint is None:
+            checkpoint = StageCheckpoint(video_id=video_id, stage=stage)
+            db.session.add(checkpoint)
+        
+        checkpoint.fingerprint = fingerprint
+        checkpoint.artifact = str(artifact) if artifact is not None else None
+        checkpoint.completed_at = datetime.utcnow()
+        db.session.commit()
+        
+        return checkpoint
+    
+    @staticmethod
+    def invalidate(video_id, stage):
+        """Drop the checkpoint of a stage"""
+        StageCheckpoint.query.filter_by(video_id=video_id, stage=stage).delete()
+        db.session.commit()
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Dedup Service
+Every upload is identified by the SHA-256 of its bytes. Identical uploads
+share one stored copy (a reference-counted StoredBlob) and count once
+toward their owner's storage, and a video whose content was already
+analyzed or rendered with the same settings adopts those results instead
+of running the stages again.
+"""
+import hashlib
+import os
+import shutil
+from pathlib import Path, PurePosixPath
+from flask import current_app
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Video, Clip, StoredBlob, StageCheckpoint
+from app.services.checkpoint_service import CheckpointService
+from app.services.hls_service import HLSService
+from app.utils.file_handler import get_s3_client, head_s3_object, delete_file
+
+
+# Bytes read at a time while hashing
+CHUNK_SIZE = 1024 * 1024
+
+
+class DedupService:
+    """Content hashes, shared blobs and reuse of results across identical videos"""
+    
+    @staticmethod
+    def _hash_blocks(blocks, size=None, callback=None):
+        """SHA-256 of byte blocks; callback(fraction done) after each block"""
+        hasher = hashlib.sha256()
+        done = 0
+        for block in blocks:
+            hasher.update(block)
+            done += len(block)
+            if callback and size:
+                callback(done / size)
+        return hasher.hexdigest()
+    
+    @staticmethod
+    def hash_file(file_path, callback=None):
+        """SHA-256 of a local file"""
+        with open(file_path, 'rb') as stream:
+            return DedupService._hash_blocks(
+                iter(lambda: stream.read(CHUNK_SIZE), b''), os.fstat(stream.fileno()).st_size, callback
+            )
+    
+    @staticmethod
+    def hash_s3_object(s3_key, callback=None):
+        """SHA-256 of an S3 object (streamed; the ETag isn't one for multipart uploads)"""
+        response = get_s3_client().get_object(Bucket=current_app.config['AWS_BUCKET_NAME'], Key=s3_key)
+        return DedupService._hash_blocks(
+            response['Body'].iter_chunks(CHUNK_SIZE), response.get('ContentLength'), callback
+        )
+    
+    @staticmethod
+    def _size_bytes(video):
+        if video.s3_key:
+            return head_s3_object(video.s3_key)['size']
+        return Path(video.file_path).stat().st_size
+    
+    @staticmethod
+    def _owner_shares(video, blob):
+        """True if another video of the same owner already uses the blob"""
+        return db.session.query(Video.id).filter(
+            Video.user_id == video.user_id,
+            Video.blob_id == blob.id,
+            Video.id != video.id
+        ).first() is not None
+    
+    @staticmethod
+    def attach(video, content_hash):
+        """
+        Record the video's content hash and point it at the blob of that
+        content. The first upload of some content becomes its blob; later
+        ones drop their own copy and share it. Storage is charged once per
+        owner and blob.
+        """
+        size_bytes = DedupService._size_bytes(video)
+        uploaded = (video.file_path, video.s3_key)
+        
+        for _ in range(2):
+            blob = StoredBlob.query.filter_by(content_hash=content_hash).with_for_update().first()
+            if blob is not None:
+                break
+            
+            blob = StoredBlob(
+                content_hash=content_hash,
+                size_bytes=size_bytes,
+                file_path=video.file_path,
+                s3_key=video.s3_key,
+                ref_count=0
+            )
+            db.session.add(blob)
+            try:
+                db.session.flush()
+                break
+            except IntegrityError:
+                # Another upload of the same content created it first
+                db.session.rollback()
+        
+        if not DedupService._owner_shares(video, blob):
+            video.user.storage_used_mb = (video.user.storage_used_mb or 0) + size_bytes / (1024 * 1024)
+        
+        blob.ref_count += 1
+        video.content_hash = content_hash
+        video.blob_id = blob.id
+        video.file_path = blob.file_path
+        video.s3_key = blob.s3_key
+        db.session.commit()
+        
+        # Only once the video points at the shared copy (a failure just
+        # leaves an orphaned duplicate, the attach itself is done)
+        if uploaded != (blob.file_path, blob.s3_key):
+            try:
+                delete_file(*uploaded)
+            except Exception as e:
+                print(f"Deleting the duplicate upload of video #{video.id} failed: {e}")
+            print(f"♻️ Video #{video.id} shares stored blob {content_hash[:12]} ({blob.ref_count} refs)")
+        
+        return blob
+    
+    @staticmethod
+    def release(video):
+        """
+        Drop the video's reference to its stored file (on delete); the file
+        goes with the last reference
+        """
+        if video.blob_id is None:
+            if video.file_path or video.s3_key:
+                delete_file(video.file_path, video.s3_key)
+            return
+        
+        blob = StoredBlob.query.filter_by(id=video.blob_id).with_for_update().first()
+        video.blob_id = None
+        if blob is None:
+            db.session.commit()
+            return
+        
+        blob.ref_count -= 1
+        if not DedupService._owner_shares(video, blob):
+            used_mb = (video.user.storage_used_mb or 0) - blob.size_bytes / (1024 * 1024)
+            video.user.storage_used_mb = max(0.0, used_mb)
+        
+        stored = (blob.file_path, blob.s3_key)
+        orphaned = blob.ref_count <= 0
+        if orphaned:
+            db.session.delete(blob)
+        db.session.commit()
+        
+        if orphaned:
+            delete_file(*stored)
+    
+    @staticmethod
+    def find_donor(video, stages):
+        """
+        Latest other video with the same content whose checkpoints match
+        <stages> ({stage: fingerprint}), or None
+        """
+        if not video.content_hash:
+            return None
+        
+        query = Video.query.filter(Video.content_hash == video.content_hash, Video.id != video.id)
+        for stage, fingerprint in stages.items():
+            checkpoint = aliased(StageCheckpoint)
+            query = query.join(checkpoint, and_(
+                checkpoint.video_id == Video.id,
+                checkpoint.stage == stage,
+                checkpoint.fingerprint == fingerprint
+            ))
+        
+        return query.order_by(Video.id.desc()).first()
+    
+    @staticmethod
+    def adopt_analyses(video, fingerprints):
+        """
+        Copy sentiment and transcription from a video with the same content
+        analyzed with the same settings; True if they were adopted
+        """
+        stages = {stage: fingerprints[stage] for stage in ('analyze_sentiment', 'transcribe')}
+        
+        if video.sentiment_data is not None and video.transcription is not None and \
+                all(CheckpointService.is_valid(video.id, stage, fp) for stage, fp in stages.items()):
+            return False
+        
+        donor = DedupService.find_donor(video, stages)
+        if donor is None or donor.sentiment_data is None or donor.transcription is None:
+            return False
+        
+        video.sentiment_data = donor.sentiment_data
+        video.transcription = donor.transcription
+        db.session.commit()
+        
+        CheckpointService.record(video.id, 'analyze_sentiment', stages['analyze_sentiment'], 'videos.sentiment_data')
+        CheckpointService.record(video.id, 'transcribe', stages['transcribe'], 'videos.transcription')
+        
+        print(f"♻️ Video #{video.id} adopted the analyses of video #{donor.id}")
+        return True
+    
+    @staticmethod
+    def adopt_renders(video, processor, select_fingerprint):
+        """
+        Copy the clips a video with the same content rendered from the same
+        selection and render settings; select_clips then keeps them like
+        clips of an earlier run. Returns the number of clips copied.
+        """
+        donor = DedupService.find_donor(video, {'select_clips': select_fingerprint})
+        if donor is None:
+            return 0
+        
+        rendered = {
+            (clip.clip_metadata or {}).get('index'): (clip.clip_metadata or {}).get('fingerprint')
+            for clip in video.clips
+        }
+        
+        copied = 0
+        for clip in donor.clips.all():
+            index = (clip.clip_metadata or {}).get('index')
+            if index is None:
+                continue
+            
+            fingerprint = processor.render_fingerprint(select_fingerprint, index)
+            if clip.clip_metadata.get('fingerprint') != fingerprint or rendered.get(index) == fingerprint:
+                continue
+            
+            copy = DedupService._copy_clip(clip, video, processor, index, fingerprint)
+            if copy is not None:
+                CheckpointService.record(video.id, f'render_clip_{index}', fingerprint, copy.file_path or copy.s3_key)
+                copied += 1
+        
+        if copied:
+            print(f"♻️ Video #{video.id} adopted {copied} clips of video #{donor.id}")
+        return copied
+    
+    @staticmethod
+    def _copy_clip(clip, video, processor, index, fingerprint):
+        """New Clip of <video> with a copy of <clip>'s file (None if it can't be copied)"""
+        output_path, filename = processor.clip_output_path(index)
+        file_path, s3_key = None, None
+        
+        try:
+            if clip.file_path and Path(clip.file_path).exists():
+                # Never link a clip file onto itself (both rows would own one file)
+                if output_path.resolve() == Path(clip.file_path).resolve():
+                    return None
+                
+                # A clip file of an earlier run is still there: its render decides
+                if output_path.exists():
+                    return None
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(clip.file_path, output_path)
+                except OSError:
+                    shutil.copy2(clip.file_path, output_path)
+                file_path = str(output_path)
+            elif clip.s3_key:
+                s3_key = str(PurePosixPath(clip.s3_key).with_name(filename))
+                if s3_key == clip.s3_key:
+                    return None
+                bucket_name = current_app.config['AWS_BUCKET_NAME']
+                get_s3_client().copy_object(
+                    Bucket=bucket_name,
+                    Key=s3_key,
+                    CopySource={'Bucket': bucket_name, 'Key': clip.s3_key}
+                )
+            else:
+                return None
+        except Exception as e:
+            print(f"Copying clip {clip.id} for video #{video.id} failed: {e}")
+            return None
+        
+        clip_metadata = {'index': index, 'fingerprint': fingerprint}
+        
+        # Previews are packaged per clip file name
+        if HLSService.is_enabled() and file_path:
+            try:
+                clip_metadata['hls'] = processor.package_preview(file_path, filename)
+            except Exception as e:
+                print(f"HLS packaging failed for {filename}: {e}")
+        
+        copy = Clip(
+            video_id=video.id,
+            filename=filename,
+            file_path=file_path,
+            s3_key=s3_key,
+            file_size_mb=clip.file_size_mb,
+            start_time=clip.start_time,
+            end_time=clip.end_time,
+            duration=clip.duration,
+            relevance_score=clip.relevance_score,
+            narrative_type=clip.narrative_type,
+            transcription_text=clip.transcription_text,
+            social_media_caption=clip.social_media_caption,
+            analytics_report=clip.analytics_report,
+            clip_metadata=clip_metadata
+        )
+        db.session.add(copy)
+        db.session.commit()
+        return copy
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Fair Dispatch Service
+Holds processing jobs in per-user pending lists and releases them to the
+workers in weighted round robin by plan, instead of plain FIFO
+"""
+import json
+import math
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Video
+from app.utils.redis_client import get_redis
+
+
+PENDING_KEY = 'dispatch:pending:{user_id}'      # list of video ids
+INFLIGHT_KEY = 'dispatch:inflight:{user_id}'    # set of video ids
+USERS_KEY = 'dispatch:users'                    # set of users with pending work
+INFLIGHT_ALL_KEY = 'dispatch:inflight'          # set of all released video ids
+PLANS_KEY = 'dispatch:plans'                    # hash user_id -> plan
+SETTINGS_KEY = 'dispatch:settings'              # hash video_id -> settings json
+OWNERS_KEY = 'dispatch:owners'                  # hash video_id -> user_id
+CREDITS_KEY = 'dispatch:credits'                # hash user_id -> round robin credit
+LOCK_KEY = 'dispatch:lock'
+
+
+class FairDispatcher:
+    """Plan-weighted round robin in front of the processing queue"""
+    
+    @staticmethod
+    def _plan_limits(plan):
+        plan_limits = current_app.config['PLANS'].get(plan, {})
+        return plan_limits.get('queue_weight', 1), plan_limits.get('max_concurrent_jobs', 1)
+    
+    @staticmethod
+    def submit(video, settings):
+        """Add a video to its owner's pending list and release what fits"""
+        FairDispatcher.submit_many([video], settings)
+    
+    @staticmethod
+    def submit_many(videos, settings):
+        """Queue several videos in one round trip, then dispatch once"""
+        r = get_redis()
+        
+        pipe = r.pipeline()
+        for video in videos:
+            user_id = str(video.user_id)
+            pipe.hset(SETTINGS_KEY, video.id, json.dumps(settings))
+            pipe.hset(OWNERS_KEY, video.id, user_id)
+            pipe.hset(PLANS_KEY, user_id, video.user.plan)
+            pipe.rpush(PENDING_KEY.format(user_id=user_id), video.id)
+            pipe.sadd(USERS_KEY, user_id)
+        pipe.execute()
+        
+        FairDispatcher.dispatch()
+    
+    @staticmethod
+    def release(video_id):
+        """Free the slot of a finished (or failed) job and release the next ones"""
+        r = get_redis()
+        user_id = r.hget(OWNERS_KEY, video_id)
+        
+        pipe = r.pipeline()
+        if user_id:
+            pipe.srem(INFLIGHT_KEY.format(user_id=user_id), video_id)
+        pipe.srem(INFLIGHT_ALL_KEY, video_id)
+        pipe.hdel(OWNERS_KEY, video_id)
+        pipe.execute()
+        
+        FairDispatcher.dispatch()
+    
+    @staticmethod
+    def withdraw(video_id):
+        """
+        Remove a video that was not released yet from its pending list
+        Returns True when it was still pending (no worker ever saw it).
+        """
+        r = get_redis()
+        
+        with r.lock(LOCK_KEY, timeout=30, blocking_timeout=10):
+            user_id = r.hget(OWNERS_KEY, video_id)
+            if user_id is None or r.sismember(INFLIGHT_ALL_KEY, video_id):
+                return False
+            
+            removed = r.lrem(PENDING_KEY.format(user_id=user_id), 0, video_id)
+            pipe = r.pipeline()
+            pipe.hdel(SETTINGS_KEY, video_id)
+            pipe.hdel(OWNERS_KEY, video_id)
+            pipe.execute()
+            
+            if r.llen(PENDING_KEY.format(user_id=user_id)) == 0:
+                r.srem(USERS_KEY, user_id)
+                r.hdel(CREDITS_KEY, user_id)
+        
+        return bool(removed)
+    
+    @staticmethod
+    def load():
+        """(jobs waiting for a slot, jobs running)"""
+        r = get_redis()
+        pipe = r.pipeline(transaction=False)
+        for user_id in r.smembers(USERS_KEY):
+            pipe.llen(PENDING_KEY.format(user_id=user_id))
+        pending = sum(pipe.execute())
+        return pending, r.scard(INFLIGHT_ALL_KEY)
+    
+    @staticmethod
+    def is_busy(max_in_flight=None):
+        """True when jobs are waiting for a slot or <max_in_flight> slots are taken"""
+        r = get_redis()
+        max_in_flight = max_in_flight or current_app.config.get('DISPATCH_MAX_IN_FLIGHT', 4)
+        return r.scard(USERS_KEY) > 0 or r.scard(INFLIGHT_ALL_KEY) >= max_in_flight
+    
+    @staticmethod
+    def dispatch():
+        """
+        Release pending jobs while there is global capacity
+        Each pick adds every eligible user's weight to its credit and takes the
+        user with the highest credit, which then pays the total weight (smooth
+        weighted round robin). Users at their in-flight cap are not eligible.
+        """
+        r = get_redis()
+        max_in_flight = current_app.config.get('DISPATCH_MAX_IN_FLIGHT', 4)
+        released = []
+        
+        with r.lock(LOCK_KEY, timeout=30, blocking_timeout=10):
+            in_flight = r.scard(INFLIGHT_ALL_KEY)
+            
+            while in_flight < max_in_flight:
+                eligible = {}
+                for user_id in r.smembers(USERS_KEY):
+                    weight, max_jobs = FairDispatcher._plan_limits(r.hget(PLANS_KEY, user_id))
+                    if r.scard(INFLIGHT_KEY.format(user_id=user_id)) < max_jobs:
+                        eligible[user_id] = weight
+                
+                if not eligible:
+                    break
+                
+                user_id = FairDispatcher._pick(r, eligible)
+                video_id = r.lpop(PENDING_KEY.format(user_id=user_id))
+                
+                if r.llen(PENDING_KEY.format(user_id=user_id)) == 0:
+                    r.srem(USERS_KEY, user_id)
+                    r.hdel(CREDITS_KEY, user_id)
+                
+                if video_id is None:
+                    continue
+                
+                settings = json.loads(r.hget(SETTINGS_KEY, video_id) or '{}')
+                pipe = r.pipeline()
+                pipe.hdel(SETTINGS_KEY, video_id)
+                pipe.sadd(INFLIGHT_KEY.format(user_id=user_id), video_id)
+                pipe.sadd(INFLIGHT_ALL_KEY, video_id)
+                pipe.execute()
+                
+                released.append((int(video_id), settings))
+                in_flight += 1
+        
+        for video_id, settings in released:
+            FairDispatcher._start(video_id, settings)
+        
+        return len(released)
+    
+    @staticmethod
+    def _pick(r, eligible):
+        """One smooth weighted round robin step over the eligible users"""
+        credits = {
+            user_id: float(r.hget(CREDITS_KEY, user_id) or 0) + weight
+            for user_id, weight in eligible.items()
+        }
+        chosen = max(credits, key=lambda user_id: (credits[user_id], -int(user_id)))
+        credits[chosen] -= sum(eligible.values())
+        
+        pipe = r.pipeline()
+        for user_id, credit in credits.items():
+            pipe.hset(CREDITS_KEY, user_id, credit)
+        pipe.execute()
+        
+        return chosen
+    
+    @staticmethod
+    def _start(video_id, settings):
+        from app.tasks.video_tasks import process_video_task
+        from app.services.admission_service import AdmissionController
+        
+        video = Video.query.get(video_id)
+        if not video or not FairDispatcher._startable(video, settings):
+            FairDispatcher.release(video_id)
+            return
+        
+        # Under queue pressure the job runs with its plan's cheaper settings
+        # (an upgrade pass keeps the degradation of the clips still shown)
+        settings, degradation = AdmissionController.admit(video, settings)
+        if not settings.get('upgrade_pass'):
+            video.degradation = degradation
+            video.upgrade_status = None
+        
+        task = process_video_task.delay(video_id, settings)
+        video.task_id = task.id
+        db.session.commit()
+    
+    @staticmethod
+    def _startable(video, settings):
+        """Still waiting for this run (an upgrade pass runs beside the completed video)"""
+        if settings.get('upgrade_pass'):
+            return video.status == 'completed' and video.upgrade_status == 'queued'
+        return video.status == 'queued'
+    
+    @staticmethod
+    def reconcile():
+        """
+        Free slots held by jobs that already reached a final state (e.g. the
+        worker died before releasing) and release pending work
+        """
+        r = get_redis()
+        in_flight = [int(video_id) for video_id in r.smembers(INFLIGHT_ALL_KEY)]
+        
+        if in_flight:
+            finished = Video.query.with_entities(Video.id).filter(
+                Video.id.in_(in_flight),
+                Video.status.notin_(['queued', 'processing', 'cancelling']),
+                Video.upgrade_status.is_(None)
+            ).all()
+            for (video_id,) in finished:
+                FairDispatcher.release(video_id)
+        
+        return FairDispatcher.dispatch()
+    
+    @staticmethod
+    def queue_info(video_id):
+        """
+        Queue position and estimated start of a pending video
+        Replays the round robin over the current pending lists; per-user caps
+        are ignored, so the estimate is optimistic for users at their cap.
+        """
+        r = get_redis()
+        video_id = str(video_id)
+        user_id = r.hget(OWNERS_KEY, video_id)
+        
+        if user_id is None:
+            return None
+        
+        if r.sismember(INFLIGHT_ALL_KEY, video_id):
+            return {'position': 0, 'estimated_start': datetime.utcnow().isoformat()}
+        
+        pending = {
+            uid: r.lrange(PENDING_KEY.format(user_id=uid), 0, -1)
+            for uid in r.smembers(USERS_KEY)
+        }
+        credits = {uid: float(r.hget(CREDITS_KEY, uid) or 0) for uid in pending}
+        weights = {uid: FairDispatcher._plan_limits(r.hget(PLANS_KEY, uid))[0] for uid in pending}
+        
+        position = 0
+        while any(pending.values()):
+            eligible = [uid for uid, videos in pending.items() if videos]
+            for uid in eligible:
+                credits[uid] += weights[uid]
+            chosen = max(eligible, key=lambda uid: (credits[uid], -int(uid)))
+            credits[chosen] -= sum(weights[uid] for uid in eligible)
+            
+            position += 1
+            if pending[chosen].pop(0) == video_id:
+                break
+        else:
+            return None
+        
+        max_in_flight = current_app.config.get('DISPATCH_MAX_IN_FLIGHT', 4)
+        waves = math.ceil(position / max_in_flight)
+        wait_seconds = waves * FairDispatcher.average_job_seconds()
+        
+        return {
+            'position': position,
+            'estimated_start': (datetime.utcnow() + timedelta(seconds=wait_seconds)).isoformat()
+        }
+    
+    @staticmethod
+    def average_job_seconds():
+        """Average processing time of recent completed videos"""
+        recent = Video.query.with_entities(
+            Video.processing_started_at, Video.processing_completed_at
+        ).filter(
+            Video.status == 'completed',
+            Video.processing_started_at.isnot(None),
+            Video.processing_completed_at.isnot(None)
+        ).order_by(Video.processing_completed_at.desc()).limit(50).all()
+        
+        if not recent:
+            return current_app.config.get('DISPATCH_DEFAULT_JOB_SECONDS', 300)
+        
+        total = sum((done - started).total_seconds() for started, done in recent)
+        return total / len(recent)
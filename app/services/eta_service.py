@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+ETA Service
+Per-stage durations of finished jobs are stored with their cost drivers
+(video duration, resolution, Whisper model, x264 preset, clip count) and a
+least-squares model per stage predicts the remaining time of running and
+queued jobs
+"""
+import json
+import math
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from app import db
+from app.models import Video, StageTimingSample
+from app.utils.redis_client import get_redis
+from app.services.progress_service import ProgressService
+
+
+MODEL_KEY = 'eta:model:{stage}:{group}'
+
+# Regression features of each stage
+STAGE_FEATURES = {
+    'extract_audio': lambda d: [1.0, d['video_duration']],
+    'analyze_sentiment': lambda d: [1.0, d['video_duration']],
+    'transcribe': lambda d: [1.0, d['video_duration']],
+    'select_clips': lambda d: [1.0, d['video_duration']],
+    'render_clip': lambda d: [1.0, d['clip_duration'], d['clip_duration'] * d['megapixels']],
+    'finalize': lambda d: [1.0, d['clip_count']]
+}
+
+# Stages fitted separately per value of a driver (when there is enough history)
+GROUP_BY = {
+    'transcribe': 'whisper_model',
+    'render_clip': 'render_preset'
+}
+
+# Pipeline order; stages in the same group run in parallel
+STAGE_GROUPS = [
+    ['extract_audio'],
+    ['analyze_sentiment', 'transcribe'],
+    ['select_clips'],
+    ['render_clip'],
+    ['finalize']
+]
+
+# Stages a sharded run replaces with analyze_shard_<n> tasks and a merge
+SHARDED_STAGES = ('extract_audio', 'analyze_sentiment', 'transcribe')
+
+# Rough seconds per source second (per clip second for renders) until a stage has history
+FALLBACK_RATES = {
+    'extract_audio': 0.02,
+    'analyze_sentiment': 0.05,
+    'transcribe': 0.5,
+    'select_clips': 0.01,
+    'render_clip': 2.0,
+    'finalize': 0.0
+}
+
+
+class EtaService:
+    """Stage timing history and completion time predictions"""
+    
+    @staticmethod
+    def applied_settings(video):
+        """
+        Settings the job runs (or ran) with: the requested ones with the
+        values admission control lowered (video.degradation) applied
+        """
+        settings = dict(video.settings or {})
+        if video.status != 'queued':
+            changes = (video.degradation or {}).get('changes') or {}
+            settings.update({key: change['applied'] for key, change in changes.items()})
+        return settings
+    
+    @staticmethod
+    def drivers(video, settings=None):
+        """Cost drivers of a job (of the applied settings unless others are given)"""
+        settings = settings if settings is not None else EtaService.applied_settings(video)
+        
+        if settings.get('mode') == 'manual':
+            clip_count = 1
+        else:
+            clip_count = int(settings.get('num_clips') or 3)
+        
+        # Renders are scaled down to render_height when it is lower
+        width, height = video.width, video.height
+        render_height = settings.get('render_height')
+        if render_height and height and int(render_height) < height:
+            width = int(round((width or 0) * int(render_height) / height))
+            height = int(render_height)
+        
+        return {
+            'video_duration': float(video.duration or 0),
+            'width': width,
+            'height': height,
+            'megapixels': (width or 0) * (height or 0) / 1e6,
+            'whisper_model': settings.get('whisper_model') or current_app.config.get('WHISPER_MODEL', 'base'),
+            'render_preset': settings.get('render_preset') or 'medium',
+            'clip_count': clip_count,
+            'clip_duration': float(current_app.config.get('ETA_DEFAULT_CLIP_SECONDS', 45))
+        }
+    
+    @staticmethod
+    def stage_timings(video):
+        """
+        video.stage_timings with the stages a sharded run replaced mapped
+        from its shards: done, with the wall time of the slowest shard and
+        marked 'sharded'
+        """
+        timings = dict(video.stage_timings or {})
+        shards = [
+            timing['seconds'] for stage, timing in timings.items()
+            if stage.startswith('analyze_shard_')
+        ]
+        if shards:
+            for stage in SHARDED_STAGES:
+                timings.setdefault(stage, {'seconds': max(shards), 'sharded': True})
+        return timings
+    
+    @staticmethod
+    def record(video):
+        """Store the stage timings of a finished job as samples"""
+        drivers = EtaService.drivers(video)
+        clips = {
+            (clip.clip_metadata or {}).get('index'): clip
+            for clip in video.clips
+        }
+        
+        samples = 0
+        for stage, timing in EtaService.stage_timings(video).items():
+            # A shard mixes three stages over part of the video: not a sample of any
+            if timing.get('skipped') or timing.get('sharded'):
+                continue
+            
+            clip_duration = None
+            if stage.startswith('render_clip_'):
+                clip = clips.get(int(stage.rsplit('_', 1)[1]))
+                if not clip:
+                    continue
+                stage, clip_duration = 'render_clip', clip.duration
+            
+            if stage not in STAGE_FEATURES:
+                continue
+            
+            db.session.add(StageTimingSample(
+                video_id=video.id,
+                stage=stage,
+                seconds=timing['seconds'],
+                video_duration=drivers['video_duration'],
+                width=drivers['width'],
+                height=drivers['height'],
+                whisper_model=drivers['whisper_model'],
+                render_preset=drivers['render_preset'],
+                clip_count=len(clips),
+                clip_duration=clip_duration
+            ))
+            samples += 1
+        
+        db.session.commit()
+        return samples
+    
+    @staticmethod
+    def _sample_drivers(sample):
+        return {
+            'video_duration': sample.video_duration or 0,
+            'megapixels': (sample.width or 0) * (sample.height or 0) / 1e6,
+            'clip_count': sample.clip_count or 0,
+            'clip_duration': sample.clip_duration or 0
+        }
+    
+    @staticmethod
+    def fit(stage, group=None):
+        """
+        Least-squares coefficients of a stage from its recent samples
+        Falls back to the stage's mean (intercept only) with little history,
+        and returns None without any.
+        """
+        limit = current_app.config.get('ETA_HISTORY_SAMPLES', 500)
+        query = StageTimingSample.query.filter_by(stage=stage)
+        if group is not None:
+            query = query.filter(getattr(StageTimingSample, GROUP_BY[stage]) == group)
+        samples = query.order_by(StageTimingSample.created_at.desc()).limit(limit).all()
+        
+        if not samples:
+            return None
+        
+        features = STAGE_FEATURES[stage]
+        X = np.array([features(EtaService._sample_drivers(sample)) for sample in samples], dtype=float)
+        y = np.array([sample.seconds for sample in samples], dtype=float)
+        
+        coefficients = [0.0] * X.shape[1]
+        if len(samples) < X.shape[1] + current_app.config.get('ETA_MIN_EXTRA_SAMPLES', 5):
+            coefficients[0] = float(y.mean())
+        else:
+            coefficients = np.linalg.lstsq(X, y, rcond=None)[0].tolist()
+        
+        return {'coefficients': coefficients, 'samples': len(samples)}
+    
+    @staticmethod
+    def model(stage, group=None, cache=None):
+        """Fitted model of a stage (cached in Redis for ETA_MODEL_TTL)"""
+        key = MODEL_KEY.format(stage=stage, group=group or '*')
+        if cache is not None and key in cache:
+            return cache[key]
+        
+        r = get_redis()
+        raw = r.get(key)
+        if raw is not None:
+            model = json.loads(raw)
+        else:
+            model = EtaService.fit(stage, group)
+            # A small group falls back to the stage-wide model
+            if group is not None and (model is None or model['samples'] < current_app.config.get('ETA_MIN_GROUP_SAMPLES', 20)):
+                model = EtaService.model(stage, cache=cache)
+            r.set(key, json.dumps(model), ex=current_app.config.get('ETA_MODEL_TTL', 600))
+        
+        if cache is not None:
+            cache[key] = model
+        return model
+    
+    @staticmethod
+    def predict_stage(stage, drivers, cache=None):
+        """Predicted seconds of one run of a stage"""
+        group = drivers.get(GROUP_BY[stage]) if stage in GROUP_BY else None
+        model = EtaService.model(stage, group, cache=cache)
+        
+        if model is None:
+            base = drivers['clip_duration'] if stage == 'render_clip' else drivers['video_duration']
+            return FALLBACK_RATES[stage] * base
+        
+        features = STAGE_FEATURES[stage](drivers)
+        return max(0.0, float(np.dot(model['coefficients'], features)))
+    
+    @staticmethod
+    def predict(video, settings=None, start=None, cache=None):
+        """
+        Remaining time of a job, per stage
+        Stages already in video.stage_timings count as done (renders by the
+        clips saved so far); renders are spread over ETA_RENDER_PARALLELISM
+        workers.
+        
+        Returns: dict with predicted_seconds, predicted_completion and stages
+        """
+        drivers = EtaService.drivers(video, settings)
+        timings = EtaService.stage_timings(video) if video.status == 'processing' else {}
+        start = start or datetime.utcnow()
+        parallelism = max(1, current_app.config.get('ETA_RENDER_PARALLELISM', 2))
+        
+        stages = []
+        elapsed = 0.0
+        for group in STAGE_GROUPS:
+            group_seconds = 0.0
+            for stage in group:
+                if stage == 'render_clip':
+                    done = video.clips.count() if 'select_clips' in timings else 0
+                    remaining = max(0, drivers['clip_count'] - done)
+                    seconds = EtaService.predict_stage(stage, drivers, cache) * math.ceil(remaining / parallelism)
+                    status = 'done' if done and not remaining else 'pending'
+                elif stage in timings:
+                    seconds, status = 0.0, 'done'
+                else:
+                    seconds, status = EtaService.predict_stage(stage, drivers, cache), 'pending'
+                
+                group_seconds = max(group_seconds, seconds)
+                stages.append({
+                    'stage': stage,
+                    'status': status,
+                    'predicted_seconds': round(seconds, 1),
+                    'eta': (start + timedelta(seconds=elapsed + seconds)).isoformat()
+                })
+            elapsed += group_seconds
+        
+        return {
+            'predicted_seconds': round(elapsed, 1),
+            'predicted_completion': (start + timedelta(seconds=elapsed)).isoformat(),
+            'stages': stages
+        }
+    
+    @staticmethod
+    def refresh(video):
+        """
+        Recompute a running job's ETA and cache it next to its progress
+        (an upgrade pass runs behind a completed video: nothing to show)
+        """
+        if video.upgrade_status:
+            return
+        try:
+            ProgressService.set_eta(video.id, EtaService.predict(video))
+        except Exception as e:
+            # Predictions must never fail the job
+            print(f"ETA update failed for video {video.id}: {e}")
+    
+    @staticmethod
+    def capacity():
+        """Estimated time to drain the current backlog (queued + running jobs)"""
+        cache = {}
+        videos = Video.query.filter(Video.status.in_(['queued', 'processing'])).all()
+        
+        work = {'queued': 0.0, 'processing': 0.0}
+        for video in videos:
+            work[video.status] += EtaService.predict(video, cache=cache)['predicted_seconds']
+        
+        slots = current_app.config.get('DISPATCH_MAX_IN_FLIGHT', 4)
+        drain_seconds = (work['queued'] + work['processing']) / slots
+        
+        return {
+            'queued_jobs': sum(1 for video in videos if video.status == 'queued'),
+            'processing_jobs': sum(1 for video in videos if video.status == 'processing'),
+            'queued_work_seconds': round(work['queued'], 1),
+            'processing_work_seconds': round(work['processing'], 1),
+            'slots': slots,
+            'drain_seconds': round(drain_seconds, 1),
+            'drained_at': (datetime.utcnow() + timedelta(seconds=drain_seconds)).isoformat(),
+            'history_samples': {
+                stage: count
+                for stage, count in db.session.query(
+                    StageTimingSample.stage, db.func.count(StageTimingSample.id)
+                ).group_by(StageTimingSample.stage).all()
+            }
+        }
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+HLS Packaging Service
+Segments rendered clips into fMP4 HLS for in-browser preview
+"""
+import shutil
+import subprocess
+from pathlib import Path
+from flask import current_app
+
+
+PLAYLIST_NAME = 'index.m3u8'
+INIT_SEGMENT_NAME = 'init.mp4'
+
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4'
+}
+
+
+class HLSService:
+    """Package clips as HLS (stream copy, no re-encode)"""
+    
+    @staticmethod
+    def is_enabled():
+        return current_app.config.get('ENABLE_HLS_PREVIEW', False)
+    
+    @staticmethod
+    def keyframe_params():
+        """
+        Extra ffmpeg params for the render so every segment starts on a
+        keyframe and the first segment is short enough to start playback
+        """
+        if not HLSService.is_enabled():
+            return []
+        
+        segment_seconds = current_app.config.get('HLS_SEGMENT_SECONDS', 4)
+        return ['-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})']
+    
+    @staticmethod
+    def package(clip_path, package_name):
+        """
+        Segment an encoded clip into HLS
+        
+        Args:
+            clip_path: Rendered MP4 file
+            package_name: Directory under HLS_FOLDER (unique per clip, e.g. '<video id>/<clip stem>')
+        
+        Returns: metadata dict stored in Clip.clip_metadata['hls']
+        """
+        segment_seconds = current_app.config.get('HLS_SEGMENT_SECONDS', 4)
+        output_dir = Path(current_app.config['HLS_FOLDER']) / package_name
+        
+        # Re-packaging replaces the previous output
+        if output_dir.exists():
+            shutil.rmtree(output_dir, ignore_errors=True)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        command = [
+            current_app.config.get('FFMPEG_BINARY', 'ffmpeg'),
+            '-y', '-v', 'error',
+            '-i', str(clip_path),
+            '-c', 'copy',
+            '-f', 'hls',
+            '-hls_time', str(segment_seconds),
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', INIT_SEGMENT_NAME,
+            '-hls_segment_filename', str(output_dir / 'seg_%04d.m4s'),
+            str(output_dir / PLAYLIST_NAME)
+        ]
+        
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            raise RuntimeError(f"HLS packaging failed: {result.stderr.strip()}")
+        
+        return {
+            'path': str(output_dir),
+            'playlist': PLAYLIST_NAME,
+            'segment_seconds': segment_seconds
+        }
+    
+    @staticmethod
+    def resolve_file(hls_metadata, filename):
+        """Resolve a playlist/segment name inside the package (None if outside)"""
+        if not hls_metadata or not hls_metadata.get('path'):
+            return None
+        
+        package_dir = Path(hls_metadata['path']).resolve()
+        file_path = (package_dir / filename).resolve()
+        
+        if package_dir not in file_path.parents or not file_path.is_file():
+            return None
+        
+        return file_path
+    
+    @staticmethod
+    def remove_package(hls_metadata):
+        """Delete a packaged preview"""
+        if hls_metadata and hls_metadata.get('path'):
+            shutil.rmtree(hls_metadata['path'], ignore_errors=True)
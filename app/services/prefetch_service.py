@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Input Prefetch Service
+When a worker reserves a task that reads the source video, a background
+thread in the worker's main process downloads the S3 input into the node's
+input cache (or temp folder) while the current job still computes. Stage processes then find
+the input already staged (or wait for the transfer in flight instead of
+starting a second one).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from flask import current_app
+from app import db
+from app.models import Video
+from app.utils.file_handler import download_from_s3
+from app.services.source_service import SourceService
+from app.services.cache_service import InputCache
+
+
+# Tasks whose stage reads the source video
+PREFETCH_TASKS = ('tasks.process_video', 'tasks.extract_audio', 'tasks.analyze_shard', 'tasks.render_clip')
+
+PREFETCH_SUFFIX = '.prefetch.part'
+
+_executor = None
+_scheduled = set()
+_lock = threading.Lock()
+
+
+def input_path(temp_dir, video_id):
+    """Where the S3 input of a video is staged (VideoProcessor.video_path)"""
+    return Path(temp_dir) / f"{video_id}_input.mp4"
+
+
+class InputPrefetcher:
+    """Background downloads of reserved jobs' inputs into a bounded staging area"""
+    
+    @staticmethod
+    def on_task_received(app, request):
+        """celery task_received handler: schedule the task's input download"""
+        if request.name not in PREFETCH_TASKS or not app.config.get('INPUT_PREFETCH_ENABLED', True):
+            return
+        
+        kwargs = request.kwargs or {}
+        video_id = kwargs.get('video_id') or (request.args[0] if request.args else None)
+        if video_id is None:
+            return
+        
+        global _executor
+        with _lock:
+            if video_id in _scheduled:
+                return
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app.config.get('PREFETCH_THREADS', 2),
+                    thread_name_prefix='input-prefetch'
+                )
+            _scheduled.add(video_id)
+        
+        _executor.submit(InputPrefetcher._prefetch, app, video_id)
+    
+    @staticmethod
+    def staged_bytes(temp_dir):
+        """Bytes used by staged and in-flight inputs"""
+        total = 0
+        for pattern in ('*_input.mp4', f'*_input.mp4{PREFETCH_SUFFIX}'):
+            for path in Path(temp_dir).glob(pattern):
+                try:
+                    total += path.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return total
+    
+    @staticmethod
+    def _prefetch(app, video_id):
+        try:
+            with app.app_context():
+                try:
+                    video = Video.query.get(video_id)
+                    # Inputs read with ranged GETs are never downloaded whole
+                    if not video or not video.s3_key or SourceService.is_streamable(video):
+                        return
+                    
+                    # With the input cache the stage links the cached copy
+                    # (and waits on its lock while this download runs)
+                    if InputCache.is_enabled():
+                        started = time.monotonic()
+                        InputCache.fetch(video.s3_key)
+                        print(f"Prefetched video {video_id} into the input cache in {time.monotonic() - started:.1f}s")
+                        return
+                    
+                    temp_dir = Path(app.config['TEMP_FOLDER'])
+                    temp_dir.mkdir(parents=True, exist_ok=True)
+                    path = input_path(temp_dir, video_id)
+                    partial_path = path.with_name(path.name + PREFETCH_SUFFIX)
+                    if path.exists() or partial_path.exists():
+                        return
+                    
+                    # Bounded staging area: skip (the stage downloads itself) when full
+                    size = int((video.file_size_mb or 0) * 1024 * 1024)
+                    if InputPrefetcher.staged_bytes(temp_dir) + size > app.config.get('PREFETCH_MAX_BYTES', 10 * 1024 ** 3):
+                        print(f"Prefetch of video {video_id} skipped: staging area full")
+                        return
+                    
+                    started = time.monotonic()
+                    try:
+                        download_from_s3(video.s3_key, partial_path)
+                        os.replace(partial_path, path)
+                    except Exception:
+                        partial_path.unlink(missing_ok=True)
+                        raise
+                    
+                    print(f"Prefetched video {video_id} in {time.monotonic() - started:.1f}s")
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            print(f"Prefetch of video {video_id} failed: {e}")
+        finally:
+            with _lock:
+                _scheduled.discard(video_id)
+    
+    @staticmethod
+    def wait_for(path):
+        """
+        Wait for an in-flight prefetch of <path>
+        Returns True once the file is staged, False if there is no live
+        prefetch (the caller downloads it itself)
+        """
+        partial_path = Path(path).with_name(Path(path).name + PREFETCH_SUFFIX)
+        stall_seconds = current_app.config.get('PREFETCH_STALL_SECONDS', 30)
+        
+        while True:
+            if Path(path).exists():
+                return True
+            try:
+                idle = time.time() - partial_path.stat().st_mtime
+            except FileNotFoundError:
+                return Path(path).exists()
+            
+            # A prefetch that stopped writing (e.g. its worker died) is abandoned
+            if idle > stall_seconds:
+                return False
+            time.sleep(0.5)
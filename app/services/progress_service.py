@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Progress Service
+Publishes processing progress once to Redis: the latest state lives in a
+hash (one read for polling) and every update goes to a pub/sub channel
+that the SSE endpoint streams to browsers
+"""
+import json
+import time
+from datetime import datetime
+from flask import current_app
+from app.utils.redis_client import get_redis
+
+
+STATE_KEY = 'progress:{video_id}'
+CHANNEL_KEY = 'progress:{video_id}:events'
+THROTTLE_KEY = 'progress:{video_id}:throttle'
+ETA_KEY = 'progress:{video_id}:eta'
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled', 'rejected')
+
+
+class ProgressService:
+    """Coalesced progress events for videos"""
+    
+    @staticmethod
+    def publish(video, stage, progress, status='processing', force=False, **extra):
+        """
+        Store and broadcast the progress of a video
+        Updates closer than PROGRESS_MIN_INTERVAL are dropped (across all
+        workers), except status changes, stage changes and forced updates:
+        a dropped update is only ever a newer percentage of the stage shown.
+        """
+        r = get_redis()
+        interval_ms = int(current_app.config.get('PROGRESS_MIN_INTERVAL', 1.0) * 1000)
+        key = STATE_KEY.format(video_id=video.id)
+        
+        if not force and not r.set(THROTTLE_KEY.format(video_id=video.id), 1, px=interval_ms, nx=True):
+            # Parallel stages (e.g. sentiment and transcription) start within the interval
+            stored = r.hget(key, 'stage')
+            if stored is not None and json.loads(stored) == stage:
+                return False
+        
+        state = {
+            'video_id': video.id,
+            'user_id': video.user_id,
+            'status': status,
+            'stage': stage,
+            'progress': progress,
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        state.update(extra)
+        
+        pipe = r.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={field: json.dumps(value) for field, value in state.items()})
+        pipe.expire(key, current_app.config.get('PROGRESS_TTL', 86400))
+        pipe.publish(CHANNEL_KEY.format(video_id=video.id), json.dumps(state))
+        pipe.execute()
+        
+        return True
+    
+    @staticmethod
+    def publish_status(video, stage=None, progress=None):
+        """Broadcast a status change (never coalesced)"""
+        if progress is None:
+            progress = 100 if video.status == 'completed' else 0
+        
+        if video.status in TERMINAL_STATUSES:
+            ProgressService.clear_eta(video.id)
+        
+        return ProgressService.publish(
+            video,
+            stage or video.status.capitalize(),
+            progress,
+            status=video.status,
+            force=True,
+            error_message=video.error_message
+        )
+    
+    @staticmethod
+    def _decode(raw):
+        return {field: json.loads(value) for field, value in raw.items()}
+    
+    @staticmethod
+    def set_eta(video_id, eta):
+        """Store the predicted completion of a running job (read with its state)"""
+        get_redis().set(
+            ETA_KEY.format(video_id=video_id),
+            json.dumps(eta),
+            ex=current_app.config.get('PROGRESS_TTL', 86400)
+        )
+    
+    @staticmethod
+    def clear_eta(video_id):
+        get_redis().delete(ETA_KEY.format(video_id=video_id))
+    
+    @staticmethod
+    def get(video_id):
+        """Latest progress state (None if nothing was published recently)"""
+        return ProgressService.get_many([video_id]).get(video_id)
+    
+    @staticmethod
+    def get_many(video_ids):
+        """Latest progress states (with ETA) of many videos in one pipelined round trip"""
+        pipe = get_redis().pipeline(transaction=False)
+        for video_id in video_ids:
+            pipe.hgetall(STATE_KEY.format(video_id=video_id))
+            pipe.get(ETA_KEY.format(video_id=video_id))
+        results = pipe.execute()
+        
+        states = {}
+        for video_id, raw, eta in zip(video_ids, results[0::2], results[1::2]):
+            if raw:
+                states[video_id] = ProgressService._decode(raw)
+                if eta:
+                    states[video_id]['eta'] = json.loads(eta)
+        
+        return states
+    
+    @staticmethod
+    def stream(video_id):
+        """
+        Server-Sent Events generator
+        Sends the current state, then every published update, until the job
+        ends or SSE_MAX_STREAM_SECONDS passes (EventSource reconnects)
+        """
+        r = get_redis()
+        heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+        deadline = time.monotonic() + current_app.config.get('SSE_MAX_STREAM_SECONDS', 300)
+        
+        # Subscribe before reading the state so no update falls in between
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(CHANNEL_KEY.format(video_id=video_id))
+        
+        try:
+            yield 'retry: 3000\n\n'
+            
+            state = ProgressService.get(video_id)
+            if state:
+                yield f"data: {json.dumps(state)}\n\n"
+                if state.get('status') in TERMINAL_STATUSES:
+                    return
+            
+            while time.monotonic() < deadline:
+                message = pubsub.get_message(timeout=heartbeat)
+                if message is None:
+                    yield ': keepalive\n\n'
+                    continue
+                
+                yield f"data: {message['data']}\n\n"
+                
+                if json.loads(message['data']).get('status') in TERMINAL_STATUSES:
+                    return
+        finally:
+            pubsub.close()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Shard Service
+Long videos are analyzed in overlapping time shards on several workers.
+Each shard owns the middle of its range (keep_start..keep_end); the overlap
+only gives Whisper context at the cut, and the merge keeps each word from
+the shard that owns its midpoint.
+"""
+import math
+from flask import current_app
+from core.analysis import classify_energy
+
+
+class ShardService:
+    """Shard planning, per-shard audio and result merging"""
+    
+    @staticmethod
+    def plan(video):
+        """
+        Time shards of a video, or None to process it in one piece
+        Count: one shard per SHARD_TARGET_SECONDS, capped by the analysis
+        slots not taken by other running jobs.
+        """
+        from app.services.dispatch_service import FairDispatcher
+        
+        duration = float(video.duration or 0)
+        if not current_app.config.get('SHARDING_ENABLED', True) or \
+                duration < current_app.config.get('SHARD_MIN_DURATION', 1800):
+            return None
+        
+        _, in_flight = FairDispatcher.load()
+        slots = current_app.config.get('SHARD_MAX_SHARDS', 4)
+        available = max(2, slots - max(0, in_flight - 1))
+        
+        count = min(math.ceil(duration / current_app.config.get('SHARD_TARGET_SECONDS', 600)), available)
+        if count < 2:
+            return None
+        
+        overlap = current_app.config.get('SHARD_OVERLAP_SECONDS', 10)
+        bounds = [duration * i / count for i in range(count + 1)]
+        
+        return [
+            {
+                'index': i,
+                'count': count,
+                'start': max(0.0, bounds[i] - overlap),
+                'end': min(duration, bounds[i + 1] + overlap),
+                'keep_start': bounds[i],
+                'keep_end': bounds[i + 1]
+            }
+            for i in range(count)
+        ]
+    
+    @staticmethod
+    def shift_segments(segments, offset):
+        """Move shard-relative Whisper timestamps to video time"""
+        for segment in segments:
+            segment['start'] += offset
+            segment['end'] += offset
+            for word in segment.get('words', []):
+                word['start'] += offset
+                word['end'] += offset
+        return segments
+    
+    @staticmethod
+    def _owns(shard, start, end):
+        middle = (start + end) / 2
+        is_last = shard['index'] == shard['count'] - 1
+        return shard['keep_start'] <= middle and (middle < shard['keep_end'] or is_last)
+    
+    @staticmethod
+    def merge_transcripts(shard_results):
+        """
+        One transcription from the shards' segments
+        Words in an overlap are kept only from the shard that owns them, and
+        segments cut that way are rebuilt from their remaining words.
+        """
+        merged = []
+        
+        for result in sorted(shard_results, key=lambda result: result['shard']['index']):
+            shard = result['shard']
+            
+            for segment in result['segments']:
+                words = segment.get('words')
+                
+                if not words:
+                    if ShardService._owns(shard, segment['start'], segment['end']):
+                        merged.append(segment)
+                    continue
+                
+                kept = [word for word in words if ShardService._owns(shard, word['start'], word['end'])]
+                if not kept:
+                    continue
+                
+                if len(kept) < len(words):
+                    segment = dict(segment)
+                    segment['words'] = kept
+                    segment['text'] = ''.join(word['word'] for word in kept)
+                    segment['start'] = kept[0]['start']
+                    segment['end'] = kept[-1]['end']
+                    segment.pop('tokens', None)
+                
+                merged.append(segment)
+        
+        merged.sort(key=lambda segment: segment['start'])
+        for index, segment in enumerate(merged):
+            segment['id'] = index
+        
+        return merged
+    
+    @staticmethod
+    def merge_sentiment(shard_results):
+        """
+        Video-level sentiment from the shards (weighted by owned duration),
+        plus the per-shard feature track
+        """
+        track = []
+        total = energy = pitch = 0.0
+        confidence = 1.0
+        
+        for result in sorted(shard_results, key=lambda result: result['shard']['index']):
+            shard, sentiment = result['shard'], result['sentiment']
+            weight = shard['keep_end'] - shard['keep_start']
+            
+            total += weight
+            energy += sentiment['energy'] * weight
+            pitch += sentiment['pitch_mean'] * weight
+            confidence = min(confidence, sentiment['confidence'])
+            
+            track.append({
+                'start': shard['keep_start'],
+                'end': shard['keep_end'],
+                'sentiment': sentiment['sentiment'],
+                'energy': sentiment['energy'],
+                'pitch_mean': sentiment['pitch_mean']
+            })
+        
+        energy = energy / total if total else 0.0
+        
+        return {
+            'sentiment': classify_energy(energy),
+            'energy': energy,
+            'pitch_mean': pitch / total if total else 0.0,
+            'confidence': confidence,
+            'shards': track
+        }
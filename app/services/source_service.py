@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Source Service
+S3 inputs are read by ffmpeg through presigned URLs, so a stage only fetches
+the byte ranges it decodes instead of downloading the whole video first.
+That needs the container's index: an MP4 whose moov atom can be found from
+the top-level box headers is seekable over ranged GETs (wherever moov sits);
+fragmented MP4s and other containers fall back to a full download.
+"""
+import struct
+from flask import current_app
+from app.utils.redis_client import get_redis
+from app.utils.file_handler import get_s3_object_size, read_s3_range, generate_s3_presigned_url
+
+
+LAYOUT_KEY = 'source:layout:{s3_key}'
+
+# moov before / after the media data; both seek with one extra request at most
+STREAMABLE_LAYOUTS = ('faststart', 'moov_at_end')
+
+# Top-level boxes read before giving up on finding moov
+MAX_TOP_LEVEL_BOXES = 64
+
+
+def mp4_layout(read_range, size):
+    """
+    Layout of an ISO BMFF (MP4/MOV) file from its top-level box headers
+    read_range(offset, length) returns the bytes at offset; each header is
+    one small read, so this costs a handful of ranged GETs.
+    
+    Returns: 'faststart', 'moov_at_end', 'fragmented', or None when the file
+    is not an MP4 with a moov atom
+    """
+    boxes = []
+    offset = 0
+    
+    while offset < size and len(boxes) < MAX_TOP_LEVEL_BOXES:
+        header = read_range(offset, 16)
+        if len(header) < 8:
+            break
+        
+        box_size, box_type = struct.unpack('>I4s', header[:8])
+        if box_size == 1 and len(header) >= 16:
+            box_size = struct.unpack('>Q', header[8:16])[0]
+        elif box_size == 0:
+            box_size = size - offset  # Box runs to the end of the file
+        if box_size < 8:
+            return None
+        
+        boxes.append(box_type.decode('latin-1'))
+        offset += box_size
+    
+    if not boxes or boxes[0] != 'ftyp' or 'moov' not in boxes:
+        return None
+    if 'moof' in boxes:
+        return 'fragmented'
+    if 'mdat' in boxes and boxes.index('moov') > boxes.index('mdat'):
+        return 'moov_at_end'
+    return 'faststart'
+
+
+class SourceService:
+    """How processing stages read an S3 input"""
+    
+    @staticmethod
+    def layout(s3_key):
+        """Container layout of an S3 object (cached; keys are never overwritten)"""
+        r = get_redis()
+        key = LAYOUT_KEY.format(s3_key=s3_key)
+        
+        cached = r.get(key)
+        if cached is not None:
+            return cached or None
+        
+        size = get_s3_object_size(s3_key)
+        layout = mp4_layout(lambda start, length: read_s3_range(s3_key, start, length), size)
+        
+        r.set(key, layout or '', ex=current_app.config.get('S3_LAYOUT_CACHE_TTL', 7 * 86400))
+        return layout
+    
+    @staticmethod
+    def is_streamable(video):
+        """True if stages can read the video's S3 input with ranged GETs"""
+        if not video.s3_key or not current_app.config.get('S3_RANGED_READS', True):
+            return False
+        
+        try:
+            return SourceService.layout(video.s3_key) in STREAMABLE_LAYOUTS
+        except Exception as e:
+            # Unknown layout: download it as before
+            print(f"Layout check failed for {video.s3_key}: {e}")
+            return False
+    
+    @staticmethod
+    def url(video):
+        """Presigned GET URL valid for the length of a stage"""
+        return generate_s3_presigned_url(
+            video.s3_key,
+            expiration=current_app.config.get('S3_READ_URL_EXPIRY', 6 * 3600)
+        )
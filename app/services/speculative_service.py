@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Speculative Pre-processing Service
+Right after upload, the settings-independent stages (audio extraction,
+sentiment features and transcription with the user's default Whisper model)
+run at low priority and record their checkpoints, so /process reuses them.
+The work yields whenever the cluster has real jobs to run.
+"""
+import json
+from contextlib import contextmanager
+from flask import current_app
+from redis.exceptions import LockError
+from app.utils.redis_client import get_redis
+from app.services.dispatch_service import FairDispatcher
+
+
+LOCK_KEY = 'speculative:lock:{video_id}'
+STAGE_KEY = 'speculative:stage:{video_id}'  # {stage, fingerprint} the lock holder computes
+
+
+class Preempted(Exception):
+    """Raised inside speculative work when it must give way to real jobs"""
+
+
+class SpeculativeService:
+    """Low-priority pre-processing of freshly uploaded videos"""
+    
+    @staticmethod
+    def is_enabled():
+        return current_app.config.get('SPECULATIVE_PREPROCESSING', False)
+    
+    @staticmethod
+    def settings_for(user):
+        """Settings /process uses when the request doesn't override them"""
+        return (user.preferences or {}).copy()
+    
+    @staticmethod
+    def cluster_busy():
+        """Real jobs are waiting or SPECULATIVE_BUSY_IN_FLIGHT of them are running"""
+        return FairDispatcher.is_busy(current_app.config.get('SPECULATIVE_BUSY_IN_FLIGHT'))
+    
+    @staticmethod
+    def check(video):
+        """Raise Preempted if the speculative work should stop now"""
+        if SpeculativeService.cluster_busy():
+            raise Preempted(f"Cluster busy, speculative work on video {video.id} yields")
+    
+    @staticmethod
+    def wanted_by_job(video, stage, fingerprint):
+        """
+        True if the submitted job needs exactly this result of <stage>
+        (its settings, as admission control applied them, fingerprint the
+        same), so finishing the speculative stage saves it the work
+        """
+        from app.services.video_processor import VideoProcessor
+        from app.services.eta_service import EtaService
+        
+        settings = EtaService.applied_settings(video)
+        return VideoProcessor(video, settings, video.user).analysis_fingerprints()[stage] == fingerprint
+    
+    @staticmethod
+    @contextmanager
+    def hold(video_id, stage, fingerprint):
+        """
+        Hold the video's speculative lock while a stage runs, so a real
+        stage that needs the same result retries later instead of computing
+        it twice. Yields renew(), to call between long steps (e.g. Whisper
+        windows): it extends the lock and raises Preempted if it was lost.
+        """
+        r = get_redis()
+        timeout = current_app.config.get('SPECULATIVE_LOCK_TIMEOUT', 1800)
+        lock = r.lock(LOCK_KEY.format(video_id=video_id), timeout=timeout)
+        if not lock.acquire(blocking=False):
+            raise Preempted(f"Video {video_id} is already being pre-processed")
+        
+        stage_key = STAGE_KEY.format(video_id=video_id)
+        r.set(stage_key, json.dumps({'stage': stage, 'fingerprint': fingerprint}), ex=timeout)
+        
+        def renew():
+            try:
+                lock.reacquire()
+            except LockError:
+                raise Preempted(f"Speculative lock of video {video_id} expired")
+            r.expire(stage_key, timeout)
+        
+        try:
+            yield renew
+        finally:
+            try:
+                if lock.owned():
+                    r.delete(stage_key)
+                lock.release()
+            except LockError:
+                pass  # Expired: the stage outlived SPECULATIVE_LOCK_TIMEOUT
+    
+    @staticmethod
+    def is_running(video_id, stage, fingerprint):
+        """True while a speculative run computes this exact result of <stage>"""
+        if not SpeculativeService.is_enabled():
+            return False
+        
+        running = get_redis().get(STAGE_KEY.format(video_id=video_id))
+        if not running:
+            return False
+        running = json.loads(running)
+        return running.get('stage') == stage and running.get('fingerprint') == fingerprint
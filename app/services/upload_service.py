@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""
+Upload Service
+Upload sessions let the client send large videos straight to object
+storage as an S3 multipart upload with presigned part URLs; the API only
+signs the parts and, on completion, verifies the object and creates the
+Video. With local storage, resumable sessions (tus-style offsets) append
+each chunk to the file on disk and hash it as it arrives when the chunks
+keep landing on the same web worker.
+Every upload, form uploads included, is then ingested by a task: probed,
+checked against the plan and hashed outside the request.
+"""
+import fcntl
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Video, UploadSession
+from app.services.progress_service import ProgressService
+from app.utils.file_handler import (
+    get_s3_client, head_s3_object, generate_s3_presigned_url, generate_unique_filename, delete_file
+)
+from app.utils.validators import validate_upload_metadata, validate_video_properties
+
+
+# S3 multipart limits
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Bytes read from the request (and from disk when rehashing) at a time
+CHUNK_SIZE = 1024 * 1024
+
+# Running SHA-256 of resumable uploads in this process: {session id: (offset, hasher)}
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+MAX_RUNNING_HASHES = 1000
+
+
+class UploadError(Exception):
+    """An upload that fails validation (reported to the client as a 400)"""
+
+
+class UploadOffsetMismatch(UploadError):
+    """A chunk sent for another offset than the session's (409)"""
+    
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadLocked(UploadError):
+    """Another request is appending to the same upload (423)"""
+
+
+class UploadService:
+    """Upload sessions and Video creation from uploaded files"""
+    
+    @staticmethod
+    def check_plan_limits(user, video_metadata):
+        """Error message if the video exceeds the user's plan, else None"""
+        plan_limits = current_app.config['PLANS'][user.plan]
+        max_duration = plan_limits.get('max_video_duration', -1)
+        
+        if max_duration != -1 and video_metadata['duration'] > max_duration:
+            return f"Video too long ({video_metadata['duration']:.0f}s). Max: {max_duration}s for {user.plan} plan"
+        return None
+    
+    @staticmethod
+    def create_video(user, file_info, file_path=None, s3_key=None, content_hash=None):
+        """
+        Video row of a stored upload, 'ingesting' until the ingest task has
+        probed and hashed it (content_hash: already computed, e.g. while a
+        resumable upload arrived)
+        """
+        from app.tasks.video_tasks import ingest_video_task
+        
+        video = Video(
+            user_id=user.id,
+            filename=file_info['secure_filename'],
+            original_filename=file_info['original_filename'],
+            file_size_mb=file_info['file_size_mb'],
+            file_path=file_path,
+            s3_key=s3_key,
+            status='ingesting'
+        )
+        
+        db.session.add(video)
+        db.session.commit()
+        
+        ProgressService.publish(video, 'Waiting for ingest', 0, status='ingesting', force=True)
+        ingest_video_task.delay(video.id, content_hash)
+        return video
+    
+    @staticmethod
+    def ingest(video, content_hash=None):
+        """
+        Probe, validate and hash an 'ingesting' video, then move it to
+        'uploaded' and start speculative pre-processing. A video that fails
+        validation is 'rejected' and its file deleted. Safe to retry: a video
+        already attached to its blob is only finished, never charged twice.
+        Returns: True if the video was accepted
+        """
+        from app.services.dedup_service import DedupService
+        from app.services.speculative_service import SpeculativeService
+        
+        def progress(stage, percent, force=False):
+            ProgressService.publish(video, stage, percent, status='ingesting', force=force)
+        
+        # A retry after the attach only has the last steps left
+        if video.blob_id is None:
+            progress('Reading metadata', 10, force=True)
+            is_valid, error, video_metadata = validate_video_properties(
+                video.file_path or generate_s3_presigned_url(video.s3_key),
+                current_app.config['PLANS'][video.user.plan]
+            )
+            if is_valid:
+                error = UploadService.check_plan_limits(video.user, video_metadata)
+            if error:
+                delete_file(video.file_path, video.s3_key)
+                video.mark_as_rejected(error)
+                return False
+            
+            video.duration = video_metadata['duration']
+            video.width = video_metadata['width']
+            video.height = video_metadata['height']
+            video.fps = video_metadata['fps']
+            video.codec = video_metadata['codec']
+            video.media_info = video_metadata['media_info']
+            db.session.commit()
+            
+            if content_hash is None:
+                progress('Hashing', 20, force=True)
+                callback = lambda fraction: progress('Hashing', 20 + int(fraction * 70))
+                if video.s3_key:
+                    content_hash = DedupService.hash_s3_object(video.s3_key, callback)
+                else:
+                    content_hash = DedupService.hash_file(video.file_path, callback)
+            
+            # Identical uploads share one stored copy
+            progress('Deduplicating', 95, force=True)
+            DedupService.attach(video, content_hash)
+        
+        # Published before the commit: if it fails the video is still
+        # 'ingesting' and the retry finishes here
+        video.status = 'uploaded'
+        video.publish_status()
+        db.session.commit()
+        
+        # Start the settings-independent stages while the user configures the job
+        if SpeculativeService.is_enabled():
+            from app.tasks.video_tasks import speculative_preprocess_task
+            try:
+                speculative_preprocess_task.delay(video.id)
+            except Exception as e:
+                # Only an optimization: /process runs every stage anyway
+                print(f"Speculative pre-processing of video {video.id} not started: {e}")
+        
+        return True
+    
+    @staticmethod
+    def part_size(size):
+        """Part size of a multipart upload (grows past MAX_PARTS parts)"""
+        part_size = max(MIN_PART_SIZE, current_app.config.get('UPLOAD_PART_SIZE', 64 * 1024 * 1024))
+        return max(part_size, math.ceil(size / MAX_PARTS))
+    
+    @staticmethod
+    def part_urls(session, part_numbers=None):
+        """Presigned upload_part URLs: {part number: url}"""
+        s3_client = get_s3_client()
+        part_numbers = part_numbers or range(1, session.part_count + 1)
+        
+        return {
+            number: s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': current_app.config['AWS_BUCKET_NAME'],
+                    'Key': session.s3_key,
+                    'UploadId': session.upload_id,
+                    'PartNumber': number
+                },
+                ExpiresIn=current_app.config.get('UPLOAD_PART_URL_EXPIRY', 6 * 3600)
+            )
+            for number in part_numbers
+            if 1 <= number <= session.part_count
+        }
+    
+    @staticmethod
+    def create_session(user, filename, size, content_type=None):
+        """Validate the declared file and start its S3 multipart upload"""
+        is_valid, error, file_info = validate_upload_metadata(
+            filename, size, current_app.config['MAX_CONTENT_LENGTH']
+        )
+        if not is_valid:
+            raise UploadError(error)
+        
+        s3_key = f"videos/{generate_unique_filename(filename, user.id)}"
+        content_type = content_type or file_info['mime_type']
+        
+        response = get_s3_client().create_multipart_upload(
+            Bucket=current_app.config['AWS_BUCKET_NAME'],
+            Key=s3_key,
+            ContentType=content_type
+        )
+        
+        part_size = UploadService.part_size(size)
+        session = UploadSession(
+            user_id=user.id,
+            original_filename=file_info['original_filename'],
+            filename=file_info['secure_filename'],
+            content_type=content_type,
+            size=size,
+            s3_key=s3_key,
+            upload_id=response['UploadId'],
+            part_size=part_size,
+            part_count=math.ceil(size / part_size),
+            expires_at=datetime.utcnow() + timedelta(seconds=current_app.config.get('UPLOAD_SESSION_TTL', 24 * 3600))
+        )
+        
+        db.session.add(session)
+        db.session.commit()
+        return session
+    
+    @staticmethod
+    def create_resumable(user, filename, size):
+        """Validate the declared file and create its (empty) local upload"""
+        is_valid, error, file_info = validate_upload_metadata(
+            filename, size, current_app.config['MAX_CONTENT_LENGTH']
+        )
+        if not is_valid:
+            raise UploadError(error)
+        
+        upload_folder = Path(current_app.config['UPLOAD_FOLDER'])
+        upload_folder.mkdir(parents=True, exist_ok=True)
+        file_path = upload_folder / generate_unique_filename(filename, user.id)
+        
+        session = UploadSession(
+            user_id=user.id,
+            kind='resumable',
+            original_filename=file_info['original_filename'],
+            filename=file_info['secure_filename'],
+            content_type=file_info['mime_type'],
+            size=size,
+            file_path=str(file_path),
+            offset=0,
+            expires_at=datetime.utcnow() + timedelta(seconds=current_app.config.get('UPLOAD_SESSION_TTL', 24 * 3600))
+        )
+        
+        UploadService.partial_path(session).touch()
+        db.session.add(session)
+        db.session.commit()
+        return session
+    
+    @staticmethod
+    def partial_path(session):
+        """Where a resumable upload's bytes accumulate until it completes"""
+        return Path(f"{session.file_path}.upload")
+    
+    @staticmethod
+    def _running_hash(session):
+        """
+        SHA-256 state of the first session.offset bytes, if this process
+        hashed all of them; None once a chunk went to another web worker
+        (hash state can't move between processes, and rehashing the prefix
+        on every such chunk would be quadratic). The ingest task then
+        hashes the file once instead.
+        """
+        with _hashers_lock:
+            entry = _hashers.pop(session.id, None)
+        
+        if session.offset == 0:
+            return hashlib.sha256()
+        if entry is not None and entry[0] == session.offset:
+            return entry[1]
+        return None
+    
+    @staticmethod
+    def append(session, offset, stream):
+        """
+        Append a chunk at <offset>, streaming it to disk and into the
+        running hash (while this process has it)
+        Bytes received before a dropped connection are kept, so the client
+        resumes from the offset it gets back from HEAD.
+        Returns: the new offset
+        """
+        with open(UploadService.partial_path(session), 'r+b') as upload_file:
+            try:
+                fcntl.flock(upload_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadLocked("Upload is busy with another request")
+            
+            db.session.refresh(session)
+            if offset != session.offset:
+                raise UploadOffsetMismatch(session.offset)
+            
+            hasher = UploadService._running_hash(session)
+            
+            # Drop bytes of an interrupted request that were never committed
+            upload_file.seek(offset)
+            upload_file.truncate()
+            
+            written = 0
+            try:
+                while True:
+                    block = stream.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    if offset + written + len(block) > session.size:
+                        raise UploadError(f"Chunk goes past the declared size ({session.size} bytes)")
+                    upload_file.write(block)
+                    if hasher is not None:
+                        hasher.update(block)
+                    written += len(block)
+            finally:
+                upload_file.flush()
+                os.fsync(upload_file.fileno())
+                
+                session.offset = offset + written
+                if session.offset == session.size and hasher is not None:
+                    session.content_hash = hasher.hexdigest()
+                db.session.commit()
+                
+                if hasher is not None:
+                    with _hashers_lock:
+                        _hashers[session.id] = (session.offset, hasher)
+                        while len(_hashers) > MAX_RUNNING_HASHES:
+                            _hashers.popitem(last=False)
+        
+        return session.offset
+    
+    @staticmethod
+    def complete_resumable(session, user):
+        """Check a fully received resumable upload and create its (ingesting) Video"""
+        if session.offset != session.size:
+            raise UploadError(f"Upload incomplete ({session.offset} of {session.size} bytes)")
+        
+        file_path = Path(session.file_path)
+        os.replace(UploadService.partial_path(session), file_path)
+        
+        is_valid, error, file_info = validate_upload_metadata(
+            session.original_filename, file_path.stat().st_size, current_app.config['MAX_CONTENT_LENGTH']
+        )
+        if not is_valid:
+            UploadService._reject(session, error)
+        
+        video = UploadService.create_video(
+            user, file_info, file_path=str(file_path), content_hash=session.content_hash
+        )
+        
+        session.status = 'completed'
+        session.video_id = video.id
+        session.completed_at = datetime.utcnow()
+        db.session.commit()
+        
+        with _hashers_lock:
+            _hashers.pop(session.id, None)
+        
+        return video
+    
+    @staticmethod
+    def abort(session, status='aborted', error_message=None):
+        """Abort the upload (S3 frees the multipart parts; local bytes are deleted)"""
+        if session.status == 'pending' and session.kind == 'resumable':
+            UploadService.partial_path(session).unlink(missing_ok=True)
+        elif session.status == 'pending':
+            try:
+                get_s3_client().abort_multipart_upload(
+                    Bucket=current_app.config['AWS_BUCKET_NAME'],
+                    Key=session.s3_key,
+                    UploadId=session.upload_id
+                )
+            except Exception as e:
+                print(f"Aborting upload session {session.id} failed: {e}")
+        
+        session.status = status
+        session.error_message = error_message
+        db.session.commit()
+    
+    @staticmethod
+    def _reject(session, error):
+        """Delete a completed upload that failed validation"""
+        delete_file(file_path=session.file_path, s3_key=session.s3_key)
+        session.status = 'rejected'
+        session.error_message = error
+        db.session.commit()
+        raise UploadError(error)
+    
+    @staticmethod
+    def complete(session, user, parts):
+        """
+        Assemble the uploaded parts, verify the object and create its
+        (ingesting) Video
+        parts: [{'part_number': n, 'etag': '...'}] as returned by S3 per part
+        """
+        if not parts or len(parts) != session.part_count:
+            raise UploadError(f"Expected {session.part_count} parts, got {len(parts or [])}")
+        
+        try:
+            get_s3_client().complete_multipart_upload(
+                Bucket=current_app.config['AWS_BUCKET_NAME'],
+                Key=session.s3_key,
+                UploadId=session.upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': int(part['part_number']), 'ETag': part['etag']}
+                    for part in sorted(parts, key=lambda part: int(part['part_number']))
+                ]}
+            )
+        except Exception as e:
+            raise UploadError(f"Upload could not be completed: {e}")
+        
+        # The object, not the client's declaration, is what gets validated
+        size = head_s3_object(session.s3_key)['size']
+        if size != session.size:
+            UploadService._reject(session, f"Uploaded {size} bytes, declared {session.size}")
+        
+        is_valid, error, file_info = validate_upload_metadata(
+            session.original_filename, size, current_app.config['MAX_CONTENT_LENGTH']
+        )
+        if not is_valid:
+            UploadService._reject(session, error)
+        
+        video = UploadService.create_video(user, file_info, s3_key=session.s3_key)
+        
+        session.status = 'completed'
+        session.video_id = video.id
+        session.completed_at = datetime.utcnow()
+        db.session.commit()
+        
+        return video
+    
+    @staticmethod
+    def expire_sessions():
+        """Abort pending sessions past their expiry"""
+        sessions = UploadSession.query.filter(
+            UploadSession.status == 'pending',
+            UploadSession.expires_at < datetime.utcnow()
+        ).all()
+        
+        for session in sessions:
+            UploadService.abort(session, status='aborted', error_message='Upload session expired')
+        
+        return len(sessions)
@@ -4,14 +4,22 @@ Video Processing Service
 Refactored from core/processing.py
 """
 import os
+import subprocess
+import time
 import torch
 import whisper
 import moviepy.editor as mpy
+import soundfile as sf
 from pathlib import Path
 from flask import current_app
 
 from app.services.transcription_service import TranscriptionService
 from app.services.subtitle_service import SubtitleService
+from app.services.hls_service import HLSService
+from app.services.checkpoint_service import CheckpointService
+from app.services.prefetch_service import InputPrefetcher
+from app.services.cache_service import InputCache
+from app.services.source_service import SourceService
 from app.utils.file_handler import get_file_size_mb, download_from_s3
 from core.analysis import (
     analyze_sentiment_from_audio,
@@ -26,6 +34,16 @@ from core.generation import (
 )
 
 
+# Settings each stage depends on (changing any of them reruns the stage)
+STAGE_SETTINGS = {
+    'extract_audio': (),
+    'analyze_sentiment': (),
+    'transcribe': ('whisper_model',),
+    'select_clips': ('mode', 'num_clips', 'start_time', 'end_time'),
+    'render_clip': ('with_subtitles', 'subtitle_size', 'video_speed', 'watermark_path', 'render_preset', 'render_height')
+}
+
+
 class VideoProcessor:
     """Orchestrates video processing pipeline"""
     
@@ -46,49 +64,232 @@ class VideoProcessor:
         self.temp_dir.mkdir(parents=True, exist_ok=True)
         self.done_dir.mkdir(parents=True, exist_ok=True)
         
-        # Get video file path
-        if video.s3_key:
-            # Download from S3 if needed
-            self.video_path = self.temp_dir / f"{video.id}_input.mp4"
-            if not self.video_path.exists():
-                download_from_s3(video.s3_key, self.video_path)
-        else:
-            self.video_path = Path(video.file_path)
+        self._video_path = None
+        self._source = None
+        self.input_wait_seconds = 0.0
+    
+    @property
+    def video_path(self):
+        """
+        Local path of the source video
+        S3 inputs are downloaded on first access, so pipeline stages that only
+        need the extracted audio never fetch the video. An input the worker
+        is already prefetching is waited for rather than downloaded twice,
+        and inputs come from the node's InputCache when it is enabled; the
+        time spent blocked is kept in input_wait_seconds.
+        """
+        if self._video_path is None:
+            if self.video.s3_key:
+                started = time.monotonic()
+                video_path = self.temp_dir / f"{self.video.id}_input.mp4"
+                if not video_path.exists() and not InputPrefetcher.wait_for(video_path) and \
+                        not (InputCache.is_enabled() and InputCache.materialize(self.video.s3_key, video_path)):
+                    # Download beside the target and rename, so parallel
+                    # stages never open a partially written file
+                    partial_path = video_path.with_name(f"{video_path.name}.{os.getpid()}.part")
+                    download_from_s3(self.video.s3_key, partial_path)
+                    os.replace(partial_path, video_path)
+                self.input_wait_seconds = round(time.monotonic() - started, 2)
+                self._video_path = video_path
+            else:
+                self._video_path = Path(self.video.file_path)
+        
+        return self._video_path
     
-    def extract_audio(self):
-        """Extract audio from video"""
-        audio_path = self.temp_dir / f"{self.video.id}_audio.wav"
+    @property
+    def source(self):
+        """
+        Input given to ffmpeg
+        The local file when there is one (local upload, or an input already
+        staged by a download or prefetch); a presigned URL when the S3 input
+        can be read with ranged GETs, so only the decoded ranges are fetched;
+        otherwise the input is downloaded (video_path).
+        """
+        if self._source is None:
+            staged = self.temp_dir / f"{self.video.id}_input.mp4"
+            if self.video.s3_key and not staged.exists() and SourceService.is_streamable(self.video):
+                self._source = SourceService.url(self.video)
+            else:
+                self._source = str(self.video_path)
         
-        with mpy.VideoFileClip(str(self.video_path)) as clip:
-            clip.audio.write_audiofile(
-                str(audio_path),
-                codec='pcm_s16le',
-                fps=16000,
-                logger=None
+        return self._source
+    
+    @property
+    def analysis_range(self):
+        """
+        (start, end) of the source the analysis stages read: the manual cut
+        plus ANALYSIS_RANGE_PADDING seconds of context, or None for the whole
+        video
+        """
+        if self.settings.get('mode') != 'manual':
+            return None
+        
+        padding = current_app.config.get('ANALYSIS_RANGE_PADDING', 5)
+        start = max(0.0, float(self.settings.get('start_time', 0)) - padding)
+        end = float(self.settings.get('end_time', 60)) + padding
+        if self.video.duration:
+            end = min(end, float(self.video.duration))
+        return start, end
+    
+    @property
+    def audio_path(self):
+        """Path of the extracted audio shared by the analysis stages"""
+        return self.temp_dir / f"{self.video.id}_audio.wav"
+    
+    def _settings_for(self, stage):
+        return {key: self.settings.get(key) for key in STAGE_SETTINGS[stage]}
+    
+    def analysis_fingerprints(self):
+        """
+        Input fingerprints of the analysis stages
+        Each one chains its upstream fingerprints, so a change to the source
+        or to a stage's settings invalidates that stage and everything after it
+        """
+        video = self.video
+        if video.content_hash:
+            # Identical uploads share their analyses and renders
+            source = CheckpointService.fingerprint(video.content_hash)
+        else:
+            source = CheckpointService.fingerprint(
+                video.s3_key or video.file_path, video.file_size_mb, video.duration
             )
         
-        return audio_path
+        if self.analysis_range:
+            extract = CheckpointService.fingerprint('extract_audio', source, self.analysis_range)
+        else:
+            extract = CheckpointService.fingerprint('extract_audio', source)
+        sentiment = CheckpointService.fingerprint('analyze_sentiment', extract)
+        transcribe = CheckpointService.fingerprint(
+            'transcribe', extract, self._settings_for('transcribe')
+        )
+        select = CheckpointService.fingerprint(
+            'select_clips', sentiment, transcribe, self._settings_for('select_clips'), self.user.plan
+        )
+        
+        return {
+            'extract_audio': extract,
+            'analyze_sentiment': sentiment,
+            'transcribe': transcribe,
+            'select_clips': select
+        }
+    
+    def render_fingerprint(self, select_fingerprint, index):
+        """Input fingerprint of clip <index> (its range comes from the selection)"""
+        return CheckpointService.fingerprint(
+            'render_clip', select_fingerprint, index,
+            self._settings_for('render_clip'), HLSService.is_enabled()
+        )
+    
+    def extract_audio(self, output_path=None, start=None, end=None):
+        """
+        Decode the audio track (or the start..end range) to 16 kHz mono WAV
+        ffmpeg streams it to disk, so worker memory doesn't grow with the
+        video length. The shared analysis audio covers analysis_range.
+        """
+        if output_path is None and self.analysis_range:
+            start, end = self.analysis_range
+        output_path = Path(output_path or self.audio_path)
+        partial_path = output_path.with_name(f"{output_path.name}.{os.getpid()}.part")
+        
+        command = [current_app.config.get('FFMPEG_BINARY', 'ffmpeg'), '-y', '-loglevel', 'error']
+        if self.source.startswith(('http://', 'https://')):
+            command += ['-reconnect', '1', '-reconnect_delay_max', '10']
+        if start is not None:
+            command += ['-ss', f"{start:.3f}"]
+        if end is not None:
+            command += ['-t', f"{end - (start or 0):.3f}"]
+        command += [
+            '-i', self.source,
+            '-vn', '-ac', '1', '-ar', str(whisper.audio.SAMPLE_RATE),
+            '-c:a', 'pcm_s16le', '-f', 'wav',
+            str(partial_path)
+        ]
+        
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            partial_path.unlink(missing_ok=True)
+            raise RuntimeError(f"Audio extraction failed: {result.stderr.strip()}")
+        
+        os.replace(partial_path, output_path)
+        return output_path
     
     def analyze_sentiment(self, audio_path):
-        """Analyze audio sentiment"""
-        return analyze_sentiment_from_audio(audio_path)
+        """Analyze audio sentiment (streamed in blocks)"""
+        return analyze_sentiment_from_audio(
+            audio_path,
+            block_seconds=current_app.config.get('SENTIMENT_BLOCK_SECONDS', 30)
+        )
+    
+    def iter_audio_windows(self, audio_path, window_seconds):
+        """
+        Read a 16 kHz WAV window by window
+        Yields: (offset in seconds, float32 samples, fraction read)
+        """
+        with sf.SoundFile(str(audio_path)) as audio_file:
+            if audio_file.samplerate != whisper.audio.SAMPLE_RATE:
+                raise ValueError(f"Expected {whisper.audio.SAMPLE_RATE} Hz audio, got {audio_file.samplerate} Hz")
+            
+            total = audio_file.frames
+            window = int(window_seconds * audio_file.samplerate)
+            
+            for offset in range(0, total, window):
+                samples = audio_file.read(window, dtype='float32', always_2d=True).mean(axis=1)
+                yield offset / audio_file.samplerate, samples, min(1.0, (offset + window) / total)
     
-    def transcribe_audio(self, audio_path, callback=None):
-        """Transcribe audio using Whisper"""
+    def transcribe_audio(self, audio_path, callback=None, cancel_check=None):
+        """
+        Transcribe audio using Whisper
+        Reads and transcribes TRANSCRIBE_WINDOW_SECONDS at a time, so memory
+        stays flat with the video length, progress is reported and
+        cancellation is checked between windows. Each window is prompted
+        with the end of the previous one and its timestamps are shifted back
+        to video time (the shared analysis audio starts at analysis_range).
+        """
         model_name = self.settings.get('whisper_model', 'base')
         device = "cuda" if torch.cuda.is_available() and current_app.config.get('USE_GPU') else "cpu"
         
         model = whisper.load_model(model_name, device=device)
+        window_seconds = current_app.config.get('TRANSCRIBE_WINDOW_SECONDS', 600)
         
-        with torch.no_grad():
-            result = model.transcribe(
-                str(audio_path),
-                language="pt",
-                verbose=False,
-                word_timestamps=True
-            )
+        offset = 0.0
+        if Path(audio_path) == self.audio_path and self.analysis_range:
+            offset = self.analysis_range[0]
         
-        return result.get("segments", [])
+        segments = []
+        prompt = None
+        for shift, samples, done in self.iter_audio_windows(audio_path, window_seconds):
+            shift += offset
+            if cancel_check:
+                cancel_check()
+            
+            with torch.no_grad():
+                result = model.transcribe(
+                    samples,
+                    language="pt",
+                    verbose=False,
+                    word_timestamps=True,
+                    initial_prompt=prompt
+                )
+            
+            for segment in result.get("segments", []):
+                segment['id'] = len(segments)
+                segment['seek'] = segment.get('seek', 0) + int(shift * whisper.audio.SAMPLE_RATE) // whisper.audio.HOP_LENGTH
+                segment['start'] += shift
+                segment['end'] += shift
+                for word in segment.get('words', []):
+                    word['start'] += shift
+                    word['end'] += shift
+                # Token ids aren't used downstream and dominate the JSON size
+                segment.pop('tokens', None)
+                segments.append(segment)
+            
+            prompt = result.get("text", "")[-200:] or None
+            del samples, result
+            
+            if callback:
+                callback(int(done * 100))
+        
+        return segments
     
     def find_best_clips(self, transcription, sentiment_data):
         """Find best clips using AI"""
@@ -134,9 +335,20 @@ class VideoProcessor:
             "narrative": "MANUAL"
         }]
     
-    def render_clip(self, clip_data, index):
+    def clip_output_path(self, index, tag=None):
+        """
+        Output path and filename of clip <index>
+        Prefixed with the video id: uploads keep their (non-unique) secure
+        filename, and identical re-uploads share clips by hard link. A tag
+        keeps the render next to (not over) the clip currently shown.
+        """
+        suffix = f"_{tag}" if tag else ''
+        output_filename = f"{self.video.id}_{self.video.filename.rsplit('.', 1)[0]}_clip{index}{suffix}.mp4"
+        return self.done_dir / output_filename, output_filename
+    
+    def render_clip(self, clip_data, index, tag=None):
         """Render a single clip with subtitles and effects"""
-        with mpy.VideoFileClip(str(self.video_path)) as original_clip:
+        with mpy.VideoFileClip(self.source) as original_clip:
             # Extract clip segment
             part = original_clip.subclip(clip_data['start'], clip_data['end'])
             
@@ -169,9 +381,13 @@ class VideoProcessor:
             final_video = mpy.CompositeVideoClip(composition_clips, size=part_vertical.size)
             final_video = final_video.set_audio(part.audio)
             
+            # Lower output resolution (admission control under load)
+            render_height = self.settings.get('render_height')
+            if render_height and final_video.h > int(render_height):
+                final_video = final_video.resize(height=int(render_height))
+            
             # Save
-            output_filename = f"{self.video.filename.rsplit('.', 1)[0]}_clip{index}.mp4"
-            output_path = self.done_dir / output_filename
+            output_path, output_filename = self.clip_output_path(index, tag)
             
             final_video.write_videofile(
                 str(output_path),
@@ -181,7 +397,8 @@ class VideoProcessor:
                 verbose=False,
                 logger=None,
                 threads=4,
-                preset='medium'
+                preset=self.settings.get('render_preset') or 'medium',
+                ffmpeg_params=HLSService.keyframe_params()
             )
             
             # Cleanup
@@ -196,6 +413,13 @@ class VideoProcessor:
         
         return str(output_path), output_filename
     
+    def package_preview(self, clip_path, clip_filename):
+        """
+        Package a rendered clip as HLS for in-browser preview
+        One directory per video, so packaging never replaces another video's preview
+        """
+        return HLSService.package(clip_path, f"{self.video.id}/{clip_filename.rsplit('.', 1)[0]}")
+    
     def _generate_subtitle_clips(self, clip_data, video_clip, video_speed):
         """Generate subtitle clips"""
         subtitle_clips = []
@@ -265,12 +489,15 @@ class VideoProcessor:
     def cleanup_temp_files(self):
         """Clean up temporary files"""
         # Delete temp audio
-        audio_path = self.temp_dir / f"{self.video.id}_audio.wav"
-        if audio_path.exists():
-            audio_path.unlink()
+        if self.audio_path.exists():
+            self.audio_path.unlink()
         
-        # Delete downloaded video if from S3
+        # Delete downloaded video if from S3 (a link: the node's input cache keeps its copy)
         if self.video.s3_key:
             input_path = self.temp_dir / f"{self.video.id}_input.mp4"
             if input_path.exists():
-                input_path.unlink()
\ No newline at end of file
+                input_path.unlink()
+            
+            # Downloads interrupted by a cancelled or killed task
+            for partial_path in self.temp_dir.glob(f"{input_path.name}.*.part"):
+                partial_path.unlink(missing_ok=True)
\ No newline at end of file
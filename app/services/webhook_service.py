@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook Service
+Video events are written to an outbox table in the same transaction as the
+status change, then drained in batches by a sender task
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from app import db
+from app.models import WebhookEndpoint, WebhookDelivery
+
+
+WEBHOOK_EVENTS = ('video.completed', 'video.failed')
+
+_sessions = {}
+
+
+class UnsafeWebhookURL(ValueError):
+    """The URL isn't http(s) or its host resolves to a non-public address"""
+
+
+def get_http_session():
+    """Per-process HTTP session, so deliveries reuse keep-alive connections"""
+    session = _sessions.get(os.getpid())
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'BinhoCut-Webhooks/1.0'
+        _sessions[os.getpid()] = session
+    return session
+
+
+class WebhookService:
+    """Outbox writes, signing and batched delivery"""
+    
+    @staticmethod
+    def sign(secret, timestamp, body):
+        """HMAC-SHA256 of '<timestamp>.<body>' (hex)"""
+        message = f"{timestamp}.{body}".encode('utf-8')
+        return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def check_url(url):
+        """
+        Refuse URLs that would make the server call itself or its private
+        network (loopback, RFC 1918, link-local such as the 169.254.169.254
+        metadata service, ...). Every address the host resolves to must be
+        public. Raises UnsafeWebhookURL; OSError when the host doesn't
+        resolve.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise UnsafeWebhookURL("url must be an http(s) URL")
+        
+        try:
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+        except ValueError:
+            raise UnsafeWebhookURL("url has an invalid port")
+        
+        if current_app.config.get('WEBHOOK_ALLOW_PRIVATE_NETWORKS'):
+            return
+        
+        for *_, sockaddr in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP):
+            address = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+            if address.version == 6 and address.ipv4_mapped:
+                address = address.ipv4_mapped
+            if not address.is_global or address.is_multicast:
+                raise UnsafeWebhookURL(f"{parts.hostname} resolves to a non-public address ({address})")
+    
+    @staticmethod
+    def enqueue(video, event):
+        """
+        Add outbox rows for every active endpoint of the owner subscribed to
+        the event. Doesn't commit: the caller commits with the status change.
+        """
+        endpoints = WebhookEndpoint.query.filter_by(user_id=video.user_id, is_active=True).all()
+        payload = {
+            'event': event,
+            'created_at': datetime.utcnow().isoformat(),
+            'data': {
+                'video_id': video.id,
+                'status': video.status,
+                'error_message': video.error_message,
+                'original_filename': video.original_filename,
+                'clip_ids': [clip.id for clip in video.clips]
+            }
+        }
+        
+        count = 0
+        for endpoint in endpoints:
+            if event in (endpoint.events or WEBHOOK_EVENTS):
+                db.session.add(WebhookDelivery(endpoint_id=endpoint.id, event=event, payload=payload))
+                count += 1
+        
+        return count
+    
+    @staticmethod
+    def _claim_batch(batch_size, lease_seconds):
+        """
+        Lease due deliveries by pushing next_attempt_at forward, so parallel
+        senders (and a crashed sender's batch) don't collide
+        """
+        now = datetime.utcnow()
+        deliveries = WebhookDelivery.query.filter(
+            WebhookDelivery.status == 'pending',
+            WebhookDelivery.next_attempt_at <= now
+        ).order_by(WebhookDelivery.next_attempt_at).limit(batch_size).with_for_update(skip_locked=True).all()
+        
+        for delivery in deliveries:
+            delivery.next_attempt_at = now + timedelta(seconds=lease_seconds)
+        db.session.commit()
+        
+        return deliveries
+    
+    @staticmethod
+    def _backoff(attempts):
+        """Exponential backoff with jitter"""
+        base = current_app.config.get('WEBHOOK_BACKOFF_BASE', 30)
+        ceiling = current_app.config.get('WEBHOOK_BACKOFF_MAX', 3600)
+        delay = min(ceiling, base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+    
+    @staticmethod
+    def deliver(delivery, session=None):
+        """Send one delivery; returns True when the endpoint answered 2xx"""
+        session = session or get_http_session()
+        endpoint = delivery.endpoint
+        
+        body = json.dumps(delivery.payload, separators=(',', ':'), sort_keys=True)
+        timestamp = int(time.time())
+        headers = {
+            'Content-Type': 'application/json',
+            'X-BinhoCut-Event': delivery.event,
+            'X-BinhoCut-Delivery': str(delivery.id),
+            'X-BinhoCut-Signature': f"t={timestamp},v1={WebhookService.sign(endpoint.secret, timestamp, body)}"
+        }
+        
+        delivery.attempts += 1
+        unsafe = False
+        
+        try:
+            # Checked again on every attempt: DNS may have changed since registration
+            WebhookService.check_url(endpoint.url)
+            
+            # Redirects aren't followed, they could point anywhere
+            response = session.post(
+                endpoint.url,
+                data=body.encode('utf-8'),
+                headers=headers,
+                timeout=current_app.config.get('WEBHOOK_TIMEOUT', 10),
+                allow_redirects=False
+            )
+            delivery.response_status = response.status_code
+            ok = 200 <= response.status_code < 300
+            delivery.last_error = None if ok else f"HTTP {response.status_code}"
+        except UnsafeWebhookURL as e:
+            ok, unsafe = False, True
+            delivery.response_status = None
+            delivery.last_error = str(e)
+        except (requests.RequestException, OSError) as e:
+            ok = False
+            delivery.response_status = None
+            delivery.last_error = str(e)
+        
+        if ok:
+            delivery.status = 'delivered'
+            delivery.delivered_at = datetime.utcnow()
+        elif unsafe or not endpoint.is_active or \
+                delivery.attempts >= current_app.config.get('WEBHOOK_MAX_ATTEMPTS', 8):
+            delivery.status = 'failed'
+        else:
+            delivery.next_attempt_at = datetime.utcnow() + timedelta(seconds=WebhookService._backoff(delivery.attempts))
+        
+        return ok
+    
+    @staticmethod
+    def deliver_pending(session=None):
+        """
+        Drain due deliveries in batches
+        Returns: (delivered, failed_attempts)
+        """
+        batch_size = current_app.config.get('WEBHOOK_BATCH_SIZE', 50)
+        lease_seconds = current_app.config.get('WEBHOOK_LEASE_SECONDS', 120)
+        delivered = failed = 0
+        
+        while True:
+            batch = WebhookService._claim_batch(batch_size, lease_seconds)
+            if not batch:
+                break
+            
+            for delivery in batch:
+                if WebhookService.deliver(delivery, session=session):
+                    delivered += 1
+                else:
+                    failed += 1
+            db.session.commit()
+            
+            if len(batch) < batch_size:
+                break
+        
+        return delivered, failed
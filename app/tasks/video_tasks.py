@@ -3,13 +3,27 @@
 Celery Tasks for Video Processing
 """
 import os
+import time
 import traceback
 from pathlib import Path
-from celery import Task
+from celery import Task, chain, chord, group
 from app import celery, db
-from app.models import Video, Clip, User
+from app.models import Video, Clip, User, StageCheckpoint
 from app.services.video_processor import VideoProcessor
 from app.services.analytics_service import AnalyticsService
+from app.services.hls_service import HLSService
+from app.services.checkpoint_service import CheckpointService
+from app.services.dispatch_service import FairDispatcher
+from app.services.progress_service import ProgressService
+from app.services.cancellation_service import CancellationService, JobCancelled
+from app.services.speculative_service import SpeculativeService, Preempted
+from app.services.eta_service import EtaService
+from app.services.shard_service import ShardService
+from app.services.dedup_service import DedupService
+from app.utils.memory import memory_budget
+
+# Result key under which an upgrade pass's render hands its clip to finalize
+UPGRADE_CLIP_KEY = 'upgrade_clip'
 
 
 class VideoProcessingTask(Task):
@@ -17,139 +31,852 @@ class VideoProcessingTask(Task):
     
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """Handle task failure"""
-        video_id = args[0] if args else None
+        video_id = kwargs.get('video_id') or (args[0] if args else None)
+        settings = kwargs.get('settings') or (args[1] if len(args) > 1 and isinstance(args[1], dict) else {})
+        
+        # A failed upgrade pass leaves the completed video and its degraded clips as they were
+        if video_id and settings.get('upgrade_pass'):
+            _abandon_upgrade(video_id, settings)
+            print(f"Upgrade pass {task_id} failed: {exc}")
+            traceback.print_exc()
+            return
+        
+        # A cancelled job fails its running stage on purpose (e.g. killed ffmpeg)
+        if video_id and (isinstance(exc, JobCancelled) or CancellationService.is_requested(video_id)):
+            video = Video.query.get(video_id)
+            if video:
+                _finish_cancellation(video)
+            print(f"Task {task_id} cancelled")
+            return
+        
         if video_id:
             video = Video.query.get(video_id)
             if video:
                 video.mark_as_failed(str(exc))
+            FairDispatcher.release(video_id)
         
         # Log to monitoring system
         print(f"Task {task_id} failed: {exc}")
         traceback.print_exc()
 
 
+def _report_progress(video, stage, progress):
+    """
+    Publish pipeline progress (coalesced) whichever stage task is running
+    Status and SSE endpoints read it from Redis, not from the result backend.
+    An upgrade pass runs behind a completed video and publishes nothing.
+    """
+    if video.upgrade_status:
+        return
+    ProgressService.publish(video, stage, progress)
+
+
+def _timing(stage, started, usage=None, processor=None):
+    """
+    Timing entry for Video.stage_timings (with peak RSS when measured, and
+    the time spent waiting for the source video when the stage read it)
+    """
+    entry = {'seconds': round(time.monotonic() - started, 3)}
+    if usage is not None:
+        entry.update(usage.to_dict())
+    if processor is not None and processor.input_wait_seconds:
+        entry['input_wait_seconds'] = processor.input_wait_seconds
+    return {stage: entry}
+
+
+def _memory_budget(pool):
+    """Track and enforce the per-task memory budget of a worker pool"""
+    from flask import current_app
+    pool_config = current_app.config.get('WORKER_POOLS', {}).get(pool, {})
+    return memory_budget(pool_config.get('memory_budget_mb'))
+
+
+def _skipped(stage):
+    """Timing entry for a stage resumed from its checkpoint"""
+    return {stage: {'seconds': 0, 'skipped': True}}
+
+
+def _merge_timings(results):
+    """Merge timing dicts returned by the tasks of a group"""
+    timings = {}
+    for result in results or []:
+        if isinstance(result, dict):
+            timings.update(result)
+    return timings
+
+
+def _get_video(video_id):
+    """Load the video of a stage, stopping here if it was cancelled"""
+    video = Video.query.get(video_id)
+    if not video:
+        raise ValueError(f"Video {video_id} not found")
+    CancellationService.check(video_id)
+    return video
+
+
+def _defer_to_speculative(task, video_id, stage, fingerprint):
+    """
+    Retry the stage later while a speculative run computes the very result
+    it needs, instead of holding the worker; the retry then resumes from
+    its checkpoint. The speculative run renews its lock while it works and
+    the lock expires when it stops, so this always ends.
+    """
+    from flask import current_app
+    
+    if SpeculativeService.is_running(video_id, stage, fingerprint):
+        raise task.retry(countdown=current_app.config.get('SPECULATIVE_DEFER_SECONDS', 15), max_retries=None)
+
+
+def _finish_cancellation(video):
+    """Clean temp files, mark the video cancelled and free its slot"""
+    if video.status != 'cancelled':
+        VideoProcessor(video, video.settings or {}, video.user).cleanup_temp_files()
+        video.mark_as_cancelled()
+    FairDispatcher.release(video.id)
+
+
+def _analyses_done(video, fingerprints):
+    """Sentiment and transcription are both checkpointed for these inputs"""
+    return (
+        CheckpointService.is_valid(video.id, 'analyze_sentiment', fingerprints['analyze_sentiment'])
+        and video.sentiment_data is not None
+        and CheckpointService.is_valid(video.id, 'transcribe', fingerprints['transcribe'])
+        and video.transcription is not None
+    )
+
+
+def build_processing_pipeline(video_id, settings, shards=None):
+    """
+    Processing DAG:
+        
+        extract audio -> (sentiment | transcription) -> select clips
+                      -> (render clip 1 | ... | render clip N) -> finalize
+    
+    Long videos (shards given) replace the analysis stages with one
+    audio + sentiment + transcription task per time shard and a merge:
+        
+        (shard 1 | ... | shard N) -> merge shards -> select clips -> ...
+    
+    Clip renders are fanned out by select_clips_task once the number of
+    clips is known.
+    """
+    if shards:
+        return chain(
+            chord(
+                group(
+                    analyze_shard_task.si(video_id=video_id, settings=settings, shard=shard)
+                    for shard in shards
+                ),
+                merge_shards_task.s(video_id=video_id, settings=settings)
+            ),
+            select_clips_task.s(video_id=video_id, settings=settings)
+        )
+    
+    return chain(
+        extract_audio_task.si(video_id=video_id, settings=settings),
+        chord(
+            group(
+                analyze_sentiment_task.si(video_id=video_id, settings=settings),
+                transcribe_audio_task.si(video_id=video_id, settings=settings)
+            ),
+            select_clips_task.s(video_id=video_id, settings=settings)
+        )
+    )
+
+
 @celery.task(base=VideoProcessingTask, bind=True, name='tasks.process_video')
 def process_video_task(self, video_id, settings):
     """
     Main video processing task
+    Marks the video as processing and replaces itself with the stage DAG
     
     Args:
         video_id: Database ID of video
         settings: Processing settings dict
     """
-    try:
-        # Update task progress
-        self.update_state(state='PROGRESS', meta={'stage': 'Starting', 'progress': 0})
-        
-        # Get video from database
-        video = Video.query.get(video_id)
-        if not video:
-            raise ValueError(f"Video {video_id} not found")
-        
-        # Mark as processing
+    video = _get_video(video_id)
+    
+    if settings.get('upgrade_pass'):
+        # Shadow run: the video stays completed with its clips until
+        # finalize swaps in the new ones
+        video.upgrade_status = 'processing'
+        video.stage_timings = {}
+        db.session.commit()
+    else:
+        # Mark as processing (this task id stays the video's root task id)
         video.mark_as_processing(self.request.id)
-        
-        # Get user for plan limits
-        user = video.user
-        
-        # Initialize processor
-        processor = VideoProcessor(video, settings, user)
-        
-        # Step 1: Extract audio (5%)
-        self.update_state(state='PROGRESS', meta={'stage': 'Extracting audio', 'progress': 5})
+        EtaService.refresh(video)
+        _report_progress(video, 'Starting', 0)
+    
+    # Results of an identical upload processed with the same settings are
+    # reused (rendered clips only by a regular run, they'd replace the shown ones)
+    processor = VideoProcessor(video, settings, video.user)
+    fingerprints = processor.analysis_fingerprints()
+    DedupService.adopt_analyses(video, fingerprints)
+    if not settings.get('upgrade_pass'):
+        DedupService.adopt_renders(video, processor, fingerprints['select_clips'])
+    
+    # Long inputs are analyzed in shards, unless the analyses are already
+    # checkpointed or only a manual cut's range is analyzed
+    shards = None
+    if processor.analysis_range is None and not _analyses_done(video, fingerprints):
+        shards = ShardService.plan(video)
+    
+    raise self.replace(build_processing_pipeline(video_id, settings, shards))
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.extract_audio')
+def extract_audio_task(self, video_id, settings):
+    """Stage 1: extract the audio track shared by the analysis stages"""
+    started = time.monotonic()
+    video = _get_video(video_id)
+    processor = VideoProcessor(video, settings, video.user)
+    fingerprints = processor.analysis_fingerprints()
+    
+    # Nothing downstream needs the audio if both analyses are checkpointed
+    analyses_done = _analyses_done(video, fingerprints)
+    audio_done = (
+        CheckpointService.is_valid(video_id, 'extract_audio', fingerprints['extract_audio'])
+        and processor.audio_path.exists()
+    )
+    
+    if analyses_done or audio_done:
+        video.record_stage_timings(_skipped('extract_audio'))
+        return
+    
+    _defer_to_speculative(self, video_id, 'extract_audio', fingerprints['extract_audio'])
+    _report_progress(video, 'Extracting audio', 5)
+    with _memory_budget('analysis') as usage, CancellationService.watch(video_id):
         audio_path = processor.extract_audio()
+    
+    CheckpointService.record(video_id, 'extract_audio', fingerprints['extract_audio'], audio_path)
+    video.record_stage_timings(_timing('extract_audio', started, usage, processor))
+    EtaService.refresh(video)
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.analyze_sentiment')
+def analyze_sentiment_task(self, video_id, settings):
+    """Stage 2a: audio sentiment (runs in parallel with transcription)"""
+    started = time.monotonic()
+    video = _get_video(video_id)
+    processor = VideoProcessor(video, settings, video.user)
+    fingerprint = processor.analysis_fingerprints()['analyze_sentiment']
+    
+    if video.sentiment_data is not None and \
+            CheckpointService.is_valid(video_id, 'analyze_sentiment', fingerprint):
+        return _skipped('analyze_sentiment')
+    
+    _defer_to_speculative(self, video_id, 'analyze_sentiment', fingerprint)
+    
+    _report_progress(video, 'Analyzing audio', 15)
+    with _memory_budget('analysis') as usage:
+        video.sentiment_data = processor.analyze_sentiment(processor.audio_path)
+    db.session.commit()
+    
+    CheckpointService.record(video_id, 'analyze_sentiment', fingerprint, 'videos.sentiment_data')
+    return _timing('analyze_sentiment', started, usage)
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.transcribe_audio')
+def transcribe_audio_task(self, video_id, settings):
+    """Stage 2b: Whisper transcription (runs in parallel with sentiment)"""
+    started = time.monotonic()
+    video = _get_video(video_id)
+    processor = VideoProcessor(video, settings, video.user)
+    fingerprint = processor.analysis_fingerprints()['transcribe']
+    
+    if video.transcription is not None and \
+            CheckpointService.is_valid(video_id, 'transcribe', fingerprint):
+        return _skipped('transcribe')
+    
+    _defer_to_speculative(self, video_id, 'transcribe', fingerprint)
+    
+    _report_progress(video, 'Transcribing', 30)
+    with _memory_budget('analysis') as usage:
+        def between_windows():
+            CancellationService.check(video_id)
+            usage.check()
         
-        # Step 2: Analyze sentiment (15%)
-        self.update_state(state='PROGRESS', meta={'stage': 'Analyzing sentiment', 'progress': 15})
-        sentiment_data = processor.analyze_sentiment(audio_path)
-        video.sentiment_data = sentiment_data
-        db.session.commit()
-        
-        # Step 3: Transcribe with Whisper (40%)
-        self.update_state(state='PROGRESS', meta={'stage': 'Transcribing', 'progress': 30})
-        transcription = processor.transcribe_audio(audio_path, 
-                                                   callback=lambda p: self.update_state(
-                                                       state='PROGRESS',
-                                                       meta={'stage': 'Transcribing', 'progress': 30 + int(p * 0.1)}
-                                                   ))
-        video.transcription = transcription
-        db.session.commit()
-        
-        # Step 4: Find best clips (50%)
-        self.update_state(state='PROGRESS', meta={'stage': 'Finding clips', 'progress': 50})
-        selected_clips = processor.find_best_clips(transcription, sentiment_data)
-        
-        # Step 5: Render clips (50-90%)
-        total_clips = len(selected_clips)
-        for idx, clip_data in enumerate(selected_clips, 1):
-            progress = 50 + int((idx / total_clips) * 40)
-            self.update_state(state='PROGRESS', meta={
-                'stage': f'Rendering clip {idx}/{total_clips}',
-                'progress': progress
-            })
-            
-            # Render clip
-            clip_path, clip_filename = processor.render_clip(clip_data, idx)
-            
-            # Save to database
-            clip = Clip(
-                video_id=video.id,
-                filename=clip_filename,
-                file_path=clip_path,
-                file_size_mb=processor.get_file_size(clip_path),
-                start_time=clip_data['start'],
-                end_time=clip_data['end'],
-                duration=clip_data['duration'],
-                relevance_score=clip_data['score'],
-                narrative_type=clip_data.get('narrative', 'CONTEXT'),
-                transcription_text=clip_data['text']
-            )
+        video.transcription = processor.transcribe_audio(
+            processor.audio_path,
+            callback=lambda p: _report_progress(video, 'Transcribing', 30 + int(p * 0.1)),
+            cancel_check=between_windows
+        )
+    db.session.commit()
+    
+    CheckpointService.record(video_id, 'transcribe', fingerprint, 'videos.transcription')
+    return _timing('transcribe', started, usage)
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.analyze_shard')
+def analyze_shard_task(self, video_id, settings, shard):
+    """Stage 2 (sharded): audio, sentiment and transcription of one time shard"""
+    started = time.monotonic()
+    video = _get_video(video_id)
+    processor = VideoProcessor(video, settings, video.user)
+    audio_path = processor.temp_dir / f"{video_id}_shard{shard['index']}.wav"
+    
+    _report_progress(video, f"Analyzing part {shard['index'] + 1}/{shard['count']}", 10)
+    
+    try:
+        with _memory_budget('analysis') as usage:
+            with CancellationService.watch(video_id):
+                processor.extract_audio(audio_path, start=shard['start'], end=shard['end'])
             
-            # Generate social media content
-            clip.social_media_caption = processor.generate_social_caption(
-                clip_data['text'], 
-                sentiment_data
-            )
+            sentiment = processor.analyze_sentiment(audio_path)
             
-            clip.analytics_report = processor.generate_analytics_report(
-                clip_data, 
-                sentiment_data
-            )
+            def between_windows():
+                CancellationService.check(video_id)
+                usage.check()
             
-            db.session.add(clip)
+            segments = processor.transcribe_audio(audio_path, cancel_check=between_windows)
+    finally:
+        audio_path.unlink(missing_ok=True)
+    
+    # Results travel through the result backend: shards may run on other nodes
+    return {
+        'shard': shard,
+        'sentiment': sentiment,
+        'segments': ShardService.shift_segments(segments, shard['start']),
+        'timing': _timing(f"analyze_shard_{shard['index']}", started, usage, processor)
+    }
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.merge_shards')
+def merge_shards_task(self, shard_results, video_id, settings):
+    """Stage 2 (sharded): merge shard results into the video's transcription and sentiment"""
+    started = time.monotonic()
+    video = _get_video(video_id)
+    _report_progress(video, 'Merging parts', 45)
+    
+    video.transcription = ShardService.merge_transcripts(shard_results)
+    video.sentiment_data = ShardService.merge_sentiment(shard_results)
+    db.session.commit()
+    
+    # Same checkpoints as the unsharded stages, so a rerun reuses them
+    fingerprints = VideoProcessor(video, settings, video.user).analysis_fingerprints()
+    CheckpointService.record(video_id, 'analyze_sentiment', fingerprints['analyze_sentiment'], 'videos.sentiment_data')
+    CheckpointService.record(video_id, 'transcribe', fingerprints['transcribe'], 'videos.transcription')
+    
+    timings = _merge_timings(result['timing'] for result in shard_results)
+    timings.update(_timing('merge_shards', started))
+    return [timings]
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.select_clips')
+def select_clips_task(self, analysis_timings, video_id, settings):
+    """
+    Stage 3: pick the clips, then fan out one render task per clip
+    Clips already rendered with the same inputs are kept; stale ones are
+    removed (by finalize, after the new renders, for an upgrade pass)
+    """
+    started = time.monotonic()
+    video = _get_video(video_id)
+    _report_progress(video, 'Finding clips', 50)
+    
+    processor = VideoProcessor(video, settings, video.user)
+    select_fingerprint = processor.analysis_fingerprints()['select_clips']
+    selected_clips = processor.find_best_clips(video.transcription, video.sentiment_data)
+    CheckpointService.record(video_id, 'select_clips', select_fingerprint, f'{len(selected_clips)} clips')
+    
+    render_fingerprints = {
+        idx: processor.render_fingerprint(select_fingerprint, idx)
+        for idx in range(1, len(selected_clips) + 1)
+    }
+    if settings.get('upgrade_pass'):
+        kept = _rendered_indices(video, render_fingerprints)
+    else:
+        kept = _prune_stale_clips(video, render_fingerprints)
+    
+    timings = _merge_timings(analysis_timings)
+    timings.update(_timing('select_clips', started))
+    for idx in kept:
+        timings.update(_skipped(f'render_clip_{idx}'))
+    video.record_stage_timings(timings)
+    EtaService.refresh(video)
+    
+    total_clips = len(selected_clips)
+    renders = [
+        render_clip_task.si(
+            video_id=video_id,
+            settings=settings,
+            clip_data=clip_data,
+            index=idx,
+            total_clips=total_clips,
+            fingerprint=render_fingerprints[idx]
+        )
+        for idx, clip_data in enumerate(selected_clips, 1)
+        if idx not in kept
+    ]
+    
+    if not renders:
+        raise self.replace(finalize_video_task.s([], video_id=video_id, settings=settings, clip_count=total_clips))
+    
+    raise self.replace(chord(
+        group(renders),
+        finalize_video_task.s(video_id=video_id, settings=settings, clip_count=total_clips)
+    ))
+
+
+def _package_preview(processor, fields):
+    """Add the HLS preview of a rendered clip to its metadata (failure keeps the MP4 usable)"""
+    if not HLSService.is_enabled():
+        return
+    try:
+        fields['clip_metadata']['hls'] = processor.package_preview(fields['file_path'], fields['filename'])
+    except Exception as e:
+        print(f"HLS packaging failed for {fields['filename']}: {e}")
+
+
+def _is_rendered(clip, index, fingerprint):
+    """True if the clip was rendered for <index> with these inputs and its file is still there"""
+    metadata = clip.clip_metadata or {}
+    return (
+        metadata.get('index') == index
+        and metadata.get('fingerprint') == fingerprint
+        and bool(clip.s3_key or (clip.file_path and Path(clip.file_path).exists()))
+    )
+
+
+def _rendered_indices(video, render_fingerprints):
+    """Indices whose clips are still valid for these render inputs"""
+    return {
+        index for index, fingerprint in render_fingerprints.items()
+        if any(_is_rendered(clip, index, fingerprint) for clip in video.clips)
+    }
+
+
+def _prune_stale_clips(video, render_fingerprints):
+    """
+    Delete clips whose render inputs changed (or that fell out of the
+    selection) and return the indices whose clips are still valid
+    """
+    from app.utils.file_handler import delete_file
+    
+    kept = set()
+    for clip in video.clips.all():
+        metadata = clip.clip_metadata or {}
+        index = metadata.get('index')
         
-        db.session.commit()
+        if index in render_fingerprints and index not in kept and \
+                _is_rendered(clip, index, render_fingerprints[index]):
+            kept.add(index)
+            continue
         
-        # Step 6: Cleanup and finalize (95%)
-        self.update_state(state='PROGRESS', meta={'stage': 'Finalizing', 'progress': 95})
+        if clip.file_path or clip.s3_key:
+            delete_file(clip.file_path, clip.s3_key)
+        HLSService.remove_package(metadata.get('hls'))
+        if index is not None:
+            StageCheckpoint.query.filter_by(video_id=video.id, stage=f'render_clip_{index}').delete()
+        db.session.delete(clip)
+    
+    db.session.commit()
+    return kept
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.render_clip')
+def render_clip_task(self, video_id, settings, clip_data, index, total_clips, fingerprint):
+    """
+    Stage 4: render one clip (clips render in parallel)
+    An upgrade pass renders next to the clip currently shown and hands the
+    new clip to finalize (under UPGRADE_CLIP_KEY) instead of saving it
+    """
+    started = time.monotonic()
+    video = _get_video(video_id)
+    
+    # A retried render whose clip was already saved has nothing to do
+    if any(_is_rendered(clip, index, fingerprint) for clip in video.clips):
+        return _skipped(f'render_clip_{index}')
+    
+    processor = VideoProcessor(video, settings, video.user)
+    sentiment_data = video.sentiment_data or {}
+    upgrade = settings.get('upgrade_pass')
+    tag = fingerprint[:12] if upgrade else None
+    
+    # Render clip (a cancel request kills the ffmpeg writer mid-render)
+    try:
+        with _memory_budget('render') as usage, CancellationService.watch(video_id):
+            clip_path, clip_filename = processor.render_clip(clip_data, index, tag)
+    except JobCancelled:
+        output_path, _ = processor.clip_output_path(index, tag)
+        output_path.unlink(missing_ok=True)
+        raise
+    
+    fields = dict(
+        filename=clip_filename,
+        file_path=clip_path,
+        file_size_mb=processor.get_file_size(clip_path),
+        start_time=clip_data['start'],
+        end_time=clip_data['end'],
+        duration=clip_data['duration'],
+        relevance_score=clip_data['score'],
+        narrative_type=clip_data.get('narrative', 'CONTEXT'),
+        transcription_text=clip_data['text']
+    )
+    
+    # Generate social media content
+    fields['social_media_caption'] = processor.generate_social_caption(
+        clip_data['text'], 
+        sentiment_data
+    )
+    
+    fields['analytics_report'] = processor.generate_analytics_report(
+        clip_data, 
+        sentiment_data
+    )
+    
+    fields['clip_metadata'] = {'index': index, 'fingerprint': fingerprint}
+    
+    if upgrade:
+        result = _timing(f'render_clip_{index}', started, usage, processor)
+        result[UPGRADE_CLIP_KEY] = fields
+        return result
+    
+    # Optional HLS preview (failure keeps the MP4 usable)
+    _package_preview(processor, fields)
+    
+    # Save to database
+    db.session.add(Clip(video_id=video.id, **fields))
+    db.session.commit()
+    
+    CheckpointService.record(video_id, f'render_clip_{index}', fingerprint, clip_path)
+    EtaService.refresh(video)
+    
+    rendered = video.clips.count()
+    _report_progress(video, f'Rendered clip {rendered}/{total_clips}', 50 + int((rendered / total_clips) * 40))
+    
+    return _timing(f'render_clip_{index}', started, usage, processor)
+
+
+@celery.task(base=VideoProcessingTask, bind=True, name='tasks.finalize_video')
+def finalize_video_task(self, render_timings, video_id, settings, clip_count=None):
+    """
+    Stage 5: aggregate renders, clean up and mark the video completed
+    An upgrade pass swaps its clips in instead: the video was completed all
+    along, so no webhook, usage or analytics are recorded again
+    """
+    started = time.monotonic()
+    video = _get_video(video_id)
+    _report_progress(video, 'Finalizing', 95)
+    
+    processor = VideoProcessor(video, settings, video.user)
+    processor.cleanup_temp_files()
+    
+    upgraded = [
+        result.pop(UPGRADE_CLIP_KEY) for result in render_timings or []
+        if isinstance(result, dict) and UPGRADE_CLIP_KEY in result
+    ]
+    timings = _merge_timings(render_timings)
+    timings.update(_timing('finalize', started))
+    video.record_stage_timings(timings)
+    
+    if settings.get('upgrade_pass'):
+        _swap_upgraded_clips(video, processor, upgraded, clip_count)
+        EtaService.record(video)
+        FairDispatcher.release(video.id)
+        return {
+            'video_id': video.id,
+            'clips_generated': len(upgraded),
+            'status': 'upgraded'
+        }
+    
+    # Mark as completed
+    video.mark_as_completed()
+    
+    # Feed the ETA models
+    EtaService.record(video)
+    
+    # Update user stats
+    video.user.increment_usage()
+    
+    # Hand the slot to the next pending job
+    FairDispatcher.release(video.id)
+    
+    # Save analytics
+    clips = video.clips.all()
+    AnalyticsService.record_processing(video, clips, video.sentiment_data)
+    
+    return {
+        'video_id': video.id,
+        'clips_generated': len(clips),
+        'status': 'completed'
+    }
+
+
+def _swap_upgraded_clips(video, processor, upgraded, clip_count):
+    """
+    Replace the clips of a video with those of its finished upgrade pass in
+    one commit. Re-rendered clips are updated in place (ids, downloads and
+    views stay); the replaced files and previews are deleted afterwards.
+    """
+    from app.utils.file_handler import delete_file
+    
+    for fields in upgraded:
+        _package_preview(processor, fields)
+    
+    rendered = {fields['clip_metadata']['index']: fields for fields in upgraded}
+    replaced = []
+    kept = set()
+    for clip in video.clips.all():
+        metadata = clip.clip_metadata or {}
+        index = metadata.get('index')
+        fields = rendered.pop(index, None)
+        
+        # Not re-rendered: still valid for the new inputs, unless it fell out of the selection
+        if fields is None and index is not None and index not in kept and \
+                (clip_count is None or index <= clip_count):
+            kept.add(index)
+            continue
+        
+        replaced.append((clip.file_path, clip.s3_key, metadata.get('hls')))
+        if fields is None:
+            if index is not None and index not in kept:
+                StageCheckpoint.query.filter_by(video_id=video.id, stage=f'render_clip_{index}').delete()
+            db.session.delete(clip)
+        else:
+            for field, value in fields.items():
+                setattr(clip, field, value)
+            clip.s3_key = None
+    
+    for fields in rendered.values():
+        db.session.add(Clip(video_id=video.id, **fields))
+    
+    video.degradation = None
+    video.upgrade_status = None
+    db.session.commit()
+    
+    for fields in upgraded:
+        metadata = fields['clip_metadata']
+        CheckpointService.record(video.id, f"render_clip_{metadata['index']}", metadata['fingerprint'], fields['file_path'])
+    
+    for file_path, s3_key, hls in replaced:
+        if file_path or s3_key:
+            delete_file(file_path, s3_key)
+        HLSService.remove_package(hls)
+    
+    video.publish_status()
+
+
+def _abandon_upgrade(video_id, settings):
+    """
+    Drop a failed upgrade pass: delete its renders and keep the degraded
+    clips; after ADMISSION_UPGRADE_MAX_ATTEMPTS the video isn't retried
+    """
+    from flask import current_app
+    
+    video = Video.query.get(video_id)
+    if video and video.upgrade_status in ('queued', 'processing'):
+        processor = VideoProcessor(video, settings, video.user)
         processor.cleanup_temp_files()
         
-        # Mark as completed
-        video.mark_as_completed()
+        # Tagged renders (see render_clip_task) no clip points to
+        shown = {clip.file_path for clip in video.clips}
+        _, pattern = processor.clip_output_path('*', '*')
+        for path in processor.done_dir.glob(pattern):
+            if str(path) not in shown:
+                path.unlink(missing_ok=True)
         
-        # Update user stats
-        user.increment_usage()
+        degradation = dict(video.degradation or {})
+        attempts = degradation.get('upgrade_attempts', 0) + 1
+        degradation['upgrade_attempts'] = attempts
+        video.degradation = degradation
+        max_attempts = current_app.config.get('ADMISSION_UPGRADE_MAX_ATTEMPTS', 3)
+        video.upgrade_status = 'failed' if attempts >= max_attempts else None
+        db.session.commit()
+    
+    FairDispatcher.release(video_id)
+
+
+@celery.task(bind=True, name='tasks.speculative_preprocess')
+def speculative_preprocess_task(self, video_id):
+    """
+    Low-priority pre-processing right after upload
+    Runs the settings-independent stages with the owner's default settings
+    and records their checkpoints, which /process then reuses. Once the
+    video is submitted it only finishes a stage the job needs with the same
+    fingerprint (the job's stage waits for it), and it retries later when
+    real jobs need the workers.
+    """
+    from flask import current_app
+    
+    video = Video.query.get(video_id)
+    if not video or video.status != 'uploaded':
+        return "Skipped"
+    
+    settings = SpeculativeService.settings_for(video.user)
+    processor = VideoProcessor(video, settings, video.user)
+    fingerprints = processor.analysis_fingerprints()
+    
+    def still_wanted():
+        db.session.refresh(video)
+        return video.status == 'uploaded'
+    
+    def useful(stage):
+        """Not submitted yet, or its job will use this result of <stage>"""
+        return still_wanted() or SpeculativeService.wanted_by_job(video, stage, fingerprints[stage])
+    
+    def keep_going(stage, renew):
+        """Between Whisper windows: keep the lock, stop if useless, yield to real jobs"""
+        renew()
+        if not useful(stage):
+            raise Preempted(f"Video {video_id} was submitted with other {stage} settings")
+        if video.status == 'uploaded':
+            SpeculativeService.check(video)
+    
+    if DedupService.adopt_analyses(video, fingerprints):
+        return "Adopted from an identical upload"
+    
+    try:
+        SpeculativeService.check(video)
         
-        # Save analytics
-        AnalyticsService.record_processing(video, selected_clips, sentiment_data)
+        if not (CheckpointService.is_valid(video_id, 'extract_audio', fingerprints['extract_audio'])
+                and processor.audio_path.exists()):
+            with SpeculativeService.hold(video_id, 'extract_audio', fingerprints['extract_audio']):
+                # Staged aside: a job submitted meanwhile with another range
+                # may be writing its own audio
+                staged = processor.extract_audio(processor.temp_dir / f"{video_id}_audio.speculative.wav")
+                if not useful('extract_audio'):
+                    staged.unlink(missing_ok=True)
+                    return "Taken over by processing"
+                os.replace(staged, processor.audio_path)
+                CheckpointService.record(video_id, 'extract_audio', fingerprints['extract_audio'], processor.audio_path)
         
-        # Final update (100%)
-        self.update_state(state='SUCCESS', meta={'stage': 'Completed', 'progress': 100})
+        if not still_wanted():
+            return "Taken over by processing"
+        SpeculativeService.check(video)
         
-        return {
-            'video_id': video.id,
-            'clips_generated': len(selected_clips),
-            'status': 'completed'
-        }
+        if not (video.sentiment_data is not None and
+                CheckpointService.is_valid(video_id, 'analyze_sentiment', fingerprints['analyze_sentiment'])):
+            with SpeculativeService.hold(video_id, 'analyze_sentiment', fingerprints['analyze_sentiment']):
+                sentiment_data = processor.analyze_sentiment(processor.audio_path)
+                if not useful('analyze_sentiment'):
+                    return "Taken over by processing"
+                video.sentiment_data = sentiment_data
+                db.session.commit()
+                CheckpointService.record(video_id, 'analyze_sentiment', fingerprints['analyze_sentiment'], 'videos.sentiment_data')
+        
+        if not still_wanted():
+            return "Taken over by processing"
+        SpeculativeService.check(video)
+        
+        if not (video.transcription is not None and
+                CheckpointService.is_valid(video_id, 'transcribe', fingerprints['transcribe'])):
+            with SpeculativeService.hold(video_id, 'transcribe', fingerprints['transcribe']) as renew:
+                # Checked between Whisper windows (finished windows are lost)
+                transcription = processor.transcribe_audio(
+                    processor.audio_path,
+                    cancel_check=lambda: keep_going('transcribe', renew)
+                )
+                if not useful('transcribe'):
+                    return "Taken over by processing"
+                video.transcription = transcription
+                db.session.commit()
+                CheckpointService.record(video_id, 'transcribe', fingerprints['transcribe'], 'videos.transcription')
     
-    except Exception as e:
-        # Handle errors
-        if video_id:
-            video = Video.query.get(video_id)
-            if video:
-                video.mark_as_failed(str(e))
+    except Preempted as e:
+        db.session.rollback()
+        if not still_wanted():
+            # Submitted: its pipeline runs whatever is left
+            return f"Stopped: {e}"
+        if self.request.retries >= current_app.config.get('SPECULATIVE_MAX_RETRIES', 20):
+            return f"Abandoned: {e}"
+        raise self.retry(countdown=current_app.config.get('SPECULATIVE_RETRY_SECONDS', 60), max_retries=None)
+    
+    return "Pre-processed"
+
+
+@celery.task(name='tasks.dispatch_pending')
+def dispatch_pending_task():
+    """
+    Scheduled task that frees slots of jobs that ended without releasing
+    them and releases pending work
+    Run every 30 seconds
+    """
+    _sweep_stalled_cancellations()
+    released = FairDispatcher.reconcile()
+    return f"Released {released} jobs"
+
+
+def _sweep_stalled_cancellations():
+    """
+    Finish cancellations no running stage picked up, e.g. when the revoked
+    root task never reached a worker
+    """
+    from flask import current_app
+    
+    grace = current_app.config.get('CANCEL_GRACE_SECONDS', 600)
+    for video in Video.query.filter_by(status='cancelling').all():
+        requested_at = CancellationService.requested_at(video.id)
+        if requested_at is None or time.time() - requested_at > grace:
+            _finish_cancellation(video)
+
+
+@celery.task(name='tasks.upgrade_degraded')
+def upgrade_degraded_task():
+    """
+    Re-run videos processed with degraded settings once the queue is calm
+    (ADMISSION_UPGRADE_PASS). Runs with the originally requested settings
+    beside the completed video, which keeps its status and clips until the
+    new ones are all rendered, and doesn't count toward monthly usage again.
+    Only videos whose last run is still the degraded one are queued, each once.
+    Run every 5 minutes
+    """
+    from flask import current_app
+    from app.services.admission_service import AdmissionController
+    
+    if not current_app.config.get('ADMISSION_UPGRADE_PASS', False):
+        return "Upgrade pass disabled"
+    
+    if AdmissionController.pressure()['level'] != 'normal':
+        return "Skipped: queue under pressure"
+    
+    videos = Video.query.filter(
+        Video.status == 'completed',
+        Video.degradation.isnot(None),
+        Video.upgrade_status.is_(None)
+    ).order_by(Video.processing_completed_at).limit(
+        current_app.config.get('ADMISSION_UPGRADE_BATCH', 2)
+    ).all()
+    
+    queued = 0
+    for video in videos:
+        # Re-processed with other settings since: nothing left to upgrade
+        if not AdmissionController.upgradable(video):
+            video.degradation = None
+            db.session.commit()
+            continue
         
-        raise
+        # Claim the run only if it is still the same completed one (not
+        # deleted, re-processed or claimed by an overlapping pass)
+        claimed = Video.query.filter(
+            Video.id == video.id,
+            Video.status == 'completed',
+            Video.upgrade_status.is_(None),
+            Video.processing_completed_at == video.processing_completed_at
+        ).update({'upgrade_status': 'queued'}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            continue
+        
+        db.session.refresh(video)
+        settings = dict(video.settings or {})
+        settings['upgrade_pass'] = True
+        FairDispatcher.submit(video, settings)
+        queued += 1
+    
+    return f"Queued {queued} upgrade passes"
+
+
+@celery.task(name='tasks.deliver_webhooks')
+def deliver_webhooks_task():
+    """
+    Drain the webhook outbox (batched, with retries and backoff)
+    Run every 15 seconds and right after a video completes or fails
+    """
+    from app.services.webhook_service import WebhookService
+    
+    delivered, failed = WebhookService.deliver_pending()
+    return f"Delivered {delivered} webhooks ({failed} failed attempts)"
 
 
 @celery.task(name='tasks.reset_monthly_usage')
@@ -190,6 +917,51 @@ def cleanup_old_files_task(days=7):
         raise
 
 
+@celery.task(name='tasks.expire_upload_sessions')
+def expire_upload_sessions_task():
+    """
+    Abort direct uploads that were never completed (S3 frees their parts)
+    Run hourly
+    """
+    from app.services.upload_service import UploadService
+    
+    return f"Aborted {UploadService.expire_sessions()} upload sessions"
+
+
+@celery.task(bind=True, name='tasks.ingest_video', max_retries=3)
+def ingest_video_task(self, video_id, content_hash=None):
+    """
+    Ingest a stored upload: probe its metadata, enforce the plan limits,
+    hash it (identical uploads share one copy), then mark it 'uploaded'
+    Progress is published like processing progress (status 'ingesting')
+    """
+    from app.services.upload_service import UploadService
+    
+    video = Video.query.get(video_id)
+    if not video or video.status != 'ingesting':
+        return "Skipped"
+    
+    try:
+        if not UploadService.ingest(video, content_hash):
+            return f"Rejected: {video.error_message}"
+    except Exception as e:
+        # e.g. storage errors while hashing: retried before giving up
+        db.session.rollback()
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=30)
+        
+        # Give up: drop the stored file (or the blob reference it already took)
+        try:
+            DedupService.release(video)
+        except Exception as release_error:
+            db.session.rollback()
+            print(f"Releasing the upload of video {video_id} failed: {release_error}")
+        video.mark_as_rejected(f"Ingest failed: {e}")
+        raise
+    
+    return f"Ingested {video.content_hash[:12]}"
+
+
 @celery.task(name='tasks.send_processing_complete_email')
 def send_processing_complete_email_task(user_id, video_id):
     """
@@ -36,6 +36,36 @@ def plan_required(*allowed_plans):
     return decorator
 
 
+def feature_required(feature):
+    """
+    Decorator to restrict endpoint access to plans that include a feature
+    Usage: @feature_required('api_access')
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            from flask import current_app
+            
+            user_id = get_jwt_identity()
+            user = User.query.get(user_id)
+            
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+            
+            features = current_app.config['PLANS'].get(user.plan, {}).get('features', [])
+            if feature not in features:
+                return jsonify({
+                    "error": "Upgrade required",
+                    "message": f"This feature requires a plan with {feature}",
+                    "current_plan": user.plan
+                }), 403
+            
+            return fn(*args, **kwargs)
+        
+        return wrapper
+    return decorator
+
+
 def check_usage_limit(resource_type='video'):
     """
     Decorator to check if user has remaining quota
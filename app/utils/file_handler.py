@@ -3,12 +3,26 @@
 File Handler Utilities
 """
 import os
+import threading
+import time
 import uuid
+import mimetypes
+from collections import OrderedDict
 from pathlib import Path
-from flask import current_app
+from urllib.parse import quote
+from flask import current_app, send_file
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+PRESIGNED_URL_KEY = 'presigned:{window}:{s3_key}'
+_presigned_urls = OrderedDict()
+_presigned_urls_lock = threading.Lock()
+
 
 def generate_unique_filename(original_filename, user_id):
     """Generate unique filename with user_id prefix"""
@@ -39,17 +53,58 @@ def save_uploaded_file(file, user_id, folder='upload'):
         return str(file_path), None
 
 
+def get_s3_client():
+    """
+    Per-process S3 client for the configured bucket
+    Clients are thread-safe and keep their keep-alive connection pool
+    between calls; keyed by pid so forked Celery children never share a
+    parent's sockets. AWS_ENDPOINT_URL points it at an S3-compatible store
+    (e.g. MinIO).
+    """
+    config = current_app.config
+    key = (os.getpid(), config.get('AWS_ENDPOINT_URL'), config['AWS_REGION'], config['AWS_ACCESS_KEY_ID'])
+    
+    client = _s3_clients.get(key)
+    if client is None:
+        with _s3_clients_lock:
+            client = _s3_clients.get(key)
+            if client is None:
+                # Sessions aren't thread-safe; each client gets its own
+                client = boto3.session.Session().client(
+                    's3',
+                    aws_access_key_id=config['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=config['AWS_SECRET_ACCESS_KEY'],
+                    region_name=config['AWS_REGION'],
+                    endpoint_url=config.get('AWS_ENDPOINT_URL'),
+                    config=Config(
+                        s3={'addressing_style': config.get('AWS_S3_ADDRESSING_STYLE', 'auto')},
+                        max_pool_connections=config.get('S3_MAX_POOL_CONNECTIONS', 32),
+                        tcp_keepalive=True,
+                        retries={'max_attempts': config.get('S3_MAX_ATTEMPTS', 5), 'mode': 'standard'}
+                    )
+                )
+                _s3_clients[key] = client
+    
+    return client
+
+
+def get_transfer_config():
+    """Multipart settings of uploads and downloads (parts move concurrently)"""
+    config = current_app.config
+    return TransferConfig(
+        multipart_threshold=config.get('S3_MULTIPART_THRESHOLD', 64 * 1024 * 1024),
+        multipart_chunksize=config.get('S3_MULTIPART_CHUNKSIZE', 64 * 1024 * 1024),
+        max_concurrency=config.get('S3_TRANSFER_CONCURRENCY', 8),
+        use_threads=True
+    )
+
+
 def upload_to_s3(file, filename, folder='upload'):
     """
     Upload file to S3
     Returns: S3 key
     """
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
-        region_name=current_app.config['AWS_REGION']
-    )
+    s3_client = get_s3_client()
     
     bucket_name = current_app.config['AWS_BUCKET_NAME']
     s3_key = f"{folder}/{filename}"
@@ -59,7 +114,8 @@ def upload_to_s3(file, filename, folder='upload'):
             file,
             bucket_name,
             s3_key,
-            ExtraArgs={'ContentType': file.content_type}
+            ExtraArgs={'ContentType': file.content_type},
+            Config=get_transfer_config()
         )
         return s3_key
     except ClientError as e:
@@ -68,30 +124,51 @@ def upload_to_s3(file, filename, folder='upload'):
 
 def download_from_s3(s3_key, local_path):
     """Download file from S3 to local path"""
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
-        region_name=current_app.config['AWS_REGION']
-    )
+    s3_client = get_s3_client()
     
     bucket_name = current_app.config['AWS_BUCKET_NAME']
     
     try:
-        s3_client.download_file(bucket_name, s3_key, str(local_path))
+        s3_client.download_file(bucket_name, s3_key, str(local_path), Config=get_transfer_config())
         return True
     except ClientError as e:
         raise Exception(f"S3 download failed: {str(e)}")
 
 
+def head_s3_object(s3_key):
+    """Size and ETag of an S3 object"""
+    s3_client = get_s3_client()
+    
+    try:
+        response = s3_client.head_object(Bucket=current_app.config['AWS_BUCKET_NAME'], Key=s3_key)
+        return {'size': response['ContentLength'], 'etag': response['ETag'].strip('"')}
+    except ClientError as e:
+        raise Exception(f"S3 head failed: {str(e)}")
+
+
+def get_s3_object_size(s3_key):
+    """Size of an S3 object in bytes"""
+    return head_s3_object(s3_key)['size']
+
+
+def read_s3_range(s3_key, start, length):
+    """Read <length> bytes of an S3 object from offset <start> (ranged GET)"""
+    s3_client = get_s3_client()
+    
+    try:
+        response = s3_client.get_object(
+            Bucket=current_app.config['AWS_BUCKET_NAME'],
+            Key=s3_key,
+            Range=f"bytes={start}-{start + length - 1}"
+        )
+        return response['Body'].read()
+    except ClientError as e:
+        raise Exception(f"S3 ranged read failed: {str(e)}")
+
+
 def generate_s3_presigned_url(s3_key, expiration=3600):
     """Generate presigned URL for S3 object"""
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
-        region_name=current_app.config['AWS_REGION']
-    )
+    s3_client = get_s3_client()
     
     bucket_name = current_app.config['AWS_BUCKET_NAME']
     
@@ -106,16 +183,80 @@ def generate_s3_presigned_url(s3_key, expiration=3600):
         raise Exception(f"Failed to generate presigned URL: {str(e)}")
 
 
+def _presign_window():
+    """
+    Current reuse window of presigned URLs: (cache key part, seconds left)
+    A URL signed in a window is handed out until the window ends, so it
+    always has at least PRESIGNED_URL_MIN_VALIDITY seconds to live.
+    """
+    expiry = current_app.config.get('PRESIGNED_URL_EXPIRY', 3600)
+    window = max(1, expiry - current_app.config.get('PRESIGNED_URL_MIN_VALIDITY', 900))
+    now = time.time()
+    return int(now // window), int(window - now % window) + 1
+
+
+def get_presigned_urls(s3_keys):
+    """
+    Presigned URLs of several S3 objects, reused within their expiry window
+    Looked up in a per-process LRU, then (with PRESIGNED_URL_CACHE_REDIS)
+    in Redis with a single MGET; only the misses are signed.
+    Returns: {s3_key: url}
+    """
+    expiry = current_app.config.get('PRESIGNED_URL_EXPIRY', 3600)
+    window, ttl = _presign_window()
+    urls = {}
+    
+    with _presigned_urls_lock:
+        for s3_key in s3_keys:
+            url = _presigned_urls.get((s3_key, window))
+            if url is not None:
+                _presigned_urls.move_to_end((s3_key, window))
+                urls[s3_key] = url
+    
+    missing = [s3_key for s3_key in dict.fromkeys(s3_keys) if s3_key not in urls]
+    signed = {}
+    
+    if missing and current_app.config.get('PRESIGNED_URL_CACHE_REDIS'):
+        from app.utils.redis_client import get_redis
+        r = get_redis()
+        redis_keys = [PRESIGNED_URL_KEY.format(window=window, s3_key=s3_key) for s3_key in missing]
+        
+        for s3_key, url in zip(missing, r.mget(redis_keys)):
+            if url is not None:
+                urls[s3_key] = url
+            else:
+                signed[s3_key] = generate_s3_presigned_url(s3_key, expiration=expiry)
+        
+        if signed:
+            pipe = r.pipeline()
+            for s3_key, url in signed.items():
+                pipe.set(PRESIGNED_URL_KEY.format(window=window, s3_key=s3_key), url, ex=ttl)
+            pipe.execute()
+    else:
+        signed = {s3_key: generate_s3_presigned_url(s3_key, expiration=expiry) for s3_key in missing}
+    
+    urls.update(signed)
+    
+    with _presigned_urls_lock:
+        max_size = current_app.config.get('PRESIGNED_URL_CACHE_SIZE', 10000)
+        for s3_key in missing:
+            _presigned_urls[(s3_key, window)] = urls[s3_key]
+        while len(_presigned_urls) > max_size:
+            _presigned_urls.popitem(last=False)
+    
+    return urls
+
+
+def get_presigned_url(s3_key):
+    """Presigned URL of an S3 object, reused within its expiry window"""
+    return get_presigned_urls([s3_key])[s3_key]
+
+
 def delete_file(file_path=None, s3_key=None):
     """Delete file from local storage or S3"""
     if s3_key:
         # Delete from S3
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
-            region_name=current_app.config['AWS_REGION']
-        )
+        s3_client = get_s3_client()
         
         bucket_name = current_app.config['AWS_BUCKET_NAME']
         
@@ -136,6 +277,76 @@ def delete_file(file_path=None, s3_key=None):
     return False
 
 
+def send_local_file(file_path, download_name=None, as_attachment=True, mimetype=None, max_age=None, private=False):
+    """
+    Serve a local file (call only after the request has been authorized)
+    
+    With USE_X_ACCEL_REDIRECT the response carries no body and nginx
+    streams the file from an internal location. Otherwise Werkzeug answers
+    Range, If-None-Match and If-Modified-Since requests itself.
+    private=True keeps a cacheable (max_age) response out of shared caches,
+    for files that need the user's token.
+    """
+    file_path = Path(file_path).resolve()
+    download_name = download_name or file_path.name
+    
+    if current_app.config.get('USE_X_ACCEL_REDIRECT'):
+        internal_uri = get_x_accel_uri(file_path)
+        if internal_uri:
+            response = current_app.response_class(
+                mimetype=mimetype or mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+            )
+            response.headers['X-Accel-Redirect'] = internal_uri
+            if as_attachment:
+                response.headers['Content-Disposition'] = _content_disposition(download_name)
+            if max_age is not None:
+                response.cache_control.max_age = max_age
+            return _cache_privately(response) if private else response
+    
+    response = send_file(
+        str(file_path),
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=True,
+        max_age=max_age
+    )
+    return _cache_privately(response) if private else response
+
+
+def _cache_privately(response):
+    """Cache-Control: private (send_file marks max_age responses public)"""
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.vary.add('Authorization')
+    return response
+
+
+def get_x_accel_uri(file_path):
+    """Map a local path to its nginx internal location (None if unmapped)"""
+    file_path = Path(file_path).resolve()
+    
+    for folder, location in current_app.config.get('X_ACCEL_LOCATIONS', {}).items():
+        try:
+            relative = file_path.relative_to(Path(folder).resolve())
+        except ValueError:
+            continue
+        return location.rstrip('/') + '/' + quote(relative.as_posix())
+    
+    return None
+
+
+def _content_disposition(filename):
+    """Build an attachment Content-Disposition header value"""
+    try:
+        filename.encode('latin-1')
+        escaped = filename.replace('\\', '\\\\').replace('"', '\\"')
+        return f'attachment; filename="{escaped}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
 def get_file_size_mb(file_path):
     """Get file size in MB"""
     if Path(file_path).exists():
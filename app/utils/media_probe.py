@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Media Probe
+Reads video metadata with ffprobe from the container headers, without
+decoding frames. Works on local paths and on (presigned) URLs, where
+ffprobe only fetches the byte ranges it needs.
+"""
+import json
+import statistics
+import subprocess
+from flask import current_app
+
+
+class ProbeError(Exception):
+    """ffprobe couldn't read the file"""
+
+
+def _ffprobe(source, args):
+    command = [current_app.config.get('FFPROBE_BINARY', 'ffprobe'), '-v', 'error', '-print_format', 'json']
+    if str(source).startswith(('http://', 'https://')):
+        command += ['-reconnect', '1', '-reconnect_delay_max', '10']
+    command += args + [str(source)]
+    
+    try:
+        result = subprocess.run(
+            command, capture_output=True, text=True,
+            timeout=current_app.config.get('PROBE_TIMEOUT_SECONDS', 30)
+        )
+    except subprocess.TimeoutExpired:
+        raise ProbeError("ffprobe timed out")
+    
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe exited with {result.returncode}")
+    return json.loads(result.stdout or '{}')
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(stream):
+    """fps from '30000/1001'-style rates (average rate first)"""
+    for key in ('avg_frame_rate', 'r_frame_rate'):
+        numerator, _, denominator = (stream.get(key) or '').partition('/')
+        numerator, denominator = _number(numerator), _number(denominator or 1)
+        if numerator and denominator:
+            return round(numerator / denominator, 3)
+    return None
+
+
+def _rotation(stream):
+    """Clockwise display rotation in degrees (rotate tag or display matrix)"""
+    rotate = _number((stream.get('tags') or {}).get('rotate'))
+    if rotate is None:
+        for side_data in stream.get('side_data_list') or []:
+            if _number(side_data.get('rotation')) is not None:
+                # The display matrix rotates counter-clockwise
+                rotate = -_number(side_data['rotation'])
+                break
+    return int(round(rotate or 0)) % 360
+
+
+def _keyframe_interval_ms(source):
+    """Median keyframe spacing of the first PROBE_KEYFRAME_SECONDS of video (ms)"""
+    seconds = current_app.config.get('PROBE_KEYFRAME_SECONDS', 30)
+    packets = _ffprobe(source, [
+        '-select_streams', 'v:0',
+        '-read_intervals', f'%+{seconds}',
+        '-show_entries', 'packet=pts_time,flags'
+    ]).get('packets') or []
+    
+    keyframes = sorted(
+        time for time in (_number(packet.get('pts_time')) for packet in packets if 'K' in (packet.get('flags') or ''))
+        if time is not None
+    )
+    if len(keyframes) < 2:
+        return None
+    
+    intervals = [later - earlier for earlier, later in zip(keyframes, keyframes[1:])]
+    return int(round(statistics.median(intervals) * 1000))
+
+
+def probe_media(source):
+    """
+    Metadata of a video file or URL
+    Returns: {duration, width, height (as displayed), fps, codec, rotation,
+    bit_rate, has_audio, audio_codec, keyframe_interval_ms, format_name,
+    streams: [{index, type, codec, ...}]}
+    """
+    info = _ffprobe(source, ['-show_format', '-show_streams'])
+    streams = info.get('streams') or []
+    container = info.get('format') or {}
+    
+    video_stream = next((s for s in streams if s.get('codec_type') == 'video'
+                         and not (s.get('disposition') or {}).get('attached_pic')), None)
+    if video_stream is None:
+        raise ProbeError("No video stream")
+    audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    
+    rotation = _rotation(video_stream)
+    width, height = video_stream.get('width'), video_stream.get('height')
+    if rotation in (90, 270):
+        width, height = height, width
+    
+    duration = _number(container.get('duration')) or _number(video_stream.get('duration'))
+    if not duration:
+        raise ProbeError("Unknown duration")
+    
+    try:
+        keyframe_interval_ms = _keyframe_interval_ms(source)
+    except ProbeError:
+        keyframe_interval_ms = None
+    
+    return {
+        'duration': duration,
+        'width': width,
+        'height': height,
+        'fps': _frame_rate(video_stream),
+        'codec': video_stream.get('codec_name') or 'unknown',
+        'rotation': rotation,
+        'bit_rate': _number(container.get('bit_rate'), int) or _number(video_stream.get('bit_rate'), int),
+        'has_audio': audio_stream is not None,
+        'audio_codec': audio_stream.get('codec_name') if audio_stream else None,
+        'keyframe_interval_ms': keyframe_interval_ms,
+        'format_name': container.get('format_name'),
+        'streams': [
+            {
+                'index': stream.get('index'),
+                'type': stream.get('codec_type'),
+                'codec': stream.get('codec_name'),
+                'bit_rate': _number(stream.get('bit_rate'), int),
+                **({
+                    'width': stream.get('width'),
+                    'height': stream.get('height'),
+                    'fps': _frame_rate(stream),
+                    'pix_fmt': stream.get('pix_fmt')
+                } if stream.get('codec_type') == 'video' else {}),
+                **({
+                    'sample_rate': _number(stream.get('sample_rate'), int),
+                    'channels': stream.get('channels')
+                } if stream.get('codec_type') == 'audio' else {})
+            }
+            for stream in streams
+        ]
+    }
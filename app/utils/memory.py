@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Memory budget helpers
+Peak RSS of a block (worker process plus children such as ffmpeg) is
+sampled in a background thread, reported, and enforced against a budget
+"""
+import threading
+from contextlib import contextmanager
+import psutil
+
+
+class MemoryBudgetExceeded(Exception):
+    """A stage went over its memory budget"""
+
+
+def current_rss_mb(include_children=True):
+    """Resident memory of this process (and its children) in MB"""
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    
+    if include_children:
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+    
+    return rss / (1024 * 1024)
+
+
+class MemoryUsage:
+    """Peak RSS of a monitored block"""
+    
+    def __init__(self, budget_mb=None):
+        self.budget_mb = budget_mb
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+        self.exceeded = False
+    
+    def sample(self):
+        rss = current_rss_mb()
+        self.peak_mb = max(self.peak_mb, rss)
+        if self.budget_mb and rss > self.budget_mb:
+            self.exceeded = True
+        return rss
+    
+    def check(self):
+        """Raise MemoryBudgetExceeded (call between windows of long work)"""
+        self.sample()
+        if self.exceeded:
+            raise MemoryBudgetExceeded(
+                f"Peak RSS {self.peak_mb:.0f} MB over the {self.budget_mb} MB budget"
+            )
+    
+    def to_dict(self):
+        return {
+            'peak_rss_mb': round(self.peak_mb, 1),
+            'start_rss_mb': round(self.start_mb, 1)
+        }
+
+
+@contextmanager
+def memory_budget(budget_mb=None, interval=0.5):
+    """
+    Track the peak RSS of a block and enforce an optional budget
+    Over budget, child processes are killed right away; in-process work is
+    stopped at its next check() or when the block ends.
+    """
+    usage = MemoryUsage(budget_mb)
+    stop = threading.Event()
+    
+    def poll():
+        while not stop.wait(interval):
+            usage.sample()
+            if usage.exceeded:
+                from app.services.cancellation_service import CancellationService
+                CancellationService.kill_child_processes()
+                return
+    
+    watcher = threading.Thread(target=poll, name='memory-budget', daemon=True)
+    watcher.start()
+    
+    try:
+        yield usage
+    except Exception as e:
+        if usage.exceeded:
+            raise MemoryBudgetExceeded(
+                f"Peak RSS {usage.peak_mb:.0f} MB over the {budget_mb} MB budget"
+            ) from e
+        raise
+    finally:
+        stop.set()
+        watcher.join()
+    
+    usage.check()
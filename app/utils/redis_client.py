@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Redis Client
+"""
+import os
+import redis
+from flask import current_app
+
+_clients = {}
+
+
+def get_redis():
+    """
+    Per-process Redis client for REDIS_URL
+    Keyed by pid so forked Celery children never share a parent's sockets
+    """
+    url = current_app.config['REDIS_URL']
+    key = (os.getpid(), url)
+    
+    client = _clients.get(key)
+    if client is None:
+        client = redis.Redis.from_url(url, decode_responses=True)
+        _clients[key] = client
+    
+    return client
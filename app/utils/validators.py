@@ -5,7 +5,7 @@ Input Validators
 import os
 import mimetypes
 from werkzeug.utils import secure_filename
-import moviepy.editor as mpy
+from app.utils.media_probe import probe_media
 
 
 def allowed_file(filename, allowed_extensions):
@@ -25,30 +25,44 @@ def validate_video_file(file, max_size_bytes):
     if file.filename == '':
         return False, "Empty filename", None
     
+    # Check file size (basic check before full read)
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell()
+    file.seek(0)  # Reset to beginning
+    
+    return validate_upload_metadata(file.filename, file_size, max_size_bytes)
+
+
+def validate_upload_metadata(filename, file_size, max_size_bytes):
+    """
+    Validate the name and size of a video before (or while) it is uploaded
+    Returns: (is_valid, error_message, file_info)
+    """
+    if not filename:
+        return False, "Empty filename", None
+    
     # Check extension
     from flask import current_app
     allowed_extensions = current_app.config['ALLOWED_EXTENSIONS']
     
-    if not allowed_file(file.filename, allowed_extensions):
+    if not allowed_file(filename, allowed_extensions):
         return False, f"Invalid file type. Allowed: {', '.join(allowed_extensions)}", None
     
-    # Check file size (basic check before full read)
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)  # Reset to beginning
+    if file_size <= 0:
+        return False, "Empty file", None
     
     if file_size > max_size_bytes:
         max_mb = max_size_bytes / (1024 * 1024)
         return False, f"File too large (max {max_mb:.0f}MB)", None
     
     # Check MIME type
-    mime_type = mimetypes.guess_type(file.filename)[0]
+    mime_type = mimetypes.guess_type(filename)[0]
     if not mime_type or not mime_type.startswith('video/'):
         return False, "File does not appear to be a video", None
     
     file_info = {
-        'original_filename': file.filename,
-        'secure_filename': secure_filename(file.filename),
+        'original_filename': filename,
+        'secure_filename': secure_filename(filename),
         'file_size': file_size,
         'file_size_mb': round(file_size / (1024 * 1024), 2),
         'mime_type': mime_type
@@ -59,41 +73,43 @@ def validate_video_file(file, max_size_bytes):
 
 def validate_video_properties(video_path, user_plan_limits):
     """
-    Validate video properties using MoviePy
-    Returns: (is_valid, error_message, video_metadata)
+    Validate video properties from an ffprobe header probe
+    video_path may be a local path or a (presigned) URL
+    Returns: (is_valid, error_message, video_metadata); video_metadata
+    carries the full probe as 'media_info'
     """
     try:
-        with mpy.VideoFileClip(str(video_path)) as clip:
-            duration = clip.duration
-            width, height = clip.size
-            fps = clip.fps
-            
-            # Check duration limits
-            max_duration = user_plan_limits.get('max_video_duration', -1)
-            if max_duration != -1 and duration > max_duration:
-                return False, f"Video duration ({duration:.0f}s) exceeds plan limit ({max_duration}s)", None
-            
-            # Check minimum duration
-            if duration < 5:
-                return False, "Video too short (minimum 5 seconds)", None
-            
-            # Check resolution
-            if width < 320 or height < 240:
-                return False, "Video resolution too low (minimum 320x240)", None
-            
-            video_metadata = {
-                'duration': duration,
-                'width': width,
-                'height': height,
-                'fps': fps,
-                'has_audio': clip.audio is not None,
-                'codec': getattr(clip.reader, 'infos', {}).get('video_codec', 'unknown')
-            }
-            
-            return True, None, video_metadata
-    
+        media_info = probe_media(video_path)
     except Exception as e:
         return False, f"Invalid video file: {str(e)}", None
+    
+    duration = media_info['duration']
+    width, height = media_info['width'] or 0, media_info['height'] or 0
+    
+    # Check duration limits
+    max_duration = user_plan_limits.get('max_video_duration', -1)
+    if max_duration != -1 and duration > max_duration:
+        return False, f"Video duration ({duration:.0f}s) exceeds plan limit ({max_duration}s)", None
+    
+    # Check minimum duration
+    if duration < 5:
+        return False, "Video too short (minimum 5 seconds)", None
+    
+    # Check resolution
+    if width < 320 or height < 240:
+        return False, "Video resolution too low (minimum 320x240)", None
+    
+    video_metadata = {
+        'duration': duration,
+        'width': width,
+        'height': height,
+        'fps': media_info['fps'],
+        'has_audio': media_info['has_audio'],
+        'codec': media_info['codec'],
+        'media_info': media_info
+    }
+    
+    return True, None, video_metadata
 
 
 def validate_clip_parameters(data, video_duration):
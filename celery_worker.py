@@ -2,13 +2,40 @@
 """
 Celery Worker Entry Point
 Run with: celery -A celery_worker.celery worker --loglevel=info
+
+One pool per resource class (queues and sizing come from WORKER_POOLS):
+    WORKER_POOL=analysis celery -A celery_worker.celery worker -n analysis@%h
+    WORKER_POOL=render celery -A celery_worker.celery worker -n render@%h
+    WORKER_POOL=maintenance celery -A celery_worker.celery worker -n maintenance@%h
 """
 import os
+from kombu import Queue
+from celery.signals import task_received
 from app import create_app, celery
 
 # Create Flask app context
 flask_app = create_app(os.getenv('FLASK_ENV', 'development'))
 flask_app.app_context().push()
 
+# Pool queues and sizing from config (command line flags still take precedence)
+pool = flask_app.config.get('WORKER_POOLS', {}).get(os.getenv('WORKER_POOL', ''))
+if pool:
+    celery.conf.update(
+        CELERY_QUEUES=[Queue(name) for name in pool['queues']],
+        CELERYD_CONCURRENCY=pool['concurrency'],
+        CELERYD_PREFETCH_MULTIPLIER=pool['prefetch_multiplier'],
+        CELERYD_MAX_MEMORY_PER_CHILD=pool['max_memory_per_child']
+    )
+
+# Download the inputs of reserved tasks while the current ones run
+# (needs a prefetch multiplier above 1: with acks_late the running task
+# still holds its reservation)
+if flask_app.config.get('INPUT_PREFETCH_ENABLED'):
+    from app.services.prefetch_service import InputPrefetcher
+    
+    @task_received.connect
+    def prefetch_input(request=None, **kwargs):
+        InputPrefetcher.on_task_received(flask_app, request)
+
 # Import tasks to register them
 from app.tasks.video_tasks import *
\ No newline at end of file
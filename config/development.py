@@ -33,10 +33,152 @@ class DevelopmentConfig:
     CELERY_RESULT_SERIALIZER = 'json'
     CELERY_ACCEPT_CONTENT = ['json']
     CELERY_TIMEZONE = 'America/Recife'
+    CELERY_ACKS_LATE = True  # A crashed (e.g. OOM-killed) worker requeues its task
+    
+    # Celery queues: one worker pool per resource class. Orchestration steps
+    # (process_video, select_clips, finalize_video) stay on the default queue.
+    CELERY_DEFAULT_QUEUE = 'default'
+    CELERY_ROUTES = {
+        'tasks.extract_audio': {'queue': 'analysis'},
+        'tasks.analyze_sentiment': {'queue': 'analysis'},
+        'tasks.transcribe_audio': {'queue': 'analysis'},
+        'tasks.analyze_shard': {'queue': 'analysis'},
+        'tasks.speculative_preprocess': {'queue': 'speculative'},
+        'tasks.render_clip': {'queue': 'render'},
+        'tasks.reset_monthly_usage': {'queue': 'maintenance'},
+        'tasks.cleanup_old_files': {'queue': 'maintenance'},
+        'tasks.expire_upload_sessions': {'queue': 'maintenance'},
+        'tasks.ingest_video': {'queue': 'ingest'},
+        'tasks.send_processing_complete_email': {'queue': 'maintenance'},
+        'tasks.dispatch_pending': {'queue': 'maintenance'},
+        'tasks.deliver_webhooks': {'queue': 'maintenance'},
+        'tasks.upgrade_degraded': {'queue': 'maintenance'}
+    }
+    
+    CELERYBEAT_SCHEDULE = {
+        'dispatch-pending': {
+            'task': 'tasks.dispatch_pending',
+            'schedule': timedelta(seconds=30)
+        },
+        'deliver-webhooks': {
+            'task': 'tasks.deliver_webhooks',
+            'schedule': timedelta(seconds=15)
+        },
+        'upgrade-degraded': {
+            'task': 'tasks.upgrade_degraded',
+            'schedule': timedelta(minutes=5)
+        },
+        'expire-upload-sessions': {
+            'task': 'tasks.expire_upload_sessions',
+            'schedule': timedelta(hours=1)
+        }
+    }
+    
+    # Worker pool sizing, selected with WORKER_POOL=<name> (see celery_worker.py)
+    # max_memory_per_child is in KiB; a child above it is replaced after its task
+    WORKER_POOLS = {
+        'analysis': {
+            'queues': os.getenv('ANALYSIS_WORKER_QUEUES', 'analysis,speculative').split(','),
+            'concurrency': int(os.getenv('ANALYSIS_WORKER_CONCURRENCY', 1)),
+            'prefetch_multiplier': int(os.getenv('ANALYSIS_WORKER_PREFETCH', 1)),
+            'max_memory_per_child': int(os.getenv('ANALYSIS_WORKER_MAX_MEMORY_KB', 4 * 1024 * 1024)),
+            'memory_budget_mb': int(os.getenv('ANALYSIS_MEMORY_BUDGET_MB', 3072))  # Peak RSS per task
+        },
+        'render': {
+            'queues': ['render'],
+            'concurrency': int(os.getenv('RENDER_WORKER_CONCURRENCY', 2)),
+            'prefetch_multiplier': int(os.getenv('RENDER_WORKER_PREFETCH', 2)),
+            'max_memory_per_child': int(os.getenv('RENDER_WORKER_MAX_MEMORY_KB', 2 * 1024 * 1024)),
+            'memory_budget_mb': int(os.getenv('RENDER_MEMORY_BUDGET_MB', 1536))
+        },
+        'maintenance': {
+            'queues': os.getenv('MAINTENANCE_WORKER_QUEUES', 'default,maintenance,ingest').split(','),
+            'concurrency': int(os.getenv('MAINTENANCE_WORKER_CONCURRENCY', 4)),
+            'prefetch_multiplier': int(os.getenv('MAINTENANCE_WORKER_PREFETCH', 4)),
+            'max_memory_per_child': int(os.getenv('MAINTENANCE_WORKER_MAX_MEMORY_KB', 512 * 1024))
+        }
+    }
     
     # Redis
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Fair scheduling: per-user pending lists released to workers in
+    # plan-weighted round robin (PLANS queue_weight / max_concurrent_jobs)
+    DISPATCH_MAX_IN_FLIGHT = int(os.getenv('DISPATCH_MAX_IN_FLIGHT', 4))
+    DISPATCH_DEFAULT_JOB_SECONDS = 300  # Used for start estimates until there is history
+    
+    # Speculative pre-processing: audio, features and transcription start
+    # on upload (low priority, yields to real jobs) and /process reuses them
+    SPECULATIVE_PREPROCESSING = os.getenv('SPECULATIVE_PREPROCESSING', 'false').lower() == 'true'
+    SPECULATIVE_BUSY_IN_FLIGHT = int(os.getenv('SPECULATIVE_BUSY_IN_FLIGHT', 2))  # Yield at this many running jobs
+    SPECULATIVE_RETRY_SECONDS = 60
+    SPECULATIVE_MAX_RETRIES = 20
+    SPECULATIVE_LOCK_TIMEOUT = 1800  # seconds; renewed between Whisper windows
+    SPECULATIVE_DEFER_SECONDS = 15  # A real stage retries this often while pre-processing runs it
+    
+    # Admission control: when the backlog (waiting + running jobs times the
+    # recent job time, per slot) passes these thresholds, jobs run with their
+    # plan's 'degradation' settings for that level
+    ADMISSION_ELEVATED_BACKLOG = int(os.getenv('ADMISSION_ELEVATED_BACKLOG', 600))  # seconds
+    ADMISSION_CRITICAL_BACKLOG = int(os.getenv('ADMISSION_CRITICAL_BACKLOG', 1800))
+    ADMISSION_UPGRADE_PASS = os.getenv('ADMISSION_UPGRADE_PASS', 'false').lower() == 'true'
+    ADMISSION_UPGRADE_BATCH = 2  # Degraded videos re-run per beat when the queue is calm
+    ADMISSION_UPGRADE_MAX_ATTEMPTS = 3  # Failed upgrade passes before a video keeps its degraded clips
+    
+    # ETA: per-stage least-squares models over recent stage timing samples
+    ETA_HISTORY_SAMPLES = 500
+    ETA_MIN_GROUP_SAMPLES = 20  # Per Whisper model / x264 preset, else stage-wide
+    ETA_MIN_EXTRA_SAMPLES = 5  # Samples beyond the feature count before a stage is regressed (else its mean)
+    ETA_MODEL_TTL = 600  # seconds a fitted model is cached in Redis
+    ETA_DEFAULT_CLIP_SECONDS = 45  # Clip length assumed before clips are selected
+    ETA_RENDER_PARALLELISM = int(os.getenv('RENDER_WORKER_CONCURRENCY', 2))
+    
+    # Sharding: long videos are analyzed in overlapping time shards on
+    # several analysis workers, then merged
+    SHARDING_ENABLED = os.getenv('SHARDING_ENABLED', 'true').lower() == 'true'
+    SHARD_MIN_DURATION = int(os.getenv('SHARD_MIN_DURATION', 1800))  # seconds
+    SHARD_TARGET_SECONDS = 600
+    SHARD_OVERLAP_SECONDS = 10
+    SHARD_MAX_SHARDS = int(os.getenv('SHARD_MAX_SHARDS', 4))  # Analysis slots across the cluster
+    
+    # Input prefetching: workers download the S3 inputs of reserved tasks in
+    # a background thread while the current task runs
+    INPUT_PREFETCH_ENABLED = os.getenv('INPUT_PREFETCH_ENABLED', 'true').lower() == 'true'
+    PREFETCH_THREADS = int(os.getenv('PREFETCH_THREADS', 2))
+    PREFETCH_MAX_BYTES = int(os.getenv('PREFETCH_MAX_BYTES', 10 * 1024 ** 3))  # Staged inputs per node
+    PREFETCH_STALL_SECONDS = 30  # A prefetch idle this long is abandoned and the stage downloads itself
+    
+    # Input cache: node-local, content-keyed LRU of S3 inputs shared by the
+    # workers on a host (keep it on TEMP_FOLDER's filesystem: jobs hard link)
+    INPUT_CACHE_ENABLED = os.getenv('INPUT_CACHE_ENABLED', 'true').lower() == 'true'
+    INPUT_CACHE_FOLDER = os.getenv('INPUT_CACHE_FOLDER')  # Default: TEMP_FOLDER/cache
+    INPUT_CACHE_MAX_BYTES = int(os.getenv('INPUT_CACHE_MAX_BYTES', 50 * 1024 ** 3))
+    
+    # Batch endpoints
+    BATCH_PROCESS_MAX_VIDEOS = 50
+    BATCH_STATUS_MAX_VIDEOS = 500
+    
+    # Progress events (Redis hash + pub/sub, streamed over SSE)
+    PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', 1.0))  # seconds between updates
+    PROGRESS_TTL = 86400
+    SSE_HEARTBEAT_SECONDS = 15
+    SSE_MAX_STREAM_SECONDS = 300  # Streams end and EventSource reconnects
+    
+    # Job cancellation (Redis flag checked by the running stages)
+    CANCEL_FLAG_TTL = 86400
+    CANCEL_POLL_SECONDS = 2  # How often a running render checks the flag
+    CANCEL_GRACE_SECONDS = 600  # Then the scheduler finishes the cancellation itself
+    
+    # Webhooks (outbox drained by tasks.deliver_webhooks)
+    WEBHOOK_TIMEOUT = 10  # seconds per request
+    WEBHOOK_MAX_ATTEMPTS = 8
+    WEBHOOK_BACKOFF_BASE = 30  # seconds, doubled per attempt
+    WEBHOOK_BACKOFF_MAX = 3600
+    WEBHOOK_BATCH_SIZE = 50
+    WEBHOOK_LEASE_SECONDS = 120
+    # Only for local setups: lets endpoints resolve to loopback/private addresses
+    WEBHOOK_ALLOW_PRIVATE_NETWORKS = os.getenv('WEBHOOK_ALLOW_PRIVATE_NETWORKS', 'false').lower() == 'true'
+    
     # File Upload
     UPLOAD_FOLDER = os.path.abspath('./uploads')
     DONE_FOLDER = os.path.abspath('./done')
@@ -44,9 +186,35 @@ class DevelopmentConfig:
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024 * 1024  # 5GB
     ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
     
+    # Direct uploads: clients PUT multipart parts to S3 with presigned URLs
+    UPLOAD_PART_SIZE = 64 * 1024 * 1024
+    UPLOAD_PART_URL_EXPIRY = 6 * 3600
+    UPLOAD_SESSION_TTL = 24 * 3600  # Unfinished sessions are aborted after this
+    UPLOAD_CHUNK_RATE_LIMIT = os.getenv('UPLOAD_CHUNK_RATE_LIMIT', '5000 per hour')  # Resumable HEAD/PATCH calls per client
+    
+    # Downloads (hand local file transfers to nginx via X-Accel-Redirect)
+    USE_X_ACCEL_REDIRECT = os.getenv('USE_X_ACCEL_REDIRECT', 'false').lower() == 'true'
+    X_ACCEL_LOCATIONS = {
+        UPLOAD_FOLDER: '/_protected/uploads/',
+        DONE_FOLDER: '/_protected/done/'
+    }
+    
+    # HLS preview packaging (stream copy of rendered clips into fMP4 segments)
+    ENABLE_HLS_PREVIEW = os.getenv('ENABLE_HLS_PREVIEW', 'false').lower() == 'true'
+    HLS_FOLDER = os.path.join(DONE_FOLDER, 'hls')
+    HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', 4))
+    FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+    
+    # Upload metadata probe (ffprobe reads container headers, ranged reads for URLs)
+    FFPROBE_BINARY = os.getenv('FFPROBE_BINARY', 'ffprobe')
+    PROBE_TIMEOUT_SECONDS = int(os.getenv('PROBE_TIMEOUT_SECONDS', 30))
+    PROBE_KEYFRAME_SECONDS = int(os.getenv('PROBE_KEYFRAME_SECONDS', 30))  # Video read to measure the keyframe interval
+    
     # AI Models
     WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')
     WHISPER_DEVICE = os.getenv('WHISPER_DEVICE', 'cpu')
+    TRANSCRIBE_WINDOW_SECONDS = int(os.getenv('TRANSCRIBE_WINDOW_SECONDS', 600))
+    SENTIMENT_BLOCK_SECONDS = 30  # Audio read per block by the sentiment analysis
     USE_GPU = os.getenv('USE_GPU', 'false').lower() == 'true'
     
     # Rate Limiting
@@ -58,8 +226,33 @@ class DevelopmentConfig:
     AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
     AWS_BUCKET_NAME = os.getenv('AWS_BUCKET_NAME')
     AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
+    AWS_ENDPOINT_URL = os.getenv('AWS_ENDPOINT_URL')  # S3-compatible store, e.g. http://localhost:9000 (MinIO)
+    AWS_S3_ADDRESSING_STYLE = os.getenv('AWS_S3_ADDRESSING_STYLE', 'auto')  # 'path' for most S3 stand-ins
     USE_S3 = all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_BUCKET_NAME])
     
+    # S3 client pool (one client per process, keep-alive connections) and
+    # multipart transfers with concurrent parts
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 32))
+    S3_MAX_ATTEMPTS = 5
+    S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', 64 * 1024 * 1024))
+    S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', 64 * 1024 * 1024))
+    S3_TRANSFER_CONCURRENCY = int(os.getenv('S3_TRANSFER_CONCURRENCY', 8))  # Parts in flight per transfer
+    
+    # Presigned download URLs are reused until PRESIGNED_URL_MIN_VALIDITY
+    # seconds before they expire (per-process LRU, optionally shared in Redis)
+    PRESIGNED_URL_EXPIRY = 3600
+    PRESIGNED_URL_MIN_VALIDITY = 900
+    PRESIGNED_URL_CACHE_SIZE = 10000
+    PRESIGNED_URL_CACHE_REDIS = os.getenv('PRESIGNED_URL_CACHE_REDIS', 'false').lower() == 'true'
+    
+    # Ranged reads: stages give ffmpeg a presigned URL and fetch only the
+    # ranges they decode when the input's MP4 index (moov) can be located;
+    # other layouts are downloaded whole
+    S3_RANGED_READS = os.getenv('S3_RANGED_READS', 'true').lower() == 'true'
+    S3_READ_URL_EXPIRY = 6 * 3600  # seconds; must outlast the longest stage
+    S3_LAYOUT_CACHE_TTL = 7 * 86400
+    ANALYSIS_RANGE_PADDING = 5  # seconds of context around a manual cut's analysis
+    
     # Stripe
     STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY')
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
@@ -80,6 +273,12 @@ class DevelopmentConfig:
             'videos_per_month': 5,
             'max_video_duration': 600,  # 10 minutes
             'max_clips_per_video': 3,
+            'queue_weight': 1,
+            'max_concurrent_jobs': 1,
+            'degradation': {
+                'elevated': {'whisper_model': 'base', 'render_preset': 'veryfast'},
+                'critical': {'whisper_model': 'tiny', 'render_preset': 'ultrafast', 'render_height': 1280}
+            },
             'features': ['basic_subtitles', 'manual_cut']
         },
         'pro': {
@@ -88,6 +287,12 @@ class DevelopmentConfig:
             'videos_per_month': 50,
             'max_video_duration': 3600,  # 1 hour
             'max_clips_per_video': 10,
+            'queue_weight': 3,
+            'max_concurrent_jobs': 2,
+            'degradation': {
+                'elevated': {'render_preset': 'faster'},
+                'critical': {'whisper_model': 'base', 'render_preset': 'veryfast'}
+            },
             'features': ['advanced_subtitles', 'auto_cut', 'watermark', 'hd_export']
         },
         'enterprise': {
@@ -96,6 +301,11 @@ class DevelopmentConfig:
             'videos_per_month': -1,  # Unlimited
             'max_video_duration': -1,
             'max_clips_per_video': -1,
+            'queue_weight': 6,
+            'max_concurrent_jobs': 4,
+            'degradation': {
+                'critical': {'render_preset': 'faster'}
+            },
             'features': ['all', 'api_access', 'priority_support', 'custom_branding']
         }
     }
\ No newline at end of file
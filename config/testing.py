@@ -1 +1,21 @@
-# Módulo: testing.py
+# -*- coding: utf-8 -*-
+"""
+Testing Configuration
+"""
+from config.development import DevelopmentConfig
+
+class TestingConfig(DevelopmentConfig):
+    """Test suite configuration (in-memory database, no rate limits)"""
+    
+    DEBUG = False
+    TESTING = True
+    
+    # Database
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ECHO = False
+    
+    # Rate limiting
+    RATELIMIT_ENABLED = False
+    
+    # Celery runs tasks in-process
+    CELERY_ALWAYS_EAGER = True
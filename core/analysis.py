@@ -7,33 +7,56 @@ import numpy as np
 import moviepy.editor as mpy
 
 
-def analyze_sentiment_from_audio(audio_path):
+def classify_energy(energy):
+    """
+    Classifica o sentimento baseado na energia RMS média
+    """
+    if energy > 0.1:
+        return "URGENTE"
+    elif energy > 0.05:
+        return "ALERTA"
+    return "NEUTRO"
+
+
+def analyze_sentiment_from_audio(audio_path, block_seconds=30):
     """
     Analisa o sentimento do áudio baseado em energia e pitch
+    Lê o áudio em blocos (librosa.stream), então a memória não cresce com
+    a duração do vídeo
     Retorna um dicionário com análise básica
     """
     try:
-        # Carrega o áudio
-        y, sr = librosa.load(audio_path, sr=16000)
+        sr = librosa.get_samplerate(str(audio_path))
+        frame_length, hop_length = 2048, 512
+        block_length = max(1, int(block_seconds * sr / hop_length))
         
-        # Calcula energia RMS
-        rms = librosa.feature.rms(y=y)[0]
-        energy = np.mean(rms)
+        rms_sum, rms_count = 0.0, 0
+        pitch_sum, pitch_count = 0.0, 0
         
-        # Calcula pitch médio
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-        pitch_mean = np.mean(pitches[pitches > 0]) if np.any(pitches > 0) else 0
+        for y in librosa.stream(
+            str(audio_path),
+            block_length=block_length,
+            frame_length=frame_length,
+            hop_length=hop_length,
+            mono=True,
+            fill_value=0
+        ):
+            # Energia RMS do bloco
+            rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length, center=False)[0]
+            rms_sum += float(rms.sum())
+            rms_count += rms.size
+            
+            # Pitch do bloco
+            pitches, magnitudes = librosa.piptrack(y=y, sr=sr, n_fft=frame_length, hop_length=hop_length, center=False)
+            voiced = pitches[pitches > 0]
+            pitch_sum += float(voiced.sum())
+            pitch_count += voiced.size
         
-        # Classifica sentimento baseado em energia
-        if energy > 0.1:
-            sentiment = "URGENTE"
-        elif energy > 0.05:
-            sentiment = "ALERTA"
-        else:
-            sentiment = "NEUTRO"
+        energy = rms_sum / rms_count if rms_count else 0
+        pitch_mean = pitch_sum / pitch_count if pitch_count else 0
         
         return {
-            "sentiment": sentiment,
+            "sentiment": classify_energy(energy),
             "energy": float(energy),
             "pitch_mean": float(pitch_mean),
             "confidence": 0.75
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark S3 client reuse and multipart transfers
+Compares a new boto3 client per call (the old helpers) with the pooled
+per-process client on presigned URL generation and HEAD requests, then
+measures upload/download throughput with the default and the configured
+TransferConfig. Point AWS_ENDPOINT_URL at a local stand-in (e.g. MinIO) to
+run it without AWS.
+
+Usage: python scripts/benchmark_s3.py [--calls 200] [--size-mb 512] [--create-bucket]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from flask import current_app
+
+from app import create_app
+from app.utils.file_handler import get_s3_client, get_transfer_config
+
+
+def new_client():
+    """A client built per call, as the helpers used to"""
+    config = current_app.config
+    return boto3.client(
+        's3',
+        aws_access_key_id=config['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=config['AWS_SECRET_ACCESS_KEY'],
+        region_name=config['AWS_REGION'],
+        endpoint_url=config.get('AWS_ENDPOINT_URL'),
+        config=Config(s3={'addressing_style': config.get('AWS_S3_ADDRESSING_STYLE', 'auto')})
+    )
+
+
+def per_call(make_client, calls, operation):
+    started = time.monotonic()
+    for _ in range(calls):
+        operation(make_client())
+    return (time.monotonic() - started) / calls * 1000
+
+
+def transfer(client, bucket, key, path, transfer_config):
+    size_mb = path.stat().st_size / (1024 * 1024)
+    
+    started = time.monotonic()
+    client.upload_file(str(path), bucket, key, Config=transfer_config)
+    upload = size_mb / (time.monotonic() - started)
+    
+    target = path.with_suffix('.download')
+    started = time.monotonic()
+    client.download_file(bucket, key, str(target), Config=transfer_config)
+    download = size_mb / (time.monotonic() - started)
+    
+    target.unlink()
+    client.delete_object(Bucket=bucket, Key=key)
+    return upload, download
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--create-bucket', action='store_true', help='Create AWS_BUCKET_NAME first (stand-ins)')
+    args = parser.parse_args()
+    
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    
+    with app.app_context(), tempfile.TemporaryDirectory() as tmp:
+        bucket = current_app.config['AWS_BUCKET_NAME']
+        client = get_s3_client()
+        if args.create_bucket:
+            try:
+                client.create_bucket(Bucket=bucket)
+            except client.exceptions.BucketAlreadyOwnedByYou:
+                pass
+        
+        # Small object for the per-call comparisons
+        probe_key = f"benchmark/{uuid.uuid4()}.bin"
+        client.put_object(Bucket=bucket, Key=probe_key, Body=b'0' * 1024)
+        
+        print(f"{'operation':<20}{'new client':>14}{'pooled':>14}")
+        for name, operation in [
+            ('presigned URL', lambda c: c.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': probe_key}, ExpiresIn=3600)),
+            ('HEAD object', lambda c: c.head_object(Bucket=bucket, Key=probe_key))
+        ]:
+            fresh = per_call(new_client, args.calls, operation)
+            pooled = per_call(get_s3_client, args.calls, operation)
+            print(f"{name:<20}{fresh:>11.2f} ms{pooled:>11.2f} ms")
+        
+        client.delete_object(Bucket=bucket, Key=probe_key)
+        
+        path = Path(tmp) / 'payload.bin'
+        with open(path, 'wb') as payload:
+            for _ in range(args.size_mb):
+                payload.write(os.urandom(1024 * 1024))
+        
+        print(f"\n{'transfer config':<20}{'upload':>14}{'download':>14}")
+        for name, transfer_config in [('default', TransferConfig()), ('configured', get_transfer_config())]:
+            upload, download = transfer(client, bucket, f"benchmark/{uuid.uuid4()}.bin", path, transfer_config)
+            print(f"{name:<20}{upload:>9.1f} MB/s{download:>9.1f} MB/s")
+    
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Profile peak memory of the streaming analysis stages
+Generates synthetic 16 kHz WAV inputs of different lengths and measures the
+peak RSS of sentiment analysis and of reading the transcription windows.
+Peak memory should stay flat as the input grows; exits 1 if it doesn't.
+
+Usage: python scripts/profile_memory.py [--minutes 10 120] [--whisper]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import soundfile as sf
+from flask import current_app
+
+from app import create_app
+from app.services.video_processor import VideoProcessor
+from app.utils.memory import memory_budget
+
+SAMPLE_RATE = 16000
+
+
+def write_wav(path, minutes, block_seconds=60):
+    """Write noise with speech-like energy bursts, one block at a time"""
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(str(path), 'w', samplerate=SAMPLE_RATE, channels=1, subtype='PCM_16') as wav:
+        for _ in range(int(minutes * 60 / block_seconds)):
+            t = np.arange(block_seconds * SAMPLE_RATE) / SAMPLE_RATE
+            block = 0.1 * np.sin(2 * np.pi * 220 * t) * (rng.random(t.size) > 0.3)
+            wav.write(block.astype(np.float32))
+
+
+def profile(processor, path, whisper_enabled):
+    results = {}
+    
+    with memory_budget() as usage:
+        processor.analyze_sentiment(path)
+    results['analyze_sentiment'] = usage.peak_mb - usage.start_mb
+    
+    with memory_budget() as usage:
+        if whisper_enabled:
+            processor.transcribe_audio(path)
+        else:
+            window_seconds = current_app.config.get('TRANSCRIBE_WINDOW_SECONDS', 600)
+            for _ in processor.iter_audio_windows(path, window_seconds):
+                pass
+    results['transcribe' if whisper_enabled else 'read_windows'] = usage.peak_mb - usage.start_mb
+    
+    return results
+
+
+class _Input:
+    """Minimal stand-in for the Video model (only the fields the stages read)"""
+    id = 0
+    s3_key = None
+    filename = 'profile.mp4'
+    
+    def __init__(self, path):
+        self.file_path = str(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--minutes', type=float, nargs='+', default=[10, 120])
+    parser.add_argument('--whisper', action='store_true', help='Run Whisper too (slow)')
+    parser.add_argument('--tolerance-mb', type=float, default=64)
+    args = parser.parse_args()
+    
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    
+    with app.app_context(), tempfile.TemporaryDirectory() as tmp:
+        rows = []
+        for minutes in args.minutes:
+            path = Path(tmp) / f"input_{minutes:g}min.wav"
+            write_wav(path, minutes)
+            
+            processor = VideoProcessor(_Input(path), {'whisper_model': 'tiny'}, None)
+            started = time.monotonic()
+            results = profile(processor, path, args.whisper)
+            rows.append((minutes, results, time.monotonic() - started))
+            path.unlink()
+        
+        print(f"{'input':>10}  " + "  ".join(f"{stage:>20}" for stage in rows[0][1]) + f"  {'seconds':>8}")
+        for minutes, results, seconds in rows:
+            cells = "  ".join(f"{peak:>17.1f} MB" for peak in results.values())
+            print(f"{minutes:>6g} min  {cells}  {seconds:>8.1f}")
+        
+        growth = {
+            stage: rows[-1][1][stage] - rows[0][1][stage]
+            for stage in rows[0][1]
+        }
+        flat = all(delta <= args.tolerance_mb for delta in growth.values())
+        print(f"\nPeak growth {rows[0][0]:g} -> {rows[-1][0]:g} min: " +
+              ", ".join(f"{stage} {delta:+.1f} MB" for stage, delta in growth.items()))
+        print("✓ Memory stays flat" if flat else "✗ Memory grows with input length")
+        
+        return 0 if flat else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
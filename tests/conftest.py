@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Shared test fixtures
+"""
+import pytest
+
+from app import create_app, db
+
+
+@pytest.fixture
+def app():
+    """Application on an in-memory database"""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Memory budget and streaming analysis
+Peak RSS of the windowed analysis stages must stay flat as the input grows.
+soundfile, librosa and the Whisper stack are required (requirements/base.txt),
+so a missing one fails collection instead of skipping the regression test.
+"""
+import math
+
+import imageio_ffmpeg
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.services import video_processor
+from app.utils.memory import memory_budget, MemoryBudgetExceeded, current_rss_mb
+
+SAMPLE_RATE = 16000
+
+# Allowed peak growth between a short and a long input
+TOLERANCE_MB = 48
+
+
+def _touch(size_mb):
+    """Really allocated (not just reserved) memory of size_mb"""
+    return np.ones(size_mb * 1024 * 1024, dtype=np.uint8)
+
+
+def test_memory_budget_tracks_peak():
+    with memory_budget(interval=0.05) as usage:
+        block = _touch(128)
+        usage.sample()
+        del block
+    
+    assert usage.peak_mb - usage.start_mb >= 100
+    assert usage.to_dict()['peak_rss_mb'] >= usage.to_dict()['start_rss_mb']
+
+
+def test_memory_budget_raises_over_budget():
+    budget_mb = int(current_rss_mb()) + 32
+    
+    with pytest.raises(MemoryBudgetExceeded):
+        with memory_budget(budget_mb, interval=0.05) as usage:
+            block = _touch(128)
+            usage.check()
+    del block
+
+
+def test_memory_budget_stays_quiet_under_budget():
+    with memory_budget(int(current_rss_mb()) + 512, interval=0.05) as usage:
+        usage.check()
+    
+    assert not usage.exceeded
+
+
+def _write_wav(path, minutes, block_seconds=60):
+    """Noise with speech-like energy bursts, written one block at a time"""
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(str(path), 'w', samplerate=SAMPLE_RATE, channels=1, subtype='PCM_16') as wav:
+        for _ in range(int(minutes * 60 / block_seconds)):
+            t = np.arange(block_seconds * SAMPLE_RATE) / SAMPLE_RATE
+            block = 0.1 * np.sin(2 * np.pi * 220 * t) * (rng.random(t.size) > 0.3)
+            wav.write(block.astype(np.float32))
+
+
+class _Input:
+    """Minimal stand-in for the Video model (only the fields the stages read)"""
+    s3_key = None
+    content_hash = None
+    filename = 'memory.mp4'
+    
+    def __init__(self, video_id, path):
+        self.id = video_id
+        self.file_path = str(path)
+
+
+class _StubWhisper:
+    """Whisper model stand-in: one segment per window, no inference"""
+    
+    def __init__(self):
+        self.window_sizes = []
+    
+    def transcribe(self, samples, **options):
+        self.window_sizes.append(samples.size)
+        end = samples.size / SAMPLE_RATE
+        return {
+            'text': ' janela',
+            'segments': [{
+                'start': 0.0,
+                'end': end,
+                'text': ' janela',
+                'words': [{'word': ' janela', 'start': 0.0, 'end': end}]
+            }]
+        }
+
+
+def _growth(stage):
+    """Run stage() under memory_budget; peak RSS growth in MB"""
+    with memory_budget(interval=0.05) as usage:
+        stage()
+    return usage.peak_mb - usage.start_mb
+
+
+@pytest.fixture
+def processing(app, tmp_path, monkeypatch):
+    app.config.update(
+        TEMP_FOLDER=str(tmp_path / 'temp'),
+        DONE_FOLDER=str(tmp_path / 'done'),
+        FFMPEG_BINARY=imageio_ffmpeg.get_ffmpeg_exe(),
+        TRANSCRIBE_WINDOW_SECONDS=300,
+        SENTIMENT_BLOCK_SECONDS=30
+    )
+    model = _StubWhisper()
+    monkeypatch.setattr(video_processor.whisper, 'load_model', lambda *args, **kwargs: model)
+    return model
+
+
+def test_extract_and_transcribe_memory_stays_flat(processing, tmp_path):
+    """
+    10 min vs 120 min input: the whole 120 min track as float32 would be
+    ~440 MB, the windows stay at TRANSCRIBE_WINDOW_SECONDS
+    """
+    window_seconds = 300
+    growth = {}
+    
+    for video_id, minutes in enumerate((10, 120), 1):
+        source = tmp_path / f"input_{minutes}min.wav"
+        _write_wav(source, minutes)
+        processor = video_processor.VideoProcessor(_Input(video_id, source), {'whisper_model': 'tiny'}, None)
+        processing.window_sizes.clear()
+        
+        extract = _growth(processor.extract_audio)
+        segments = []
+        transcribe = _growth(lambda: segments.extend(processor.transcribe_audio(processor.audio_path)))
+        growth[minutes] = (extract, transcribe)
+        
+        windows = math.ceil(minutes * 60 / window_seconds)
+        assert len(processing.window_sizes) == windows
+        assert max(processing.window_sizes) <= window_seconds * SAMPLE_RATE
+        assert segments[-1]['end'] == pytest.approx(minutes * 60, abs=0.1)
+        
+        source.unlink()
+        processor.audio_path.unlink()
+    
+    assert growth[120][0] - growth[10][0] <= TOLERANCE_MB
+    assert growth[120][1] - growth[10][1] <= TOLERANCE_MB
+
+
+def test_sentiment_memory_stays_flat(processing, tmp_path):
+    """
+    10 min vs 120 min input: the whole 120 min track as float32 would be
+    ~440 MB, librosa.stream keeps SENTIMENT_BLOCK_SECONDS
+    """
+    growth = {}
+    
+    for video_id, minutes in enumerate((10, 120), 1):
+        path = tmp_path / f"audio_{minutes}min.wav"
+        _write_wav(path, minutes)
+        processor = video_processor.VideoProcessor(_Input(video_id, path), {}, None)
+        
+        growth[minutes] = _growth(lambda: processor.analyze_sentiment(path))
+        path.unlink()
+    
+    assert growth[120] - growth[10] <= TOLERANCE_MB
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Per-process S3 clients and multipart transfers (botocore Stubber, no network)
+"""
+import io
+import os
+import threading
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber, ANY
+
+from app.utils import file_handler
+from app.utils.file_handler import get_s3_client, get_transfer_config, upload_to_s3, read_s3_range
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(app):
+    app.config.update(
+        AWS_ACCESS_KEY_ID='testing',
+        AWS_SECRET_ACCESS_KEY='testing',
+        AWS_BUCKET_NAME='binhocut-test',
+        AWS_REGION='us-east-1',
+        AWS_ENDPOINT_URL=None
+    )
+    file_handler._s3_clients.clear()
+    yield app
+    file_handler._s3_clients.clear()
+
+
+class _Upload(io.BytesIO):
+    """File-like upload with the content_type of a werkzeug FileStorage"""
+    content_type = 'video/mp4'
+
+
+def test_client_is_reused_within_a_process(s3):
+    client = get_s3_client()
+    
+    assert get_s3_client() is client
+    
+    seen = []
+    
+    def worker():
+        with s3.app_context():
+            seen.append(get_s3_client())
+    
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(seen) == 4
+    assert all(other is client for other in seen)
+
+
+def test_client_is_not_shared_after_fork(s3, monkeypatch):
+    parent = get_s3_client()
+    
+    monkeypatch.setattr(file_handler.os, 'getpid', lambda: -1)
+    child = get_s3_client()
+    
+    assert child is not parent
+    assert get_s3_client() is child
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_child_creates_its_own_client(s3):
+    parent = get_s3_client()
+    
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child = get_s3_client()
+            os._exit(0 if child is not parent and get_s3_client() is child else 1)
+        except BaseException:
+            os._exit(2)
+    
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert get_s3_client() is parent
+
+
+def test_client_follows_credentials_and_endpoint(s3):
+    client = get_s3_client()
+    
+    s3.config['AWS_ENDPOINT_URL'] = 'http://localhost:9000'
+    minio = get_s3_client()
+    
+    assert minio is not client
+    assert minio.meta.endpoint_url == 'http://localhost:9000'
+
+
+def test_client_pool_and_retries(s3):
+    s3.config.update(S3_MAX_POOL_CONNECTIONS=48, S3_MAX_ATTEMPTS=7)
+    config = get_s3_client().meta.config
+    
+    assert config.max_pool_connections == 48
+    assert config.retries['mode'] == 'standard'
+    # botocore counts the first request too
+    assert config.retries['total_max_attempts'] == 8
+    assert config.tcp_keepalive
+
+
+def test_transfer_config_thresholds(s3):
+    s3.config.update(S3_MULTIPART_THRESHOLD=16 * MB, S3_MULTIPART_CHUNKSIZE=8 * MB, S3_TRANSFER_CONCURRENCY=4)
+    config = get_transfer_config()
+    
+    assert config.multipart_threshold == 16 * MB
+    assert config.multipart_chunksize == 8 * MB
+    assert config.max_request_concurrency == 4
+    assert config.use_threads
+
+
+def test_transfer_config_defaults(s3):
+    for key in ('S3_MULTIPART_THRESHOLD', 'S3_MULTIPART_CHUNKSIZE', 'S3_TRANSFER_CONCURRENCY'):
+        s3.config.pop(key, None)
+    config = get_transfer_config()
+    
+    assert config.multipart_threshold == 64 * MB
+    assert config.multipart_chunksize == 64 * MB
+    assert config.max_request_concurrency == 8
+
+
+def test_upload_below_threshold_is_a_single_put(s3):
+    s3.config.update(S3_MULTIPART_THRESHOLD=8 * MB, S3_MULTIPART_CHUNKSIZE=5 * MB, S3_TRANSFER_CONCURRENCY=1)
+    
+    with Stubber(get_s3_client()) as stubber:
+        stubber.add_response('put_object', {'ETag': '"1"'}, {
+            'Bucket': 'binhocut-test', 'Key': 'upload/small.mp4', 'Body': ANY, 'ContentType': 'video/mp4',
+            'ChecksumAlgorithm': ANY
+        })
+        assert upload_to_s3(_Upload(bytes(MB)), 'small.mp4') == 'upload/small.mp4'
+        stubber.assert_no_pending_responses()
+
+
+def test_upload_above_threshold_is_multipart(s3):
+    s3.config.update(S3_MULTIPART_THRESHOLD=8 * MB, S3_MULTIPART_CHUNKSIZE=5 * MB, S3_TRANSFER_CONCURRENCY=1)
+    
+    with Stubber(get_s3_client()) as stubber:
+        stubber.add_response('create_multipart_upload', {'UploadId': 'u1'}, {
+            'Bucket': 'binhocut-test', 'Key': 'upload/large.mp4', 'ContentType': 'video/mp4',
+            'ChecksumAlgorithm': ANY
+        })
+        for part in (1, 2, 3):
+            stubber.add_response('upload_part', {'ETag': f'"{part}"'}, {
+                'Bucket': 'binhocut-test', 'Key': 'upload/large.mp4', 'UploadId': 'u1',
+                'PartNumber': part, 'Body': ANY, 'ChecksumAlgorithm': ANY
+            })
+        stubber.add_response('complete_multipart_upload', {}, {
+            'Bucket': 'binhocut-test', 'Key': 'upload/large.mp4', 'UploadId': 'u1', 'MultipartUpload': ANY
+        })
+        
+        # 11 MB in 5 MB parts
+        assert upload_to_s3(_Upload(bytes(11 * MB)), 'large.mp4') == 'upload/large.mp4'
+        stubber.assert_no_pending_responses()
+
+
+def test_read_s3_range_sends_range_header(s3):
+    with Stubber(get_s3_client()) as stubber:
+        stubber.add_response(
+            'get_object',
+            {'Body': StreamingBody(io.BytesIO(b'x' * 16), 16)},
+            {'Bucket': 'binhocut-test', 'Key': 'upload/a.mp4', 'Range': 'bytes=100-115'}
+        )
+        assert read_s3_range('upload/a.mp4', 100, 16) == b'x' * 16
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+MP4 layout detection from top-level box headers
+"""
+import io
+import struct
+
+from app.services.source_service import mp4_layout, STREAMABLE_LAYOUTS
+
+
+def _box(box_type, payload=b'', large=False):
+    """One ISO BMFF box; large uses the 64-bit size header"""
+    if large:
+        return struct.pack('>I4sQ', 1, box_type.encode('latin-1'), 16 + len(payload)) + payload
+    return struct.pack('>I4s', 8 + len(payload), box_type.encode('latin-1')) + payload
+
+
+def _reader(data):
+    """read_range over an in-memory buffer, counting the reads"""
+    buffer = io.BytesIO(data)
+    reads = []
+    
+    def read_range(offset, length):
+        reads.append((offset, length))
+        buffer.seek(offset)
+        return buffer.read(length)
+    
+    return read_range, reads
+
+
+def _layout(*boxes):
+    data = b''.join(boxes)
+    read_range, _ = _reader(data)
+    return mp4_layout(read_range, len(data))
+
+
+FTYP = _box('ftyp', b'isom\x00\x00\x02\x00isomiso2mp41')
+MOOV = _box('moov', _box('mvhd', bytes(100)))
+MDAT = _box('mdat', bytes(4096))
+
+
+def test_faststart():
+    assert _layout(FTYP, MOOV, MDAT) == 'faststart'
+    assert _layout(FTYP, _box('free', bytes(8)), MOOV, MDAT) == 'faststart'
+
+
+def test_moov_at_end():
+    assert _layout(FTYP, MDAT, MOOV) == 'moov_at_end'
+    assert _layout(FTYP, _box('free'), MDAT, _box('udta', bytes(32)), MOOV) == 'moov_at_end'
+
+
+def test_fragmented():
+    fragment = _box('moof', _box('mfhd', bytes(8))) + _box('mdat', bytes(512))
+    assert _layout(FTYP, MOOV, fragment, fragment) == 'fragmented'
+    assert 'fragmented' not in STREAMABLE_LAYOUTS
+
+
+def test_reads_one_header_per_box():
+    data = FTYP + MOOV + MDAT
+    read_range, reads = _reader(data)
+    
+    assert mp4_layout(read_range, len(data)) == 'faststart'
+    assert reads == [(0, 16), (len(FTYP), 16), (len(FTYP) + len(MOOV), 16)]
+
+
+def test_not_mp4():
+    assert _layout(b'\x1aE\xdf\xa3' + bytes(60)) is None  # Matroska/WebM
+    assert _layout(b'RIFF' + struct.pack('<I', 4) + b'AVI ') is None
+    assert _layout(b'') is None
+
+
+def test_mp4_without_moov():
+    assert _layout(FTYP, MDAT) is None
+    assert _layout(MOOV, MDAT) is None  # No leading ftyp
+
+
+def test_corrupt_box_size():
+    assert _layout(FTYP, struct.pack('>I4s', 4, b'moov'), MDAT) is None
+
+
+def test_64_bit_box_size():
+    assert _layout(FTYP, _box('mdat', bytes(1024), large=True), MOOV) == 'moov_at_end'
+    assert _layout(FTYP, MOOV, _box('mdat', bytes(1024), large=True)) == 'faststart'
+
+
+def test_64_bit_box_size_over_4_gib():
+    """An mdat larger than a 32-bit size can hold, read sparsely"""
+    mdat_size = 5 * 1024 ** 3
+    headers = {
+        0: FTYP,
+        len(FTYP): struct.pack('>I4sQ', 1, b'mdat', mdat_size),
+        len(FTYP) + mdat_size: MOOV
+    }
+    size = len(FTYP) + mdat_size + len(MOOV)
+    
+    def read_range(offset, length):
+        return headers.get(offset, b'')[:length]
+    
+    assert mp4_layout(read_range, size) == 'moov_at_end'
+
+
+def test_box_running_to_end_of_file():
+    """A size of 0 means the box extends to the end of the file"""
+    open_mdat = struct.pack('>I4s', 0, b'mdat') + bytes(2048)
+    assert _layout(FTYP, MOOV, open_mdat) == 'faststart'
+    assert _layout(FTYP, open_mdat, MOOV) is None  # moov is swallowed by the mdat
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Upgrade passes: clips are swapped in only once every render succeeded
+The dispatcher and status publishing (Redis) are patched out.
+"""
+import pytest
+
+from app import db
+from app.models import User, Video, Clip, WebhookEndpoint, WebhookDelivery
+from app.services.video_processor import VideoProcessor
+from app.tasks import video_tasks
+
+DEGRADATION = {'level': 'elevated', 'changes': {'render_preset': {'requested': 'medium', 'applied': 'faster'}}}
+
+
+@pytest.fixture
+def video(app, tmp_path, monkeypatch):
+    app.config.update(TEMP_FOLDER=str(tmp_path / 'temp'), DONE_FOLDER=str(tmp_path / 'done'), HLS_ENABLED=False)
+    monkeypatch.setattr(video_tasks.FairDispatcher, 'release', lambda video_id: None)
+    monkeypatch.setattr(Video, 'publish_status', lambda self: None)
+    
+    user = User(email='upgrade@example.com', username='upgrade', plan='pro')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(WebhookEndpoint(user_id=user.id, url='https://93.184.216.34/hooks', secret='s' * 64,
+                                   events=['video.completed', 'video.failed']))
+    
+    video = Video(user_id=user.id, filename='talk.mp4', original_filename='talk.mp4', file_size_mb=1,
+                  file_path=str(tmp_path / 'talk.mp4'), status='completed', degradation=DEGRADATION,
+                  upgrade_status='processing')
+    db.session.add(video)
+    db.session.commit()
+    
+    # Three degraded clips on disk
+    processor = VideoProcessor(video, {}, user)
+    for index in (1, 2, 3):
+        path, filename = processor.clip_output_path(index)
+        path.write_bytes(b'degraded')
+        db.session.add(Clip(video_id=video.id, filename=filename, file_path=str(path), start_time=0,
+                            end_time=10, duration=10, clip_metadata={'index': index, 'fingerprint': f'old{index}'}))
+    db.session.commit()
+    return video
+
+
+def _render(processor, index):
+    """Clip fields an upgrade pass's render hands to finalize"""
+    path, filename = processor.clip_output_path(index, f'new{index}')
+    path.write_bytes(b'full quality')
+    return dict(filename=filename, file_path=str(path), file_size_mb=0.1, start_time=20, end_time=30,
+                duration=10, relevance_score=90, narrative_type='CLIMAX', transcription_text='text',
+                social_media_caption='caption', analytics_report='report',
+                clip_metadata={'index': index, 'fingerprint': f'new{index}'})
+
+
+def test_swap_replaces_clips_in_place(video):
+    processor = VideoProcessor(video, {}, video.user)
+    ids = sorted(clip.id for clip in video.clips)
+    old_paths = [clip.file_path for clip in video.clips]
+    
+    # The new selection has two clips, both re-rendered
+    video_tasks._swap_upgraded_clips(video, processor, [_render(processor, 1), _render(processor, 2)], 2)
+    
+    clips = sorted(video.clips.all(), key=lambda clip: clip.id)
+    assert [clip.id for clip in clips] == ids[:2]
+    assert [clip.start_time for clip in clips] == [20, 20]
+    assert all(clip.file_path.endswith(f"_clip{clip.clip_metadata['index']}_new{clip.clip_metadata['index']}.mp4")
+               for clip in clips)
+    assert not any(processor.done_dir.joinpath(path).exists() for path in old_paths)
+    
+    assert video.status == 'completed'
+    assert video.degradation is None
+    assert video.upgrade_status is None
+    assert WebhookDelivery.query.count() == 0
+
+
+def test_failed_pass_keeps_degraded_clips(app, video):
+    processor = VideoProcessor(video, {}, video.user)
+    shadow = _render(processor, 1)
+    before = {clip.id: clip.file_path for clip in video.clips}
+    
+    video_tasks._abandon_upgrade(video.id, {'upgrade_pass': True})
+    
+    assert {clip.id: clip.file_path for clip in video.clips} == before
+    assert all(processor.done_dir.joinpath(path).exists() for path in before.values())
+    assert not processor.done_dir.joinpath(shadow['filename']).exists()
+    
+    assert video.status == 'completed'
+    assert video.degradation['upgrade_attempts'] == 1
+    assert video.upgrade_status is None
+    assert WebhookDelivery.query.count() == 0
+    
+    # Given up on after the last attempt
+    app.config['ADMISSION_UPGRADE_MAX_ATTEMPTS'] = 2
+    video.upgrade_status = 'processing'
+    db.session.commit()
+    video_tasks._abandon_upgrade(video.id, {'upgrade_pass': True})
+    assert video.upgrade_status == 'failed'
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook URL checks, signing, delivery and retries
+Deliveries go to a local HTTP stub (loopback is allowed for it explicitly).
+"""
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import db
+from app.models import User, WebhookEndpoint, WebhookDelivery
+from app.services.webhook_service import WebhookService, UnsafeWebhookURL
+
+
+class _Stub(BaseHTTPRequestHandler):
+    """Records POSTs and answers with the server's next status"""
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((dict(self.headers), body))
+        
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        if status in (301, 302, 307, 308):
+            self.send_header('Location', '/redirected')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Stub)
+    server.received = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/hooks"
+    yield server
+    
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def user(app):
+    user = User(email='hooks@example.com', username='hooks', plan='enterprise')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _delivery(user, url):
+    endpoint = WebhookEndpoint(user_id=user.id, url=url, secret='s' * 64, events=['video.completed'])
+    db.session.add(endpoint)
+    db.session.flush()
+    
+    delivery = WebhookDelivery(
+        endpoint_id=endpoint.id,
+        event='video.completed',
+        payload={'event': 'video.completed', 'data': {'video_id': 7, 'status': 'completed'}}
+    )
+    db.session.add(delivery)
+    db.session.commit()
+    return delivery
+
+
+@pytest.mark.parametrize('url', [
+    'ftp://example.com/hook',
+    'http:///hook',
+    'http://127.0.0.1/hook',
+    'http://localhost:8080/hook',
+    'http://10.1.2.3/hook',
+    'http://172.16.0.1/hook',
+    'http://192.168.1.10/hook',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::1]/hook',
+    'http://[::ffff:127.0.0.1]/hook',
+    'http://0.0.0.0/hook'
+])
+def test_check_url_rejects_non_public(app, url):
+    with pytest.raises(UnsafeWebhookURL):
+        WebhookService.check_url(url)
+
+
+def test_check_url_accepts_public_address(app):
+    WebhookService.check_url('https://93.184.216.34/hooks')
+
+
+def test_register_rejects_metadata_address(app, client, user):
+    # PyJWT 2.10+ only accepts string subjects
+    token = create_access_token(identity=str(user.id))
+    response = client.post(
+        '/api/webhooks/',
+        json={'url': 'http://169.254.169.254/latest/meta-data/'},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 400
+    assert WebhookEndpoint.query.count() == 0
+
+
+def test_sign_matches_hmac_of_timestamp_and_body():
+    signature = WebhookService.sign('key', 1700000000, '{"a":1}')
+    
+    assert signature == WebhookService.sign('key', 1700000000, '{"a":1}')
+    assert signature != WebhookService.sign('key', 1700000001, '{"a":1}')
+    assert signature != WebhookService.sign('other', 1700000000, '{"a":1}')
+
+
+def test_deliver_signs_and_marks_delivered(app, user, stub):
+    app.config['WEBHOOK_ALLOW_PRIVATE_NETWORKS'] = True
+    delivery = _delivery(user, stub.url)
+    
+    assert WebhookService.deliver(delivery)
+    db.session.commit()
+    
+    assert delivery.status == 'delivered'
+    assert delivery.response_status == 200
+    assert delivery.delivered_at is not None
+    
+    headers, body = stub.received[0]
+    assert headers['X-BinhoCut-Event'] == 'video.completed'
+    assert headers['X-BinhoCut-Delivery'] == str(delivery.id)
+    assert json.loads(body) == delivery.payload
+    
+    timestamp, signature = (part.split('=', 1)[1] for part in headers['X-BinhoCut-Signature'].split(','))
+    assert signature == WebhookService.sign('s' * 64, int(timestamp), body.decode('utf-8'))
+
+
+def test_deliver_retries_with_backoff_then_fails(app, user, stub):
+    app.config['WEBHOOK_ALLOW_PRIVATE_NETWORKS'] = True
+    app.config['WEBHOOK_MAX_ATTEMPTS'] = 2
+    stub.statuses = [500, 503]
+    delivery = _delivery(user, stub.url)
+    
+    assert not WebhookService.deliver(delivery)
+    assert delivery.status == 'pending'
+    assert delivery.attempts == 1
+    assert delivery.last_error == 'HTTP 500'
+    assert delivery.next_attempt_at > datetime.utcnow()
+    
+    assert not WebhookService.deliver(delivery)
+    assert delivery.status == 'failed'
+    assert delivery.attempts == 2
+    assert len(stub.received) == 2
+
+
+def test_deliver_does_not_follow_redirects(app, user, stub):
+    app.config['WEBHOOK_ALLOW_PRIVATE_NETWORKS'] = True
+    stub.statuses = [302]
+    delivery = _delivery(user, stub.url)
+    
+    assert not WebhookService.deliver(delivery)
+    assert delivery.response_status == 302
+    assert len(stub.received) == 1
+
+
+def test_deliver_refuses_private_address(app, user, stub):
+    delivery = _delivery(user, stub.url)
+    
+    assert not WebhookService.deliver(delivery)
+    assert delivery.status == 'failed'
+    assert 'non-public' in delivery.last_error
+    assert stub.received == []
+
+
+def test_deliver_pending_drains_due_deliveries(app, user, stub):
+    app.config['WEBHOOK_ALLOW_PRIVATE_NETWORKS'] = True
+    stub.statuses = [200, 500]
+    first, second = _delivery(user, stub.url), _delivery(user, stub.url)
+    
+    assert WebhookService.deliver_pending() == (1, 1)
+    assert {first.status, second.status} == {'delivered', 'pending'}
+    
+    # The failed one isn't due again until its backoff ends
+    assert WebhookService.deliver_pending() == (0, 0)